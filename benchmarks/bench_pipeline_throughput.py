@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""報告處理管線吞吐量基準測試 (不含上游模型延遲)。
+
+在全新的 Python 子行程與臨時工作目錄中載入 src/app.py，模型後端固定為延遲 0 的本地後端，
+一次提交 N 個報告任務並等待全部完成，量測排程、結構化解析、報告渲染與資料庫寫入本身的吞吐上限。
+輸出每秒完成任務數、任務延遲 (提交 -> 完成) 的中位數與 P95，以及期間事件迴圈的最大延遲。
+
+用法 (fastapi.testclient 需要額外安裝 httpx)：
+    python benchmarks/bench_pipeline_throughput.py [任務數，預設 50] [逐字稿段落數，預設 200]
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+CHILD_SCRIPT = r"""
+import json, os, statistics, sys, time
+from datetime import datetime
+sys.path.insert(0, sys.argv[1])
+task_count, transcript_paragraphs = int(sys.argv[2]), int(sys.argv[3])
+import app as app_module
+from fastapi.testclient import TestClient
+os.makedirs("temp_audio", exist_ok=True)
+# 每個任務使用各自的來源檔案，與實際使用情境相同 (不同的報告內容與檔名)
+source_paths = []
+for task_index in range(task_count):
+    source_paths.append(os.path.abspath(f"temp_audio/bench_{task_index:04d}.mp3"))
+    with open(source_paths[-1], "wb") as f:
+        f.write(b"\0" * 4096)
+request_bodies = [{
+    "source_type": "upload", "source_path": source_path, "model_id": "models/gemini-1.5-flash-latest",
+    "output_options": ["summary_transcript_tc", "md", "txt"], "model_backend": "local",
+    "backend_options": {"latency_seconds": 0, "transcript_paragraphs": transcript_paragraphs}
+} for source_path in source_paths]
+with TestClient(app_module.app) as client:
+    while client.get("/api/health/ready").status_code != 200:
+        time.sleep(0.005)
+    started_at = time.perf_counter()
+    task_ids = [client.post("/api/generate_report", json=request_body).json()["task_id"] for request_body in request_bodies]
+    pending = set(task_ids)
+    while pending:
+        time.sleep(0.05)
+        for task in client.get("/api/tasks").json():
+            if task["task_id"] in pending and task["status"] in ("completed", "failed"):
+                pending.discard(task["task_id"])
+    wall_seconds = time.perf_counter() - started_at
+    tasks = [task for task in client.get("/api/tasks").json() if task["task_id"] in task_ids]
+    loop_lag = client.get("/api/debug/loop_lag").json()
+report_files = {link for task in tasks for link in (task.get("download_links") or {}).values()}
+latencies = sorted((datetime.fromisoformat(task["completion_time"]) - datetime.fromisoformat(task["submit_time"])).total_seconds() for task in tasks)
+print(json.dumps({
+    "wall_seconds": wall_seconds,
+    "failed_tasks": sum(1 for task in tasks if task["status"] != "completed"),
+    "report_files": len(report_files),
+    "latency_median_seconds": statistics.median(latencies),
+    "latency_p95_seconds": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+    "max_loop_lag_seconds": loop_lag["max_lag_seconds"],
+    "loop_stalls": loop_lag["stall_count"]
+}))
+"""
+
+def main():
+    task_count = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    transcript_paragraphs = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    env = dict(os.environ)
+    env.pop("GOOGLE_API_KEY", None) # 本地後端不需要金鑰，基準測試也不應依賴網路
+    env.pop("GOOGLE_API_KEYS", None)
+    env["APP_AUDIO_PREPROCESS_ENABLED"] = "false" # 測試音訊不是有效的音訊檔，略過 ffmpeg
+    env["APP_DB_MAINTENANCE_INTERVAL_SECONDS"] = "0"
+    with tempfile.TemporaryDirectory() as work_dir:
+        result = subprocess.run(
+            [sys.executable, "-c", CHILD_SCRIPT, os.path.abspath(SRC_DIR), str(task_count), str(transcript_paragraphs)],
+            cwd=work_dir, env=env, capture_output=True, text=True, check=True
+        )
+    sample = json.loads(result.stdout.strip().splitlines()[-1])
+    summary = {
+        "tasks": task_count,
+        "transcript_paragraphs": transcript_paragraphs,
+        "wall_seconds": round(sample["wall_seconds"], 3),
+        "tasks_per_second": round(task_count / sample["wall_seconds"], 2),
+        "failed_tasks": sample["failed_tasks"],
+        "report_files": sample["report_files"], # 應為任務數 × 3；較少代表報告檔名相撞
+        "latency_median_seconds": round(sample["latency_median_seconds"], 3),
+        "latency_p95_seconds": round(sample["latency_p95_seconds"], 3),
+        "max_loop_lag_seconds": sample["max_loop_lag_seconds"],
+        "loop_stalls": sample["loop_stalls"]
+    }
+    print(json.dumps(summary, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""冷啟動時間基準測試。
+
+每一輪都在全新的 Python 子行程與臨時工作目錄中載入 src/app.py，
+量測「模組載入時間」、「startup 事件完成時間」與「就緒 (/api/health/ready 回傳 200) 時間」，
+最後以 JSON 輸出各項的中位數，方便在 CI 或筆記中長期追蹤。
+
+用法 (fastapi.testclient 需要額外安裝 httpx)：
+    python benchmarks/bench_startup.py [輪數，預設 5]
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+CHILD_SCRIPT = r"""
+import json, sys, time
+t0 = time.perf_counter()
+sys.path.insert(0, sys.argv[1])
+import app as app_module
+import_seconds = time.perf_counter() - t0
+from fastapi.testclient import TestClient
+with TestClient(app_module.app) as client:
+    startup_seconds = time.perf_counter() - t0
+    while client.get("/api/health/ready").status_code != 200:
+        time.sleep(0.005)
+    ready_seconds = time.perf_counter() - t0
+print(json.dumps({"import_seconds": import_seconds, "startup_seconds": startup_seconds, "ready_seconds": ready_seconds}))
+"""
+
+def run_once() -> dict:
+    env = dict(os.environ)
+    env.pop("GOOGLE_API_KEY", None) # 基準測試不應依賴網路
+    env.pop("GOOGLE_API_KEYS", None)
+    with tempfile.TemporaryDirectory() as work_dir:
+        result = subprocess.run(
+            [sys.executable, "-c", CHILD_SCRIPT, os.path.abspath(SRC_DIR)],
+            cwd=work_dir, env=env, capture_output=True, text=True, check=True
+        )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    samples = [run_once() for _ in range(rounds)]
+    summary = {"rounds": rounds}
+    for metric in ("import_seconds", "startup_seconds", "ready_seconds"):
+        values = [sample[metric] for sample in samples]
+        summary[f"{metric}_median"] = round(statistics.median(values), 4)
+        summary[f"{metric}_max"] = round(max(values), 4)
+    print(json.dumps(summary, indent=2))
+
+if __name__ == "__main__":
+    main()
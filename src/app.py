@@ -1,17 +1,20 @@
 
 # -*- coding: utf-8 -*-
-from fastapi import FastAPI, Request, HTTPException, File, UploadFile, Form, Depends, BackgroundTasks, status
+import time
+APP_IMPORT_STARTED_AT = time.perf_counter() # 用於量測冷啟動時間 (模組載入 -> 就緒)
+
+from fastapi import FastAPI, Request, HTTPException, File, UploadFile, Form, Depends, BackgroundTasks, Query, status
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse, Response, FileResponse, PlainTextResponse
 from fastapi.exceptions import RequestValidationError
 from pydantic import BaseModel, Field
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Annotated, Callable, Awaitable, Iterator
 import uvicorn
 import os
 import shutil
 import re
-from datetime import datetime, timezone
+from datetime import datetime, timezone, timedelta
 import traceback
 import asyncio
 import uuid
@@ -20,11 +23,47 @@ import json
 import logging # 引入 logging 模組
 import sys # 用於更嚴格的啟動錯誤處理
 import sqlite3
-
-from pytubefix import YouTube
-from pytubefix.exceptions import RegexMatchError, VideoUnavailable, PytubeFixError
-
-import google.generativeai as genai
+import hashlib
+import subprocess
+import importlib
+import html
+import weakref
+import threading
+import contextlib
+import gzip
+import mimetypes
+import posixpath
+import functools
+import io
+import zipfile
+import collections
+import cProfile
+import pstats
+import hmac
+import random
+import abc
+try:
+    import brotli # 選用：安裝後靜態資源會額外產生 Brotli 壓縮版本
+except ImportError:
+    brotli = None
+
+# --- 延遲載入的重量級依賴 ---
+# pytubefix 與 Google AI 用戶端套件載入時間長，改為第一次實際使用時才匯入，以縮短冷啟動時間
+class _LazyModule:
+    def __init__(self, module_name: str):
+        self._module_name = module_name
+        self._module = None
+
+    def __getattr__(self, attr_name: str):
+        if self._module is None:
+            self._module = importlib.import_module(self._module_name) # importlib 內部已有匯入鎖，多執行緒下安全
+        return getattr(self._module, attr_name)
+
+pytubefix = _LazyModule("pytubefix")
+pytubefix_exceptions = _LazyModule("pytubefix.exceptions")
+glm = _LazyModule("google.ai.generativelanguage") # 每把金鑰各自建立的 API 用戶端 (google-generativeai 的底層套件)
+genai_client = _LazyModule("google.generativeai.client") # 其 FileServiceClient 補上了 glm 用戶端沒有的 File API 媒體上傳，只在音訊超過 inline 上限時載入
+google_api_exceptions = _LazyModule("google.api_core.exceptions")
 
 # --- 配置日誌 (重要) ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -35,13 +74,73 @@ TEMP_AUDIO_STORAGE_DIR = os.getenv("APP_TEMP_AUDIO_STORAGE_DIR", "./temp_audio")
 GENERATED_REPORTS_DIR = os.getenv("APP_GENERATED_REPORTS_DIR", "./generated_reports")
 DATABASE_URL = "data/tasks.db" # SQLite 資料庫檔案路徑
 MAX_CONCURRENT_TASKS = 2 # 最大並行任務數
+SEARCH_MAX_PAGE_SIZE = 100 # 全文搜尋每頁最多回傳的筆數
+TASKS_DELTA_MAX_PAGE_SIZE = 500 # /api/tasks?since= 單次最多回傳的變更筆數
+TASK_WAIT_MAX_SECONDS = float(os.getenv("APP_TASK_WAIT_MAX_SECONDS", "60")) # /api/tasks/{task_id}?wait= 的上限秒數
+TERMINAL_TASK_STATUSES = ("completed", "failed", "cancelled") # 不會再變更的任務狀態
+BATCH_MAX_ITEMS = int(os.getenv("APP_BATCH_MAX_ITEMS", "500")) # 單一批次最多可包含的影片數
+BATCH_DOWNLOAD_CONCURRENCY = int(os.getenv("APP_BATCH_DOWNLOAD_CONCURRENCY", "4")) # 批次下載的最大並行數
+AUDIO_PREPROCESS_ENABLED = os.getenv("APP_AUDIO_PREPROCESS_ENABLED", "true").lower() in ("1", "true", "yes") # 是否啟用音訊前處理
+AUDIO_CACHE_DIR = os.getenv("APP_AUDIO_CACHE_DIR", "./audio_cache") # 前處理後音訊的快取目錄 (以內容雜湊命名)
+AUDIO_CACHE_MAX_BYTES = int(os.getenv("APP_AUDIO_CACHE_MAX_BYTES", str(2 * 1024 * 1024 * 1024))) # 快取總大小上限，超過時由資料庫維護工作移除最久未使用的檔案 (0 表示不限制)
+AUDIO_CACHE_MAX_AGE_DAYS = float(os.getenv("APP_AUDIO_CACHE_MAX_AGE_DAYS", "14")) # 超過此天數未使用的快取檔案會被移除 (0 表示不限制)
+AUDIO_PREPROCESS_WORKERS = int(os.getenv("APP_AUDIO_PREPROCESS_WORKERS", "2")) # 同時執行的 ffmpeg 子行程數
+AUDIO_PREPROCESS_SAMPLE_RATE = int(os.getenv("APP_AUDIO_PREPROCESS_SAMPLE_RATE", "16000")) # 語音用取樣率
+AUDIO_PREPROCESS_BITRATE = os.getenv("APP_AUDIO_PREPROCESS_BITRATE", "32k") # 單聲道 MP3 位元率
+AUDIO_SILENCE_THRESHOLD = os.getenv("APP_AUDIO_SILENCE_THRESHOLD", "-40dB") # 低於此音量視為靜音
+AUDIO_SILENCE_MIN_DURATION = float(os.getenv("APP_AUDIO_SILENCE_MIN_DURATION", "1.0")) # 超過此秒數的靜音才會被壓縮
+AUDIO_SILENCE_KEEP_DURATION = float(os.getenv("APP_AUDIO_SILENCE_KEEP_DURATION", "0.3")) # 壓縮後每段靜音保留的秒數
+AUDIO_PREPROCESS_TIMEOUT = int(os.getenv("APP_AUDIO_PREPROCESS_TIMEOUT", "1800")) # 單一檔案前處理的逾時秒數
+API_KEY_COOLDOWN_SECONDS = float(os.getenv("APP_API_KEY_COOLDOWN_SECONDS", "60")) # 金鑰遇到速率限制後暫停使用的基本秒數 (連續觸發時加倍)
+API_KEY_MAX_COOLDOWN_SECONDS = float(os.getenv("APP_API_KEY_MAX_COOLDOWN_SECONDS", "900")) # 暫停秒數上限
+API_KEY_VALIDATE_TIMEOUT_SECONDS = float(os.getenv("APP_API_KEY_VALIDATE_TIMEOUT_SECONDS", "15")) # 驗證單把金鑰的逾時秒數
+API_KEY_MAX_ATTEMPTS = int(os.getenv("APP_API_KEY_MAX_ATTEMPTS", "3")) # 單次呼叫遇到速率限制時最多嘗試幾把金鑰
+SJF_AGING_SECONDS_PER_SECOND = float(os.getenv("APP_SJF_AGING_FACTOR", "1.0")) # 最短工作優先排程的老化係數：每等待 1 秒，預估時間視為減少的秒數 (避免長任務飢餓)
+AUDIO_FALLBACK_BITRATE_KBPS = float(os.getenv("APP_AUDIO_FALLBACK_BITRATE_KBPS", "128")) # 無法以 ffprobe 取得長度時，以檔案大小估算長度所假設的位元率
+AUDIO_TOKENS_PER_SECOND = 32 # Gemini 音訊輸入每秒約 32 tokens
+TRANSCRIPT_TOKENS_PER_SECOND = 5 # 逐字稿輸出每秒音訊約產生的 tokens (中文語速估計)
+SUMMARY_OUTPUT_TOKENS = 1024 # 重點摘要的預估輸出 tokens
+AUTO_MODEL_ID = "auto" # 由系統依預估處理時間自動選擇模型
+REPORT_EXPORT_MAX_TASKS = int(os.getenv("APP_REPORT_EXPORT_MAX_TASKS", "5000")) # 單次 ZIP 匯出最多包含的任務數
+REPORT_EXPORT_CHUNK_BYTES = 64 * 1024 # ZIP 串流匯出時每次讀取報告檔案的位元組數
+ARCHIVE_DATABASE_URL = os.getenv("APP_ARCHIVE_DATABASE_URL", "data/tasks_archive.db") # 歸檔資料庫檔案路徑
+TASK_RETENTION_DAYS = float(os.getenv("APP_TASK_RETENTION_DAYS", "0")) # 已結束的任務超過此天數即移至歸檔資料庫 (預設 0：不歸檔)
+ARCHIVE_DROP_PREVIEW = os.getenv("APP_ARCHIVE_DROP_PREVIEW", "false").lower() in ("1", "true", "yes") # 歸檔時是否捨棄 result_preview_html (報告檔案仍保留在磁碟上)
+TASK_TOMBSTONE_RETENTION_DAYS = float(os.getenv("APP_TASK_TOMBSTONE_RETENTION_DAYS", "7")) # 刪除墓碑保留天數；游標早於已清除墓碑的增量查詢會收到 410
+DB_MAINTENANCE_INTERVAL_SECONDS = float(os.getenv("APP_DB_MAINTENANCE_INTERVAL_SECONDS", "3600")) # 歸檔與增量清理的執行間隔 (0 表示只能手動觸發)
+DB_VACUUM_PAGES_PER_RUN = int(os.getenv("APP_DB_VACUUM_PAGES_PER_RUN", "5000")) # 每次增量清理最多歸還的頁數 (0 表示全部)
+ARCHIVE_CHUNK_SIZE = 200 # 每個歸檔交易搬移的任務數，避免長時間鎖住資料庫
+LOOP_LAG_MONITOR_ENABLED = os.getenv("APP_LOOP_LAG_MONITOR_ENABLED", "true").lower() in ("1", "true", "yes") # 是否啟用事件迴圈延遲監測
+LOOP_LAG_THRESHOLD_SECONDS = float(os.getenv("APP_LOOP_LAG_THRESHOLD_SECONDS", "0.25")) # 事件迴圈停滯超過此秒數即記錄堆疊取樣
+LOOP_LAG_CHECK_INTERVAL_SECONDS = float(os.getenv("APP_LOOP_LAG_CHECK_INTERVAL_SECONDS", "0.05")) # 心跳與看門狗的檢查間隔
+LOOP_LAG_MAX_SAMPLES_PER_STALL = 5 # 單次停滯最多保留的相異堆疊取樣數
+LOOP_LAG_HISTORY_SIZE = 50 # 保留最近幾次停滯事件
+LOOP_LAG_STACK_DEPTH = 25 # 每個堆疊取樣保留的最內層框架數
+REQUEST_PROFILING_ENABLED = os.getenv("APP_REQUEST_PROFILING_ENABLED", "false").lower() in ("1", "true", "yes") # 是否接受 X-Profile 標頭 / ?profile= 參數 (預設關閉)
+REQUEST_PROFILING_TOKEN = os.getenv("APP_REQUEST_PROFILING_TOKEN") # 設定後，剖析請求須附上相同的 X-Profile-Token 標頭
+PROFILE_OUTPUT_DIR = os.getenv("APP_PROFILE_OUTPUT_DIR", "./profiles") # 剖析結果 (.prof / .txt) 的儲存目錄
+PROFILE_MAX_STORED = int(os.getenv("APP_PROFILE_MAX_STORED", "50")) # 最多保留幾份剖析結果，超過時刪除最舊的
+MODEL_BACKEND = os.getenv("APP_MODEL_BACKEND", "local") # 預設模型後端：gemini (實際呼叫) / local (確定性的本地模擬)；任務可用 model_backend 覆寫
+GEMINI_INLINE_AUDIO_MAX_BYTES = int(os.getenv("APP_GEMINI_INLINE_AUDIO_MAX_BYTES", str(20 * 1024 * 1024))) # 以 inline_data 傳送的音訊大小上限 (Gemini 單一請求上限約 20MB)
+GEMINI_REQUEST_TIMEOUT_SECONDS = float(os.getenv("APP_GEMINI_REQUEST_TIMEOUT_SECONDS", "600")) # 單次 generate_content 的逾時秒數
+GEMINI_FILE_PROCESSING_TIMEOUT_SECONDS = float(os.getenv("APP_GEMINI_FILE_PROCESSING_TIMEOUT_SECONDS", "300")) # 以 File API 上傳的音訊等待變為 ACTIVE 的上限
+GEMINI_FILE_POLL_INTERVAL_SECONDS = 2.0
+LOCAL_BACKEND_LATENCY_SECONDS = float(os.getenv("APP_LOCAL_BACKEND_LATENCY_SECONDS", "6")) # 本地後端每次分析的固定延遲
+LOCAL_BACKEND_LATENCY_PER_AUDIO_MINUTE = float(os.getenv("APP_LOCAL_BACKEND_LATENCY_PER_AUDIO_MINUTE", "0")) # 本地後端每分鐘音訊額外增加的延遲
+LOCAL_BACKEND_SUMMARY_ITEMS = int(os.getenv("APP_LOCAL_BACKEND_SUMMARY_ITEMS", "2")) # 本地後端摘要的重點數
+LOCAL_BACKEND_TRANSCRIPT_PARAGRAPHS = int(os.getenv("APP_LOCAL_BACKEND_TRANSCRIPT_PARAGRAPHS", "6")) # 本地後端逐字稿的段落數
+LOCAL_BACKEND_PARAGRAPH_CHARS = int(os.getenv("APP_LOCAL_BACKEND_PARAGRAPH_CHARS", "40")) # 本地後端每個段落 / 細節的約略字數
+RESUME_TASKS_ON_STARTUP = os.getenv("APP_RESUME_TASKS_ON_STARTUP", "true").lower() in ("1", "true", "yes") # 啟動時是否自動恢復中斷的任務
+YOUTUBE_URL_PATTERN = r"^https?:\/\/(www\.)?(youtube\.com|youtu\.be)\/.*$"
 
 # global_api_key: Optional[str] = None # Replaced by dependency injection
 # api_key_is_valid: bool = False # Replaced by dependency injection logic
-temporary_api_key_storage: Optional[str] = None # Stores API key set via /api/set_api_key
+# temporary_api_key_storage: Optional[str] = None # Replaced by api_key_pool (keys set via /api/set_api_key join the pool)
 
 # tasks_db: Dict[str, Dict[str, Any]] = {} # Replaced by SQLite
 executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_TASKS)
+batch_download_executor = ThreadPoolExecutor(max_workers=BATCH_DOWNLOAD_CONCURRENCY) # 批次匯入專用的下載執行緒池
+audio_preprocess_executor = ThreadPoolExecutor(max_workers=AUDIO_PREPROCESS_WORKERS) # 每個工作執行緒只負責等待一個 ffmpeg 子行程
 
 app = FastAPI(title="AI_paper API v2.4 (穩定性優化版 - SQLite & DI)")
 
@@ -58,6 +157,220 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
         content={"detail": error_details},
     )
 
+# --- 事件迴圈延遲監測 ---
+# 心跳協程每隔 LOOP_LAG_CHECK_INTERVAL_SECONDS 醒來一次並量測實際延遲；另一個看門狗執行緒在心跳
+# 逾期超過門檻時，以 sys._current_frames() 取得事件迴圈執行緒當下的堆疊，指出是哪段同步程式碼卡住了迴圈。
+class EventLoopLagMonitor:
+    def __init__(self, threshold_seconds: float, interval_seconds: float):
+        self.threshold_seconds = threshold_seconds
+        self.interval_seconds = interval_seconds
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._watchdog_thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+        self._last_heartbeat = time.monotonic()
+        self._last_lag = 0.0
+        self._lag_sample_count = 0
+        self._lag_total = 0.0
+        self._max_lag = 0.0
+        self._stall_count = 0
+        self._current_stall: Optional[Dict[str, Any]] = None
+        self._recent_stalls = collections.deque(maxlen=LOOP_LAG_HISTORY_SIZE)
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+        self._loop_thread_id = threading.get_ident() # 必須在事件迴圈執行緒中呼叫
+        self._last_heartbeat = time.monotonic()
+        self._stop_event.clear()
+        self._heartbeat_task = loop.create_task(self._heartbeat())
+        self._watchdog_thread = threading.Thread(target=self._watch, name="loop-lag-watchdog", daemon=True)
+        self._watchdog_thread.start()
+        logger.info(f"[LOOP_LAG] 事件迴圈延遲監測已啟動 (門檻 {self.threshold_seconds} 秒，間隔 {self.interval_seconds} 秒)。")
+
+    def stop(self):
+        self._stop_event.set()
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            self._heartbeat_task = None
+
+    async def _heartbeat(self):
+        while True:
+            started_at = time.monotonic()
+            await asyncio.sleep(self.interval_seconds)
+            now = time.monotonic()
+            lag = max(0.0, now - started_at - self.interval_seconds)
+            with self._lock:
+                self._last_lag = lag # 先更新延遲再更新心跳時間，看門狗看到新心跳時即可取得本次停滯的實際長度
+                self._last_heartbeat = now
+                self._lag_sample_count += 1
+                self._lag_total += lag
+                self._max_lag = max(self._max_lag, lag)
+
+    def _watch(self):
+        while not self._stop_event.wait(self.interval_seconds):
+            with self._lock:
+                stalled_for = time.monotonic() - self._last_heartbeat - self.interval_seconds
+                if stalled_for < self.threshold_seconds:
+                    if self._current_stall is not None:
+                        self._finish_stall_locked()
+                    continue
+                frame = sys._current_frames().get(self._loop_thread_id)
+                stack = "".join(traceback.format_stack(frame, limit=LOOP_LAG_STACK_DEPTH)) if frame is not None else ""
+                location = f"{frame.f_code.co_filename}:{frame.f_lineno} in {frame.f_code.co_name}" if frame is not None else None # 最內層框架即卡住迴圈的位置
+                del frame
+                is_new_stall = self._current_stall is None
+                if is_new_stall:
+                    self._stall_count += 1
+                    self._current_stall = {"started_at": datetime.now(timezone.utc).isoformat(), "location": location,
+                                           "duration_seconds": None, "samples": []}
+                samples = self._current_stall["samples"]
+                if len(samples) < LOOP_LAG_MAX_SAMPLES_PER_STALL and (not samples or samples[-1]["stack"] != stack):
+                    samples.append({"stalled_for_seconds": round(stalled_for, 3), "stack": stack})
+            if is_new_stall:
+                logger.warning(f"[LOOP_LAG] 事件迴圈已停滯 {stalled_for:.3f} 秒 (位置: {location})，目前的堆疊：\n{stack}")
+
+    def _finish_stall_locked(self):
+        stall = self._current_stall
+        stall["duration_seconds"] = round(self._last_lag, 3)
+        self._recent_stalls.append(stall)
+        self._current_stall = None
+        logger.warning(f"[LOOP_LAG] 事件迴圈停滯結束，共 {stall['duration_seconds']} 秒 (起始位置: {stall['location']}，{len(stall['samples'])} 個堆疊取樣)。")
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self._heartbeat_task is not None,
+                "threshold_seconds": self.threshold_seconds,
+                "interval_seconds": self.interval_seconds,
+                "lag_samples": self._lag_sample_count,
+                "mean_lag_seconds": round(self._lag_total / self._lag_sample_count, 4) if self._lag_sample_count else 0.0,
+                "max_lag_seconds": round(self._max_lag, 4),
+                "stall_count": self._stall_count,
+                "current_stall": dict(self._current_stall) if self._current_stall else None,
+                "recent_stalls": list(self._recent_stalls)[::-1] # 最新的在前
+            }
+
+loop_lag_monitor = EventLoopLagMonitor(LOOP_LAG_THRESHOLD_SECONDS, LOOP_LAG_CHECK_INTERVAL_SECONDS)
+
+# --- 單一請求剖析 (選用) ---
+# 設定 APP_REQUEST_PROFILING_ENABLED 後，請求帶有 X-Profile 標頭或 ?profile= 參數時，以 cProfile 剖析事件迴圈執行緒
+# 從收到請求到回應標頭就緒之間的所有工作；在迴圈上同步執行的熱點會以高 tottime 出現。同一時間只剖析一個請求。
+# 一般的 JSON / HTML 回應在標頭送出前已產生完整本文；串流回應 (ZIP 匯出等) 的本文不在剖析範圍內，且不會被暫存。
+#   store (或 1/true)：結果存到 PROFILE_OUTPUT_DIR，回應附上 X-Profile-Id
+#   inline：以剖析報告取代原本的回應本文
+recent_profiles = collections.deque(maxlen=PROFILE_MAX_STORED)
+request_profiling_state = {"active": False}
+
+def _requested_profile_mode(request: Request) -> Optional[str]:
+    requested_mode = (request.headers.get("x-profile") or request.query_params.get("profile") or "").strip().lower()
+    if requested_mode in ("1", "true", "yes", "store"):
+        return "store"
+    if requested_mode == "inline":
+        return "inline"
+    return None
+
+def _store_profile_sync(profile_id: str, profiler: cProfile.Profile, report_text: str):
+    os.makedirs(PROFILE_OUTPUT_DIR, exist_ok=True)
+    profiler.dump_stats(os.path.join(PROFILE_OUTPUT_DIR, f"{profile_id}.prof"))
+    with open(os.path.join(PROFILE_OUTPUT_DIR, f"{profile_id}.txt"), "w", encoding="utf-8") as f:
+        f.write(report_text)
+    # 只保留最近 PROFILE_MAX_STORED 份 (依修改時間)
+    stored_ids = sorted({os.path.splitext(name)[0] for name in os.listdir(PROFILE_OUTPUT_DIR) if name.endswith(".prof")},
+                        key=lambda stored_id: os.path.getmtime(os.path.join(PROFILE_OUTPUT_DIR, f"{stored_id}.prof")))
+    for stale_id in stored_ids[:-PROFILE_MAX_STORED]:
+        for extension in (".prof", ".txt"):
+            with contextlib.suppress(OSError):
+                os.remove(os.path.join(PROFILE_OUTPUT_DIR, f"{stale_id}{extension}"))
+
+def _profiling_token_matches(request: Request) -> bool:
+    return not REQUEST_PROFILING_TOKEN or hmac.compare_digest(request.headers.get("x-profile-token", ""), REQUEST_PROFILING_TOKEN)
+
+async def request_profiling_middleware(request: Request, call_next):
+    profile_mode = _requested_profile_mode(request)
+    if profile_mode is None:
+        return await call_next(request)
+    if not _profiling_token_matches(request):
+        response = await call_next(request)
+        response.headers["X-Profile-Status"] = "forbidden"
+        return response
+    if request_profiling_state["active"]:
+        response = await call_next(request)
+        response.headers["X-Profile-Status"] = "busy" # 另一個請求正在剖析中，本次不剖析
+        return response
+
+    request_profiling_state["active"] = True
+    profile_id = f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex[:8]}"
+    profiler = cProfile.Profile()
+    started_at = time.perf_counter()
+    try:
+        profiler.enable()
+        try:
+            response = await call_next(request) # 回應標頭就緒時返回；本文之後直接串流給用戶端
+        finally:
+            profiler.disable()
+    finally:
+        request_profiling_state["active"] = False
+    wall_seconds = time.perf_counter() - started_at
+
+    report_stream = io.StringIO()
+    pstats.Stats(profiler, stream=report_stream).sort_stats("cumulative").print_stats(40)
+    report_text = f"{request.method} {request.url.path} -> {response.status_code}，耗時 {wall_seconds:.4f} 秒\n\n{report_stream.getvalue()}"
+    profile_info = {"profile_id": profile_id, "method": request.method, "path": request.url.path, "status_code": response.status_code,
+                    "wall_seconds": round(wall_seconds, 4), "created_at": datetime.now(timezone.utc).isoformat()}
+    logger.info(f"[PROFILE] 已剖析請求 {request.method} {request.url.path} ({profile_id})，耗時 {wall_seconds:.4f} 秒。")
+
+    if profile_mode == "inline":
+        return JSONResponse(content={**profile_info, "report": report_text}, headers={"X-Profile-Id": profile_id, "X-Profile-Status": "inline"})
+    try:
+        await asyncio.to_thread(_store_profile_sync, profile_id, profiler, report_text)
+        recent_profiles.append(profile_info)
+        profile_status = "stored"
+    except OSError as e_store:
+        logger.warning(f"[PROFILE] 儲存剖析結果 {profile_id} 時發生錯誤: {e_store}")
+        profile_status = "store_failed"
+    response.headers["X-Profile-Id"] = profile_id
+    response.headers["X-Profile-Status"] = profile_status
+    return response
+
+@app.get("/api/debug/loop_lag")
+async def get_loop_lag_stats():
+    return loop_lag_monitor.snapshot()
+
+if REQUEST_PROFILING_ENABLED:
+    # 只在啟用時註冊：BaseHTTPMiddleware 會讓每個請求都多一層包裝的開銷
+    app.middleware("http")(request_profiling_middleware)
+
+def _require_profile_access(request: Request):
+    # 剖析結果包含程式內部的呼叫細節，與剖析請求使用相同的權杖保護；未啟用剖析時視為不存在
+    if not REQUEST_PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="請求剖析功能未啟用。")
+    if not _profiling_token_matches(request):
+        raise HTTPException(status_code=403, detail="需要有效的 X-Profile-Token 標頭。")
+
+@app.get("/api/debug/profiles")
+async def list_request_profiles(request: Request):
+    _require_profile_access(request)
+    return {"profiles": list(recent_profiles)[::-1], "output_dir": PROFILE_OUTPUT_DIR, "enabled": REQUEST_PROFILING_ENABLED}
+
+@app.get("/api/debug/profiles/{profile_id}")
+async def get_request_profile(profile_id: str, request: Request, file_format: str = Query("txt", alias="format")):
+    # format=prof 下載原始 pstats 檔，可用 snakeviz 等工具開啟
+    _require_profile_access(request)
+    if not re.fullmatch(r"\d{14}_[0-9a-f]{8}", profile_id) or file_format not in ("txt", "prof"):
+        raise HTTPException(status_code=404, detail="找不到指定的剖析結果。")
+    profile_path = os.path.join(PROFILE_OUTPUT_DIR, f"{profile_id}.{file_format}")
+    if not os.path.isfile(profile_path):
+        raise HTTPException(status_code=404, detail="找不到指定的剖析結果。")
+    if file_format == "prof":
+        return FileResponse(profile_path, media_type="application/octet-stream", filename=f"{profile_id}.prof")
+    def _read_report_sync() -> str:
+        with open(profile_path, encoding="utf-8") as f:
+            return f.read()
+    return PlainTextResponse(await asyncio.to_thread(_read_report_sync))
+
+
 # --- Jinja2 模板設定 ---
 templates_main_dir = "templates"
 report_content_template_str = """
@@ -68,8 +381,8 @@ report_content_template_str = """
   {% if summary_data.intro_paragraph %}
     <p class='intro-paragraph'>{{ summary_data.intro_paragraph }}</p>
   {% endif %}
-  {% if summary_data.items %}
-    {% for item in summary_data.items %}
+  {% if summary_data['items'] %}
+    {% for item in summary_data['items'] %}
       <h3><strong>{{ loop.index }}. {{ item.subtitle }}</strong></h3>
       {% if item.details %}
         <ul>
@@ -110,7 +423,7 @@ report_content_jinja_template = Template(report_content_template_str)
 
 # --- Pydantic 模型定義 (添加了更詳細的 Field 驗證) ---
 class ProcessUrlRequest(BaseModel):
-    url: str = Field(..., pattern=r"^https?:\/\/(www\.)?(youtube\.com|youtu\.be)\/.*$", description="有效的 YouTube 網址")
+    url: str = Field(..., pattern=YOUTUBE_URL_PATTERN, description="有效的 YouTube 網址")
 
 class GenerateReportRequest(BaseModel):
     source_type: str = Field(..., pattern="^(youtube|upload)$", description="來源類型，只能是 'youtube' 或 'upload'")
@@ -119,35 +432,39 @@ class GenerateReportRequest(BaseModel):
     output_options: List[str] = Field(..., min_items=1, description="報告輸出格式選項，例如 'summary_tc', 'md', 'txt'")
     # custom_prompts 仍為 Optional，前端會根據邏輯判斷是否傳遞
     custom_prompts: Optional[Dict[str, str]] = Field(None, description="自訂提示詞，鍵為 'summary_prompt' 或 'transcript_prompt'")
+    model_backend: Optional[str] = Field(None, description="模型後端 ('gemini' 或 'local')；未提供時使用 APP_MODEL_BACKEND")
+    backend_options: Optional[Dict[str, float]] = Field(None, description="後端專屬參數，例如本地後端的 latency_seconds、transcript_paragraphs")
+
+class BatchGenerateReportRequest(BaseModel):
+    # urls 與 playlist_url 至少需提供其一，兩者皆提供時會合併 (播放清單的影片排在後面)
+    urls: Optional[List[Annotated[str, Field(pattern=YOUTUBE_URL_PATTERN)]]] = Field(None, max_length=BATCH_MAX_ITEMS, description="YouTube 影片網址列表")
+    playlist_url: Optional[str] = Field(None, pattern=YOUTUBE_URL_PATTERN, description="YouTube 播放清單網址")
+    model_id: str = Field(..., min_length=1, description="用於生成報告的 AI 模型 ID")
+    output_options: List[str] = Field(..., min_items=1, description="報告輸出格式選項，例如 'summary_tc', 'md', 'txt'")
+    custom_prompts: Optional[Dict[str, str]] = Field(None, description="自訂提示詞，鍵為 'summary_prompt' 或 'transcript_prompt'")
+    model_backend: Optional[str] = Field(None, description="模型後端 ('gemini' 或 'local')；未提供時使用 APP_MODEL_BACKEND")
+    backend_options: Optional[Dict[str, float]] = Field(None, description="後端專屬參數，例如本地後端的 latency_seconds、transcript_paragraphs")
 
 class SetApiKeyRequest(BaseModel):
     api_key: str = Field(..., min_length=10, description="Google API 金鑰")
 
 # --- FastAPI 事件處理 ---
-@app.on_event("startup")
-async def startup_event():
-    os.makedirs(TEMP_AUDIO_STORAGE_DIR, exist_ok=True)
-    os.makedirs(GENERATED_REPORTS_DIR, exist_ok=True)
-    logger.info(f"臨時音訊儲存目錄 '{TEMP_AUDIO_STORAGE_DIR}' 已確認存在。")
-    logger.info(f"生成報告儲存目錄 '{GENERATED_REPORTS_DIR}' 已確認存在。")
-    logger.info(f"資料庫檔案將儲存在 '{DATABASE_URL}'。")
+# 啟動狀態：存活 (liveness) 只代表行程在執行；就緒 (readiness) 代表資料庫可用且背景啟動工作皆已完成
+startup_state: Dict[str, Any] = {
+    "db_ready": False,
+    "api_key_check": "pending", # pending / not_configured / valid / invalid
+    "temp_cleanup_done": False,
+    "ready": False,
+    "timings": {}
+}
+_startup_background_jobs: set = set() # 保留背景工作的參照，避免被垃圾回收
 
-    init_db() # 初始化資料庫和表
-
-    # 環境變數中的 API 金鑰優先於應用程式啟動時的配置
-    env_api_key = os.getenv("GOOGLE_API_KEY")
-    if env_api_key:
-        logger.info("[STARTUP] 在環境變數中找到 GOOGLE_API_KEY。嘗試使用其配置 genai...")
-        try:
-            genai.configure(api_key=env_api_key)
-            next(genai.list_models(), None) # 驗證金鑰
-            logger.info("[STARTUP] [SUCCESS] 使用環境變數中的 GOOGLE_API_KEY 成功配置並驗證 genai。")
-        except Exception as e_configure:
-            logger.error(f"[STARTUP] [ERROR] 使用環境變數中的 GOOGLE_API_KEY 配置 genai 時發生錯誤: {e_configure}")
-            # 即使這裡失敗，如果稍後透過 /api/set_api_key 設定了有效的金鑰，應用仍可能工作
-    else:
-        logger.info("[STARTUP] 未在環境變數中找到 GOOGLE_API_KEY。genai 將等待 API 金鑰透過端點設定。")
+def _validate_env_api_keys_sync() -> int:
+    for key_state in api_key_pool.keys():
+        api_key_pool.validate_key_sync(key_state)
+    return api_key_pool.available_count()
 
+def _cleanup_temp_audio_sync():
     # 清理舊的臨時音訊檔案 (簡單示例：清理一天前的檔案)
     # 實際應用中，可能需要更複雜的清理策略或透過外部排程任務來執行
     # 注意：這裡只清理 TEMP_AUDIO_STORAGE_DIR，不清理 GENERATED_REPORTS_DIR
@@ -160,6 +477,87 @@ async def startup_event():
         except Exception as e:
             logger.warning(f"清理臨時檔案 {filename} 時發生錯誤: {e}")
 
+async def run_startup_background_jobs():
+    # 金鑰驗證需要網路、清理需要走訪目錄，兩者都放在執行緒中於伺服器開始接受連線後進行
+    # 靜態資源的指紋與壓縮版本最先建置，首頁與報告頁都需要
+    try:
+        await asyncio.to_thread(static_assets.ensure_built)
+    except Exception as e_static:
+        logger.error(f"[STARTUP] [ERROR] 建置靜態資源時發生錯誤: {e_static}")
+    startup_state["timings"]["static_assets_built_seconds"] = round(time.perf_counter() - APP_IMPORT_STARTED_AT, 4)
+
+    # 先在執行緒中預先載入延遲匯入的重量級依賴，避免第一個任務在事件迴圈上同步匯入而卡住其他請求
+    for heavy_module_name in ("google.ai.generativelanguage", "google.api_core.exceptions", "pytubefix"):
+        try:
+            await asyncio.to_thread(importlib.import_module, heavy_module_name)
+        except Exception as e_import:
+            logger.warning(f"[STARTUP] 預先載入 {heavy_module_name} 時發生錯誤: {e_import}")
+    startup_state["timings"]["heavy_imports_warmed_seconds"] = round(time.perf_counter() - APP_IMPORT_STARTED_AT, 4)
+
+    if api_key_pool.has_keys():
+        logger.info(f"[STARTUP] 在環境變數中找到 {len(api_key_pool.keys())} 把 API 金鑰。於背景逐一驗證...")
+        try:
+            available_keys = await asyncio.to_thread(_validate_env_api_keys_sync)
+            startup_state["api_key_check"] = "valid" if available_keys else "invalid"
+            logger.info(f"[STARTUP] 金鑰驗證完成，可用金鑰 {available_keys} / {len(api_key_pool.keys())} 把。")
+        except Exception as e_configure:
+            startup_state["api_key_check"] = "invalid"
+            logger.error(f"[STARTUP] [ERROR] 驗證環境變數中的 API 金鑰時發生錯誤: {e_configure}")
+            # 即使這裡失敗，如果稍後透過 /api/set_api_key 設定了有效的金鑰，應用仍可能工作
+    else:
+        startup_state["api_key_check"] = "not_configured"
+        logger.info("[STARTUP] 未在環境變數中找到 GOOGLE_API_KEY / GOOGLE_API_KEYS。將等待 API 金鑰透過端點設定。")
+
+    try:
+        await asyncio.to_thread(_cleanup_temp_audio_sync)
+    except Exception as e_cleanup:
+        logger.warning(f"[STARTUP] 清理臨時音訊目錄時發生錯誤: {e_cleanup}")
+    startup_state["temp_cleanup_done"] = True
+
+    # 上次關閉時仍在進行中的任務：有可用金鑰時從檢查點恢復，否則標記為失敗等待使用者重試
+    try:
+        await resume_interrupted_tasks(api_key_pool if api_key_pool.available_count() else None)
+    except Exception as e_resume:
+        logger.warning(f"[STARTUP] 恢復中斷的任務時發生錯誤: {e_resume}")
+
+    try:
+        await asyncio.to_thread(_backfill_search_index_sync)
+    except Exception as e_backfill:
+        logger.warning(f"[STARTUP] 補建全文搜尋索引時發生錯誤: {e_backfill}")
+
+    if startup_state["db_ready"] and DB_MAINTENANCE_INTERVAL_SECONDS > 0:
+        maintenance_job = asyncio.create_task(run_db_maintenance_loop())
+        _startup_background_jobs.add(maintenance_job)
+        maintenance_job.add_done_callback(_startup_background_jobs.discard)
+
+    startup_state["ready"] = startup_state["db_ready"]
+    startup_state["timings"]["import_to_ready_seconds"] = round(time.perf_counter() - APP_IMPORT_STARTED_AT, 4)
+    logger.info(f"[STARTUP] 背景啟動工作完成，距模組載入共 {startup_state['timings']['import_to_ready_seconds']} 秒。")
+
+@app.on_event("startup")
+async def startup_event():
+    os.makedirs(TEMP_AUDIO_STORAGE_DIR, exist_ok=True)
+    os.makedirs(GENERATED_REPORTS_DIR, exist_ok=True)
+    os.makedirs(AUDIO_CACHE_DIR, exist_ok=True)
+    logger.info(f"臨時音訊儲存目錄 '{TEMP_AUDIO_STORAGE_DIR}' 已確認存在。")
+    logger.info(f"生成報告儲存目錄 '{GENERATED_REPORTS_DIR}' 已確認存在。")
+    logger.info(f"前處理音訊快取目錄 '{AUDIO_CACHE_DIR}' 已確認存在。")
+    logger.info(f"資料庫檔案將儲存在 '{DATABASE_URL}'。")
+
+    global main_event_loop, task_scheduler, batch_download_slots
+    main_event_loop = asyncio.get_running_loop()
+    task_scheduler = ShortestJobFirstScheduler(MAX_CONCURRENT_TASKS, SJF_AGING_SECONDS_PER_SECOND) # 在事件迴圈內建立，相容 Python 3.9 以前的 loop 綁定行為
+    batch_download_slots = asyncio.Semaphore(BATCH_DOWNLOAD_CONCURRENCY)
+    if LOOP_LAG_MONITOR_ENABLED:
+        loop_lag_monitor.start(main_event_loop)
+    startup_state["db_ready"] = init_db() # 初始化資料庫和表
+    startup_state["timings"]["import_to_startup_seconds"] = round(time.perf_counter() - APP_IMPORT_STARTED_AT, 4)
+
+    # 金鑰驗證與臨時檔清理改為背景工作，不延遲伺服器開始接受連線
+    startup_job = asyncio.create_task(run_startup_background_jobs())
+    _startup_background_jobs.add(startup_job)
+    startup_job.add_done_callback(_startup_background_jobs.discard)
+
 # --- 資料庫輔助函式 ---
 def get_db_connection():
     os.makedirs(os.path.dirname(DATABASE_URL), exist_ok=True) # 確保 data 目錄存在
@@ -167,10 +565,60 @@ def get_db_connection():
     conn.row_factory = sqlite3.Row # 讓查詢結果可以像字典一樣訪問列
     return conn
 
+def _ensure_column(cursor: sqlite3.Cursor, table_name: str, column_name: str, column_decl: str):
+    existing_columns = {row["name"] for row in cursor.execute(f"PRAGMA table_info({table_name})").fetchall()}
+    if column_name not in existing_columns:
+        cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_decl}")
+        logger.info(f"已為既有的 {table_name} 表新增 {column_name} 欄位。")
+
+def _create_change_tracking(cursor: sqlite3.Cursor):
+    # 以觸發器維護 change_seq / updated_at，任何程式路徑的 INSERT/UPDATE/DELETE 都不會漏掉
+    # task_change_counter 只有一列，其 seq 即整張任務表的版本號 (用於游標與 ETag)
+    cursor.execute("CREATE TABLE IF NOT EXISTS task_change_counter (id INTEGER PRIMARY KEY CHECK (id = 1), seq INTEGER NOT NULL)")
+    cursor.execute("INSERT OR IGNORE INTO task_change_counter (id, seq) VALUES (1, COALESCE((SELECT MAX(change_seq) FROM tasks), 0))")
+    _ensure_column(cursor, "task_change_counter", "pruned_seq", "INTEGER NOT NULL DEFAULT 0") # 已清除的墓碑中最大的 change_seq
+    # 被刪除的任務留下墓碑紀錄，讓增量查詢的客戶端也能得知刪除
+    cursor.execute("CREATE TABLE IF NOT EXISTS task_deletions (task_id TEXT PRIMARY KEY, change_seq INTEGER NOT NULL, deleted_at TEXT NOT NULL)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_task_deletions_change_seq ON task_deletions (change_seq)")
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_tasks_change_after_insert AFTER INSERT ON tasks
+    BEGIN
+        UPDATE task_change_counter SET seq = seq + 1 WHERE id = 1;
+        UPDATE tasks SET change_seq = (SELECT seq FROM task_change_counter WHERE id = 1),
+                         updated_at = strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now')
+        WHERE rowid = NEW.rowid;
+    END
+    """)
+    # WHEN 條件排除觸發器自身 (及上方 INSERT 觸發器) 對 change_seq 的寫入，避免重複遞增
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_tasks_change_after_update AFTER UPDATE ON tasks
+    WHEN NEW.change_seq IS OLD.change_seq
+    BEGIN
+        UPDATE task_change_counter SET seq = seq + 1 WHERE id = 1;
+        UPDATE tasks SET change_seq = (SELECT seq FROM task_change_counter WHERE id = 1),
+                         updated_at = strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now')
+        WHERE rowid = NEW.rowid;
+    END
+    """)
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_tasks_change_after_delete AFTER DELETE ON tasks
+    BEGIN
+        UPDATE task_change_counter SET seq = seq + 1 WHERE id = 1;
+        INSERT OR REPLACE INTO task_deletions (task_id, change_seq, deleted_at)
+        VALUES (OLD.task_id, (SELECT seq FROM task_change_counter WHERE id = 1), strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now'));
+    END
+    """)
+    # 升級前既有的任務沒有序號，依插入順序補上
+    cursor.execute("UPDATE tasks SET change_seq = rowid, updated_at = COALESCE(completion_time, start_time, submit_time) WHERE change_seq IS NULL")
+    cursor.execute("UPDATE task_change_counter SET seq = MAX(seq, COALESCE((SELECT MAX(change_seq) FROM tasks), 0)) WHERE id = 1")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_change_seq ON tasks (change_seq)")
+
 def init_db():
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
+        # 只對尚未建立任何資料表的新資料庫生效；既有資料庫由第一次維護工作轉換
+        cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
         cursor.execute('''
         CREATE TABLE IF NOT EXISTS tasks (
             task_id TEXT PRIMARY KEY,
@@ -183,11 +631,52 @@ def init_db():
             result_preview_html TEXT,
             download_links TEXT, -- Store as JSON string
             error_message TEXT,
+            request_data TEXT,    -- Store as JSON string
+            batch_id TEXT,        -- 所屬批次 ID (單一提交的任務為 NULL)
+            updated_at TEXT,      -- 最後變更時間 (由觸發器維護)
+            change_seq INTEGER,   -- 單調遞增的變更序號 (由觸發器維護)
+            audio_duration_seconds REAL, -- 音訊長度 (秒)
+            estimated_seconds REAL -- 預估處理秒數 (用於最短工作優先排程)
+        )
+        ''')
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS batches (
+            batch_id TEXT PRIMARY KEY,
+            submit_time TEXT NOT NULL,
+            total_tasks INTEGER NOT NULL,
             request_data TEXT     -- Store as JSON string
         )
         ''')
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS audio_metadata (
+            source_path TEXT PRIMARY KEY,
+            file_size INTEGER NOT NULL, -- 檔案大小改變時視為新的檔案，需重新量測
+            duration_seconds REAL NOT NULL,
+            duration_method TEXT NOT NULL, -- ffprobe / youtube / bitrate_estimate
+            created_at TEXT NOT NULL
+        )
+        ''')
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS task_checkpoints (
+            task_id TEXT NOT NULL,
+            stage TEXT NOT NULL,  -- 已完成的階段名稱
+            data TEXT NOT NULL,   -- 該階段的產出 (JSON string)
+            created_at TEXT NOT NULL,
+            PRIMARY KEY (task_id, stage)
+        )
+        ''')
+        # 舊版資料庫的 tasks 表缺少後來新增的欄位，在此補上
+        _ensure_column(cursor, "tasks", "batch_id", "TEXT")
+        _ensure_column(cursor, "tasks", "updated_at", "TEXT")
+        _ensure_column(cursor, "tasks", "change_seq", "INTEGER")
+        _ensure_column(cursor, "tasks", "audio_duration_seconds", "REAL")
+        _ensure_column(cursor, "tasks", "estimated_seconds", "REAL")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_batch_id ON tasks (batch_id)")
+        _create_change_tracking(cursor)
+        _create_search_index_table(cursor)
         conn.commit()
         logger.info("SQLite database and tasks table initialized successfully.")
+        return True
     except sqlite3.Error as e:
         logger.error(f"Error initializing SQLite database: {e}")
         # 根據需要，這裡可以決定是否要讓應用程式在資料庫初始化失敗時終止
@@ -198,48 +687,430 @@ def init_db():
     finally:
         if 'conn' in locals() and conn:
             conn.close()
+    return False
+
+# --- 全文搜尋索引 (SQLite FTS5) ---
+search_index_state: Dict[str, Any] = {"available": False, "tokenizer": None}
+
+def _create_search_index_table(cursor: sqlite3.Cursor):
+    # trigram 分詞器可對中文做子字串比對 (SQLite 3.34+)；不支援時退回 unicode61
+    for tokenizer in ("trigram", "unicode61"):
+        try:
+            cursor.execute(f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS report_search USING fts5(
+                task_id UNINDEXED,
+                title,
+                summary,
+                transcript,
+                tokenize = '{tokenizer}'
+            )
+            """)
+            table_sql = cursor.execute("SELECT sql FROM sqlite_master WHERE name = 'report_search'").fetchone()[0]
+            search_index_state["available"] = True
+            search_index_state["tokenizer"] = "trigram" if "trigram" in table_sql else "unicode61"
+            logger.info(f"全文搜尋索引已就緒 (分詞器: {search_index_state['tokenizer']})。")
+            return
+        except sqlite3.OperationalError as e_fts:
+            logger.warning(f"無法以分詞器 '{tokenizer}' 建立 FTS5 全文搜尋索引: {e_fts}")
+    logger.error("此 SQLite 不支援 FTS5，全文搜尋功能將停用。")
+
+def _build_search_document(summary_data: Optional[Dict], transcript_data: Optional[Dict]) -> tuple:
+    summary_parts = []
+    if summary_data:
+        summary_parts.append(summary_data.get("intro_paragraph") or "")
+        for item in summary_data.get("items", []):
+            summary_parts.append(item.get("subtitle") or "")
+            summary_parts.extend(item.get("details", []))
+        summary_parts.append(summary_data.get("bilingual_append") or "")
+    transcript_parts = []
+    if transcript_data:
+        transcript_parts.append(transcript_data.get("bilingual_prepend") or "")
+        for p_item in transcript_data.get("paragraphs", []):
+            transcript_parts.append(f"{p_item['speaker']}: {p_item['content']}" if p_item.get("is_speaker_line") else p_item.get("content", ""))
+    return "\n".join(part for part in summary_parts if part), "\n".join(part for part in transcript_parts if part)
+
+def index_report_for_search(cursor: sqlite3.Cursor, task_id: str, title: str, summary_data: Optional[Dict], transcript_data: Optional[Dict]):
+    # 由呼叫端負責 commit，讓索引與任務狀態更新落在同一個交易中
+    if not search_index_state["available"]:
+        return
+    summary_text, transcript_text = _build_search_document(summary_data, transcript_data)
+    cursor.execute("DELETE FROM report_search WHERE task_id = ?", (task_id,))
+    cursor.execute("INSERT INTO report_search (task_id, title, summary, transcript) VALUES (?, ?, ?, ?)",
+                   (task_id, title, summary_text, transcript_text))
+
+def _html_to_plain_text(fragment: str) -> str:
+    text = re.sub(r"<(br|/p|/li|/h\d|hr)[^>]*>", "\n", fragment, flags=re.IGNORECASE)
+    text = re.sub(r"<[^>]+>", "", text)
+    return "\n".join(line.strip() for line in html.unescape(text).splitlines() if line.strip())
+
+def _backfill_search_index_sync() -> int:
+    # 舊任務沒有保存結構化資料，改由 result_preview_html 的摘要/逐字稿區塊還原純文字
+    if not search_index_state["available"]:
+        return 0
+    indexed_count = 0
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT task_id, source_name, result_preview_html FROM tasks
+            WHERE status = 'completed' AND result_preview_html IS NOT NULL
+              AND task_id NOT IN (SELECT task_id FROM report_search)
+        """)
+        rows = cursor.fetchall()
+        for row in rows:
+            preview_html = row["result_preview_html"]
+            transcript_start = preview_html.find("id='report-transcript'")
+            summary_html = preview_html if transcript_start == -1 else preview_html[:transcript_start]
+            transcript_html = "" if transcript_start == -1 else preview_html[transcript_start:]
+            cursor.execute("INSERT INTO report_search (task_id, title, summary, transcript) VALUES (?, ?, ?, ?)",
+                           (row["task_id"], row["source_name"] or "", _html_to_plain_text(summary_html), _html_to_plain_text(transcript_html)))
+            indexed_count += 1
+        conn.commit()
+        if indexed_count:
+            logger.info(f"[SEARCH] 已為 {indexed_count} 個既有報告補建全文搜尋索引。")
+    except sqlite3.Error as e_sql:
+        logger.error(f"[SEARCH] [ERROR_DB] 補建全文搜尋索引時 SQLite 錯誤: {e_sql}")
+    finally:
+        if 'conn' in locals() and conn: conn.close()
+    return indexed_count
+
+def _build_fts_match_query(user_query: str) -> str:
+    # 每個以空白分隔的詞都包成 FTS5 片語，避免使用者輸入被解讀為查詢語法；多個詞之間為 AND
+    terms = [term.replace('"', '""') for term in user_query.split() if term]
+    return " ".join(f'"{term}"' for term in terms)
 
 @app.on_event("shutdown")
 async def shutdown_event():
+    loop_lag_monitor.stop()
     executor.shutdown(wait=True)
+    batch_download_executor.shutdown(wait=True)
+    audio_preprocess_executor.shutdown(wait=True)
     logger.info("[INFO] ThreadPoolExecutor 已關閉。")
 
+# --- API 金鑰池 ---
+# 每把金鑰各自擁有獨立的用戶端實例 (不使用行程全域的 genai.configure)，不同金鑰的並行呼叫不會互相覆蓋。
+# 每次呼叫都會路由到「進行中呼叫數最少」的可用金鑰；遇到速率限制 (429 / 配額用盡) 的金鑰會暫停使用一段時間，
+# 連續觸發時暫停時間加倍；確定無效的金鑰會被移出輪替，直到重新透過 /api/set_api_key 加入。
+class NoAvailableApiKeyError(Exception):
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after # 最快恢復可用的秒數；None 代表沒有任何金鑰會自動恢復
+
+def _is_rate_limit_error(exc: BaseException) -> bool:
+    if isinstance(exc, google_api_exceptions.ResourceExhausted):
+        return True
+    message = str(exc).lower()
+    return "429" in message or "quota" in message or "rate limit" in message
+
+def _is_invalid_key_error(exc: BaseException) -> bool:
+    if isinstance(exc, (google_api_exceptions.PermissionDenied, google_api_exceptions.Unauthenticated)):
+        return True
+    message = str(exc)
+    return "API_KEY_INVALID" in message or "API key not valid" in message
+
+class ApiKeyState:
+    def __init__(self, api_key: str, source: str):
+        self.api_key = api_key
+        self.source = source # environment / runtime
+        self.label = f"...{api_key[-4:]}" # 對外只顯示末四碼
+        self.status = "unverified" # unverified / healthy / rate_limited / invalid
+        self.in_flight = 0
+        self.total_calls = 0
+        self.failed_calls = 0
+        self.rate_limit_hits = 0
+        self.consecutive_rate_limits = 0
+        self.cooldown_until = 0.0 # time.monotonic()
+        self.last_error: Optional[str] = None
+        self.last_used_at: Optional[str] = None
+        self._clients: Dict[str, Any] = {}
+
+    def _client(self, client_name: str):
+        if client_name not in self._clients:
+            self._clients[client_name] = getattr(glm, client_name)(client_options={"api_key": self.api_key})
+        return self._clients[client_name]
+
+    def model_client(self):
+        return self._client("ModelServiceClient")
+
+    def generative_client(self):
+        return self._client("GenerativeServiceClient")
+
+    def file_client(self):
+        if "FileServiceClient" not in self._clients:
+            self._clients["FileServiceClient"] = genai_client.FileServiceClient(client_options={"api_key": self.api_key})
+        return self._clients["FileServiceClient"]
+
+    def stats(self) -> Dict[str, Any]:
+        cooldown_remaining = max(0.0, self.cooldown_until - time.monotonic())
+        return {
+            "key": self.label,
+            "source": self.source,
+            "status": self.status,
+            "in_flight": self.in_flight,
+            "total_calls": self.total_calls,
+            "failed_calls": self.failed_calls,
+            "rate_limit_hits": self.rate_limit_hits,
+            "cooldown_remaining_seconds": round(cooldown_remaining, 1),
+            "last_used_at": self.last_used_at,
+            "last_error": self.last_error
+        }
+
+class ApiKeyPool:
+    def __init__(self):
+        self._lock = threading.Lock() # 金鑰會在事件迴圈與執行緒池中同時被取用
+        self._keys: Dict[str, ApiKeyState] = {}
+
+    def add_key(self, api_key: str, source: str) -> ApiKeyState:
+        with self._lock:
+            key_state = self._keys.get(api_key)
+            if key_state is None:
+                key_state = self._keys[api_key] = ApiKeyState(api_key, source)
+            elif key_state.status == "invalid":
+                key_state.status = "unverified" # 重新加入的金鑰給予再次驗證的機會
+            return key_state
+
+    def remove_key(self, api_key: str):
+        with self._lock:
+            self._keys.pop(api_key, None)
+
+    def keys(self) -> List[ApiKeyState]:
+        with self._lock:
+            return list(self._keys.values())
+
+    def has_keys(self) -> bool:
+        return bool(self._keys)
+
+    def _refresh_cooldowns_locked(self, now: float):
+        for key_state in self._keys.values():
+            if key_state.status == "rate_limited" and key_state.cooldown_until <= now:
+                key_state.status = "healthy"
+
+    def available_count(self) -> int:
+        with self._lock:
+            self._refresh_cooldowns_locked(time.monotonic())
+            return sum(1 for key_state in self._keys.values() if key_state.status in ("healthy", "unverified"))
+
+    def _unavailable_error_locked(self, now: float) -> NoAvailableApiKeyError:
+        cooldowns = [key_state.cooldown_until - now for key_state in self._keys.values() if key_state.status == "rate_limited"]
+        if cooldowns:
+            return NoAvailableApiKeyError("所有 API 金鑰皆暫時受到速率限制。", retry_after=max(0.0, min(cooldowns)))
+        return NoAvailableApiKeyError("沒有可用的 API 金鑰。請透過環境變數或 API 端點設定有效的金鑰。")
+
+    def unavailable_error(self) -> Optional[NoAvailableApiKeyError]:
+        with self._lock:
+            now = time.monotonic()
+            self._refresh_cooldowns_locked(now)
+            if any(key_state.status in ("healthy", "unverified") for key_state in self._keys.values()):
+                return None
+            return self._unavailable_error_locked(now)
+
+    def acquire(self) -> ApiKeyState:
+        with self._lock:
+            now = time.monotonic()
+            self._refresh_cooldowns_locked(now)
+            candidates = [key_state for key_state in self._keys.values() if key_state.status in ("healthy", "unverified")]
+            if not candidates:
+                raise self._unavailable_error_locked(now)
+            # 進行中呼叫數最少者優先，相同時選累計呼叫數較少者，讓負載平均分散
+            key_state = min(candidates, key=lambda candidate: (candidate.in_flight, candidate.total_calls))
+            key_state.in_flight += 1
+            key_state.total_calls += 1
+            key_state.last_used_at = datetime.now(timezone.utc).isoformat()
+            return key_state
+
+    def release(self, key_state: ApiKeyState, error: Optional[BaseException] = None):
+        with self._lock:
+            key_state.in_flight = max(0, key_state.in_flight - 1)
+            if error is None:
+                key_state.status = "healthy"
+                key_state.consecutive_rate_limits = 0
+                return
+            key_state.failed_calls += 1
+            key_state.last_error = str(error)[:300]
+            if _is_rate_limit_error(error):
+                key_state.rate_limit_hits += 1
+                key_state.consecutive_rate_limits += 1
+                cooldown_seconds = min(API_KEY_MAX_COOLDOWN_SECONDS, API_KEY_COOLDOWN_SECONDS * 2 ** (key_state.consecutive_rate_limits - 1))
+                key_state.cooldown_until = time.monotonic() + cooldown_seconds
+                key_state.status = "rate_limited"
+                logger.warning(f"[API_KEY_POOL] 金鑰 {key_state.label} 遇到速率限制，暫停使用 {cooldown_seconds:.0f} 秒。")
+            elif _is_invalid_key_error(error):
+                key_state.status = "invalid"
+                logger.error(f"[API_KEY_POOL] 金鑰 {key_state.label} 無效，已移出輪替: {error}")
+
+    def validate_key_sync(self, key_state: ApiKeyState) -> bool:
+        # 以該金鑰自己的用戶端列出一個模型作為輕量驗證，不影響其他金鑰
+        with self._lock:
+            key_state.in_flight += 1
+            key_state.total_calls += 1
+        try:
+            next(iter(key_state.model_client().list_models(page_size=1, retry=None, timeout=API_KEY_VALIDATE_TIMEOUT_SECONDS)), None)
+        except Exception as e_validate:
+            # 只有確定是金鑰無效時才移出輪替；網路等暫時性錯誤保持 unverified，下次請求時再驗證
+            self.release(key_state, e_validate)
+            return False
+        self.release(key_state)
+        return True
+
+    async def run(self, call: Callable[[ApiKeyState], Awaitable[Any]], max_attempts: int = API_KEY_MAX_ATTEMPTS) -> Any:
+        # 以選出的金鑰執行 call；遇到速率限制時改用下一把金鑰，所有金鑰都在冷卻中時等待最快恢復的一把
+        for attempt in range(1, max_attempts + 1):
+            try:
+                key_state = self.acquire()
+            except NoAvailableApiKeyError as e_unavailable:
+                if e_unavailable.retry_after is None or attempt == max_attempts:
+                    raise
+                await asyncio.sleep(e_unavailable.retry_after)
+                continue
+            try:
+                result = await call(key_state)
+            except asyncio.CancelledError:
+                self.release(key_state)
+                raise
+            except Exception as e_call:
+                self.release(key_state, e_call)
+                if _is_rate_limit_error(e_call) and attempt < max_attempts:
+                    continue
+                raise
+            self.release(key_state)
+            return result
+
+    def stats(self) -> Dict[str, Any]:
+        key_stats = [key_state.stats() for key_state in self.keys()]
+        return {
+            "total_keys": len(key_stats),
+            "available_keys": self.available_count(),
+            "in_flight": sum(item["in_flight"] for item in key_stats),
+            "keys": key_stats
+        }
+
+def _load_env_api_keys(pool: ApiKeyPool):
+    # GOOGLE_API_KEYS 可放多把以逗號分隔的金鑰；GOOGLE_API_KEY 仍然支援
+    env_keys = [key.strip() for key in os.getenv("GOOGLE_API_KEYS", "").split(",") if key.strip()]
+    if os.getenv("GOOGLE_API_KEY"):
+        env_keys.append(os.getenv("GOOGLE_API_KEY").strip())
+    for api_key in env_keys:
+        pool.add_key(api_key, "environment")
+
+api_key_pool = ApiKeyPool()
+_load_env_api_keys(api_key_pool)
+
 # --- API 金鑰依賴注入 ---
-async def get_validated_api_key(request: Request) -> str:
-    # 優先從環境變數讀取
-    api_key_to_test = os.getenv("GOOGLE_API_KEY")
-    source = "environment variable"
-
-    # 如果環境變數沒有，則嘗試從臨時存儲讀取
-    global temporary_api_key_storage
-    if not api_key_to_test and temporary_api_key_storage:
-        api_key_to_test = temporary_api_key_storage
-        source = "temporary storage"
-
-    if not api_key_to_test:
-        logger.warning("[API_KEY_DEP] API key not found in environment variables or temporary storage.")
+async def get_api_key_pool() -> ApiKeyPool:
+    if not api_key_pool.has_keys():
+        logger.warning("[API_KEY_DEP] API key pool is empty (no environment or runtime keys).")
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="API 金鑰尚未設定。請透過環境變數或 API 端點設定。")
 
-    try:
-        # 基本檢查
-        if len(api_key_to_test) < 10: # 假設 API key 長度至少為10
-            raise ValueError("API key is too short.")
-
-        # 關鍵：使用此金鑰配置 genai 並執行輕量級驗證
-        # 這樣，依賴此函式的路由可以直接使用 genai 功能，而不需再次配置
-        genai.configure(api_key=api_key_to_test)
-        logger.info(f"[API_KEY_DEP] genai configured with API key from {source}.")
-        # 嘗試 list_models 作為最終驗證步驟
-        next(genai.list_models(), None)
-        logger.info(f"[API_KEY_DEP] API key from {source} validated by listing models.")
-        return api_key_to_test
-    except Exception as e:
-        logger.error(f"[API_KEY_DEP] Error during validation or configuration of API key from {source}: {e}")
-        # 清除可能已設定的無效臨時金鑰，防止後續請求嘗試使用它
-        if source == "temporary storage":
-            temporary_api_key_storage = None
-            logger.info("[API_KEY_DEP] Invalid temporary API key cleared due to validation failure.")
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"提供的 API 金鑰 ({source}) 無效或驗證失敗: {e}")
+    # 只有尚未驗證過的金鑰需要連線驗證，已驗證的金鑰由實際呼叫的結果持續更新狀態
+    for key_state in api_key_pool.keys():
+        if key_state.status == "unverified":
+            await asyncio.to_thread(api_key_pool.validate_key_sync, key_state)
+
+    e_unavailable = api_key_pool.unavailable_error()
+    if e_unavailable is not None:
+        if e_unavailable.retry_after is not None:
+            raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(e_unavailable),
+                                headers={"Retry-After": str(int(e_unavailable.retry_after) + 1)})
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"金鑰池中的 API 金鑰皆無效或驗證失敗: {e_unavailable}")
+    return api_key_pool
+
+# --- 靜態資源指紋與快取 ---
+# 啟動時為 static 目錄中的每個檔案計算內容雜湊，產生 /static/style.<hash>.css 形式的網址，
+# 內容改變網址就改變，因此可以用 immutable 長期快取；重複載入頁面時瀏覽器不必再向伺服器確認。
+# CSS 內以相對路徑引用的字型等資源也會改寫為帶指紋的網址。可壓縮的檔案預先產生 gzip (及選用的 Brotli) 版本，
+# 請求時依 Accept-Encoding 直接回傳。未帶指紋的原始網址 (例如舊報告引用的 /static/style.css) 仍可使用，但需每次驗證 ETag。
+STATIC_IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+STATIC_REVALIDATE_CACHE_CONTROL = "no-cache"
+STATIC_COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml")
+STATIC_MIN_COMPRESS_BYTES = 512 # 太小的檔案壓縮後反而可能變大
+
+class StaticAssetRegistry:
+    def __init__(self, static_dir: str):
+        self.static_dir = static_dir
+        self.assets_by_path: Dict[str, Dict[str, Any]] = {} # 請求路徑 (不含 /static/) -> 資源內容與標頭
+        self.fingerprinted_urls: Dict[str, str] = {} # 原始相對路徑 -> 帶指紋的網址
+        self.built = False
+        self._build_lock = threading.Lock()
+
+    @staticmethod
+    def _fingerprinted_name(rel_path: str, digest: str) -> str:
+        directory, filename = posixpath.split(rel_path)
+        stem, extension = posixpath.splitext(filename)
+        return posixpath.join(directory, f"{stem}.{digest}{extension}")
+
+    def _rewrite_css_urls(self, css_rel_path: str, css_text: str) -> str:
+        def _replace(match):
+            quote, target = match.group(1), match.group(2)
+            if target.startswith(("data:", "http:", "https:", "//", "/")):
+                return match.group(0)
+            target_path, suffix = re.match(r"([^?#]*)(.*)", target).groups() # 保留 ?#iefix 之類的查詢字串 / 片段
+            resolved = posixpath.normpath(posixpath.join(posixpath.dirname(css_rel_path), target_path))
+            fingerprinted_url = self.fingerprinted_urls.get(resolved)
+            if not fingerprinted_url:
+                return match.group(0) # 引用的檔案不存在 (例如未隨附的 .ttf)，保持原樣
+            return f"url({quote}{fingerprinted_url}{suffix}{quote})"
+        return re.sub(r"url\((['\"]?)([^'\")]+)\1\)", _replace, css_text)
+
+    def _register(self, rel_path: str, body: bytes):
+        media_type = mimetypes.guess_type(rel_path)[0] or "application/octet-stream"
+        if media_type.startswith("text/") or media_type == "application/javascript":
+            media_type += "; charset=utf-8"
+        digest = hashlib.sha256(body).hexdigest()[:12]
+        compressible = media_type.startswith(STATIC_COMPRESSIBLE_TYPES) and len(body) >= STATIC_MIN_COMPRESS_BYTES
+        asset = {
+            "body": body,
+            "media_type": media_type,
+            "etag": f'"{digest}"',
+            "gzip": gzip.compress(body, compresslevel=9, mtime=0) if compressible else None,
+            "br": brotli.compress(body) if compressible and brotli is not None else None
+        }
+        fingerprinted_path = self._fingerprinted_name(rel_path, digest)
+        self.assets_by_path[fingerprinted_path] = {**asset, "cache_control": STATIC_IMMUTABLE_CACHE_CONTROL}
+        self.assets_by_path[rel_path] = {**asset, "cache_control": STATIC_REVALIDATE_CACHE_CONTROL}
+        self.fingerprinted_urls[rel_path] = f"/static/{fingerprinted_path}"
+
+    def build(self):
+        started_at = time.perf_counter()
+        rel_paths = []
+        for root, _, filenames in os.walk(self.static_dir):
+            for filename in filenames:
+                rel_paths.append(posixpath.join(*os.path.relpath(os.path.join(root, filename), self.static_dir).split(os.sep)))
+        # CSS 最後處理，才能把其中引用的字型改寫成已計算好的指紋網址
+        for rel_path in sorted(rel_paths, key=lambda path: (path.endswith(".css"), path)):
+            with open(os.path.join(self.static_dir, *rel_path.split("/")), "rb") as f:
+                body = f.read()
+            if rel_path.endswith(".css"):
+                body = self._rewrite_css_urls(rel_path, body.decode("utf-8")).encode("utf-8")
+            self._register(rel_path, body)
+        self.built = True
+        logger.info(f"[STATIC] 已為 {len(rel_paths)} 個靜態資源產生指紋網址與壓縮版本，耗時 {time.perf_counter() - started_at:.3f} 秒。")
+
+    def ensure_built(self):
+        # 建置 (壓縮所有資源) 不在模組載入時進行，而是由啟動背景工作在執行緒中觸發；在那之前的請求會在此同步建置或等待建置完成
+        if self.built:
+            return
+        with self._build_lock:
+            if not self.built:
+                self.build()
+
+    def get(self, asset_path: str) -> Optional[Dict[str, Any]]:
+        self.ensure_built()
+        return self.assets_by_path.get(asset_path)
+
+    def url_for(self, rel_path: str) -> str:
+        self.ensure_built()
+        return self.fingerprinted_urls.get(rel_path, f"/static/{rel_path}")
+
+    def read_text(self, rel_path: str) -> str:
+        asset = self.get(rel_path)
+        return asset["body"].decode("utf-8") if asset else ""
+
+def _choose_content_encoding(request: Request, asset: Dict[str, Any]) -> Optional[str]:
+    accepted_encodings = {token.split(";")[0].strip().lower() for token in request.headers.get("accept-encoding", "").split(",")}
+    for encoding in ("br", "gzip"):
+        if asset.get(encoding) is not None and encoding in accepted_encodings:
+            return encoding
+    return None
 
 # --- 靜態檔案與主模板 (強化啟動檢查) ---
 try:
@@ -257,62 +1128,58 @@ try:
         logger.critical(f"主模板目錄 '{templates_dir_path}' 不存在。應用程式無法啟動。")
         sys.exit(1) # 強制退出
 
-    app.mount("/static", StaticFiles(directory=static_dir_path), name="static")
+    static_assets = StaticAssetRegistry(static_dir_path) # 由 run_startup_background_jobs 在背景建置
     templates = Jinja2Templates(directory=templates_dir_path)
+    templates.env.globals["asset_url"] = static_assets.url_for # 模板以 {{ asset_url('style.css') }} 取得帶指紋的網址
 except Exception as e:
     logger.critical(f"設定靜態檔案或主模板時發生嚴重錯誤: {e}。應用程式無法啟動。")
     sys.exit(1) # 強制退出
 
+@app.api_route("/static/{asset_path:path}", methods=["GET", "HEAD"], include_in_schema=False)
+async def serve_static_asset(asset_path: str, request: Request):
+    asset = static_assets.get(asset_path)
+    if asset is None:
+        raise HTTPException(status_code=404, detail="找不到指定的靜態資源。")
+    content_encoding = _choose_content_encoding(request, asset)
+    # 不同壓縮版本的內容不同，ETag 也需區分
+    etag = asset["etag"] if content_encoding is None else f'{asset["etag"][:-1]}-{content_encoding}"'
+    headers = {"ETag": etag, "Cache-Control": asset["cache_control"], "Vary": "Accept-Encoding"}
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    if content_encoding is not None:
+        headers["Content-Encoding"] = content_encoding
+    body = asset[content_encoding] if content_encoding else asset["body"]
+    return Response(content=b"" if request.method == "HEAD" else body, media_type=asset["media_type"],
+                    headers={**headers, "Content-Length": str(len(body))})
+
 
 # --- API 金鑰管理 API (強化驗證邏輯) ---
 @app.post("/api/set_api_key")
 async def set_api_key(request_data: SetApiKeyRequest):
-    global temporary_api_key_storage
-    logger.debug(f"Received request to set temporary API key.")
-    try:
-        # Validate and configure genai with the new key
-        genai.configure(api_key=request_data.api_key)
-        next(genai.list_models(), None) # Validate by trying to list models
+    logger.debug(f"Received request to add an API key to the pool.")
+    key_state = api_key_pool.add_key(request_data.api_key, "runtime")
+    if await asyncio.to_thread(api_key_pool.validate_key_sync, key_state):
+        logger.info(f"[SUCCESS] API key {key_state.label} validated and added to the pool.")
+        return {"message": "API 金鑰已驗證成功並加入金鑰池。", "key": key_state.label, "available_keys": api_key_pool.available_count()}
 
-        temporary_api_key_storage = request_data.api_key
-        logger.info(f"[SUCCESS] Temporary API key set and validated successfully.")
-        return {"message": "臨時 API 金鑰已設定並驗證成功。"}
-    except Exception as e_val:
-        logger.error(f"[ERROR] Failed to validate or set temporary API key: {e_val}")
-        # temporary_api_key_storage = None # Ensure it's not set if validation fails - get_validated_api_key handles this
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"提供的臨時 API 金鑰驗證失敗: {e_val}")
+    logger.error(f"[ERROR] Failed to validate API key {key_state.label}: {key_state.last_error}")
+    if key_state.source == "runtime":
+        api_key_pool.remove_key(request_data.api_key) # 驗證失敗的執行期金鑰不保留在金鑰池中
+    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"提供的 API 金鑰驗證失敗: {key_state.last_error}")
 
 @app.get("/api/check_api_key_status")
-async def check_api_key_status(api_key: str = Depends(get_validated_api_key)):
-    # If get_validated_api_key dependency succeeds, it means an API key (either from env or temp)
-    # has been found and successfully used to configure and validate genai.
-    # The actual key string is in api_key variable but we don't need to use it here explicitly.
-    env_key_exists = bool(os.getenv("GOOGLE_API_KEY"))
-    temp_key_exists = bool(temporary_api_key_storage)
-
-    status_detail = "API 金鑰有效。"
-    if env_key_exists:
-        status_detail += " (來源：環境變數)"
-    elif temp_key_exists:
-        status_detail += " (來源：臨時設定)"
-    else:
-        # This case should ideally not be reached if get_validated_api_key works correctly,
-        # as it would raise an exception if no key is found.
-        status_detail = "API 金鑰有效，但無法判斷來源 (異常情況)。"
-
+async def check_api_key_status(key_pool: ApiKeyPool = Depends(get_api_key_pool)):
+    # If the get_api_key_pool dependency succeeds, at least one key in the pool is usable.
+    key_sources = sorted({key_state.source for key_state in key_pool.keys() if key_state.status in ("healthy", "unverified")})
+    source_names = {"environment": "環境變數", "runtime": "臨時設定"}
+    status_detail = f"API 金鑰有效。(可用金鑰 {key_pool.available_count()} 把，來源：{'、'.join(source_names.get(source, source) for source in key_sources)})"
     logger.debug(f"API 金鑰狀態檢查：{status_detail}")
     return {"status": "set_and_valid", "message": status_detail}
-    # --- Old logic commented out ---
-    # global global_api_key, api_key_is_valid
-    # if global_api_key and api_key_is_valid:
-    #     logger.debug("API 金鑰狀態檢查：已設定且有效。")
-    #     return {"status": "set_and_valid", "message": "API 金鑰已設定且有效。"}
-    # elif global_api_key and not api_key_is_valid:
-    #     logger.debug("API 金鑰狀態檢查：已設定但驗證失敗。")
-    #     return {"status": "set_but_invalid", "message": "API 金鑰已設定但驗證失敗，請重新設定。"}
-    # else:
-    #     logger.debug("API 金鑰狀態檢查：未設定。")
-    #     return {"status": "not_set", "message": "API 金鑰尚未設定，請設定 API 金鑰。"}
+
+@app.get("/api/api_keys/stats")
+async def get_api_key_stats():
+    # 只回傳遮罩後的金鑰標籤，不回傳完整金鑰
+    return api_key_pool.stats()
 
 
 # --- 輔助函式 (sanitize_filename, generate_html_report_content_via_jinja) ---
@@ -339,314 +1206,1023 @@ def generate_html_report_content_via_jinja(report_title: str, summary_data: Opti
         traceback.print_exc()
         return f"<div class='report-content'><p style='color:red;'>抱歉，生成報告預覽時發生內部錯誤：{str(e)}</p></div>"
 
-# --- process_audio_and_generate_report_task (強化錯誤處理) ---
-async def process_audio_and_generate_report_task(task_id: str, request_data: GenerateReportRequest, api_key: str):
-    # api_key is passed from the route that used Depends(get_validated_api_key)
-    # Configure genai for this background task execution context
-    try:
-        genai.configure(api_key=api_key)
-        # Optional: further validation like list_models() if desired, but get_validated_api_key should have done it.
-        logger.info(f"[TASK {task_id}] genai configured successfully for background execution.")
-    except Exception as e_conf_bg:
-        logger.error(f"[TASK {task_id}] [ERROR_CRITICAL] Failed to configure genai in background task: {e_conf_bg}")
-        # Update task status to failed
-        error_message = f"背景任務中 API 金鑰配置失敗: {e_conf_bg}"
-        completion_time_iso = datetime.now(timezone.utc).isoformat()
+# --- 任務變更通知 (長輪詢用) ---
+# 每個被等待中的任務對應一個 asyncio.Event；任務狀態寫入資料庫後呼叫 notify_task_changed 喚醒所有等待者。
+# 以 WeakValueDictionary 保存，最後一個等待者離開後事件會自動被回收。
+main_event_loop: Optional[asyncio.AbstractEventLoop] = None
+_task_change_events: "weakref.WeakValueDictionary[str, asyncio.Event]" = weakref.WeakValueDictionary()
+
+def _get_task_change_event(task_id: str) -> asyncio.Event:
+    change_event = _task_change_events.get(task_id)
+    if change_event is None:
+        change_event = asyncio.Event()
+        _task_change_events[task_id] = change_event
+    return change_event
+
+def _wake_task_waiters(task_id: str):
+    # 取出並設定目前的事件；之後的等待者會拿到新的事件，不會被這次通知誤喚醒
+    change_event = _task_change_events.pop(task_id, None)
+    if change_event is not None:
+        change_event.set()
+
+def notify_task_changed(task_id: str):
+    # 可在事件迴圈或工作執行緒中呼叫；asyncio.Event 不是執行緒安全的，非迴圈執行緒需轉交給迴圈處理
+    try:
+        running_loop = asyncio.get_running_loop()
+    except RuntimeError:
+        running_loop = None
+    if running_loop is not None and running_loop is main_event_loop:
+        _wake_task_waiters(task_id)
+    elif main_event_loop is not None and not main_event_loop.is_closed():
+        main_event_loop.call_soon_threadsafe(_wake_task_waiters, task_id)
+
+# --- 任務執行槽位與取消 ---
+# 報告任務必須先向 task_scheduler 取得槽位才會開始處理，最多同時執行 MAX_CONCURRENT_TASKS 個。
+# 槽位空出時，等待中的任務以「最短預估處理時間優先」(SJF) 取得槽位，長音訊不會塞住短任務；
+# 排序值為 預估秒數 - 老化係數 × 已等待秒數，等待夠久的長任務最終仍會輪到。
+# 每個任務以獨立的 asyncio.Task 執行並登記在 active_task_handles，取消時：
+#   1. 設定 task_cancel_flags 中的 threading.Event，讓執行緒中的下載 / ffmpeg 協作式地中止；
+#   2. 取消 asyncio.Task，佇列中的任務永遠不會開始，執行中的任務在下一個 await 點中止並立即釋放槽位。
+class ShortestJobFirstScheduler:
+    def __init__(self, slots: int, aging_factor: float):
+        self._free_slots = slots
+        self._aging_factor = aging_factor
+        self._waiters: List[Dict[str, Any]] = []
+        self._sequence = 0
+
+    def _priority(self, waiter: Dict[str, Any], now: float) -> tuple:
+        return (waiter["estimated_seconds"] - self._aging_factor * (now - waiter["enqueued_at"]), waiter["sequence"])
+
+    def _dispatch(self):
+        while self._free_slots > 0 and self._waiters:
+            now = time.monotonic()
+            waiter = min(self._waiters, key=lambda candidate: self._priority(candidate, now))
+            self._waiters.remove(waiter)
+            if waiter["future"].done():
+                continue # 等待者已被取消但尚未從佇列移除，不分配槽位
+            self._free_slots -= 1
+            waiter["future"].set_result(True)
+
+    async def acquire(self, task_id: str, estimated_seconds: float):
+        if self._free_slots > 0 and not self._waiters:
+            self._free_slots -= 1
+            return
+        self._sequence += 1
+        waiter = {"task_id": task_id, "estimated_seconds": estimated_seconds, "enqueued_at": time.monotonic(),
+                  "sequence": self._sequence, "future": asyncio.get_running_loop().create_future()}
+        self._waiters.append(waiter)
         try:
-            conn_err = get_db_connection()
-            cursor_err = conn_err.cursor()
-            cursor_err.execute("UPDATE tasks SET status = ?, error_message = ?, completion_time = ? WHERE task_id = ?",
-                               ("failed", error_message, completion_time_iso, task_id))
-            conn_err.commit()
-        except sqlite3.Error as e_sql_err:
-            logger.error(f"[TASK {task_id}] [ERROR_DB] 更新任務狀態為 'failed' (背景金鑰配置錯誤) 時 SQLite 錯誤: {e_sql_err}")
+            await waiter["future"]
+        except asyncio.CancelledError:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter) # 尚未取得槽位，直接離開佇列
+            elif not waiter["future"].cancelled():
+                self.release() # 槽位已分配但任務在恢復執行前被取消，交給下一個等待者
+            raise
+
+    def release(self):
+        self._free_slots += 1
+        self._dispatch()
+
+    @contextlib.asynccontextmanager
+    async def slot(self, task_id: str, estimated_seconds: float):
+        await self.acquire(task_id, estimated_seconds)
+        try:
+            yield
         finally:
-            if 'conn_err' in locals() and conn_err: conn_err.close()
-        return # Critical failure, cannot proceed
+            self.release()
+
+    def snapshot(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        ordered_waiters = sorted(self._waiters, key=lambda candidate: self._priority(candidate, now))
+        return {
+            "free_slots": self._free_slots,
+            "waiting": [{"task_id": waiter["task_id"],
+                         "estimated_seconds": round(waiter["estimated_seconds"], 1),
+                         "waited_seconds": round(now - waiter["enqueued_at"], 1),
+                         "priority": round(self._priority(waiter, now)[0], 1)} for waiter in ordered_waiters]
+        }
 
-    start_time_iso = datetime.now(timezone.utc).isoformat()
+task_scheduler: Optional[ShortestJobFirstScheduler] = None
+batch_download_slots: Optional[asyncio.Semaphore] = None # 所有批次共用的下載並行上限
+active_task_handles: Dict[str, asyncio.Task] = {}
+task_cancel_flags: Dict[str, threading.Event] = {}
+
+class TaskCancelledError(Exception):
+    """由執行緒中的同步程式碼在偵測到任務被取消時拋出。"""
+
+def _raise_if_task_cancelled(task_id: str, message: str):
+    cancel_flag = task_cancel_flags.get(task_id)
+    if cancel_flag is not None and cancel_flag.is_set():
+        raise TaskCancelledError(message)
+
+async def _run_sync_until_done(func, *args):
+    # asyncio.to_thread 被取消時執行緒仍會繼續跑；先等它結束再把 CancelledError 往上拋，
+    # 呼叫端的清理 (例如刪除已寫出的檔案) 才不會與仍在寫檔的執行緒競爭
+    worker = asyncio.ensure_future(asyncio.to_thread(func, *args))
+    try:
+        return await asyncio.shield(worker)
+    except asyncio.CancelledError:
+        with contextlib.suppress(Exception, asyncio.CancelledError):
+            await worker
+        raise
+
+def start_task_coroutine(task_id: str, coro) -> asyncio.Task:
+    task_cancel_flags[task_id] = threading.Event()
+    handle = asyncio.create_task(coro)
+    active_task_handles[task_id] = handle
+
+    def _forget_task_handle(_):
+        active_task_handles.pop(task_id, None)
+        task_cancel_flags.pop(task_id, None)
+    handle.add_done_callback(_forget_task_handle)
+    return handle
+
+async def run_report_task_in_slot(task_id: str, request_data: "GenerateReportRequest", key_pool: ApiKeyPool, estimated_seconds: Optional[float] = None):
+    if estimated_seconds is None:
+        # 批次項目與恢復的任務在此才知道音訊長度，估算後寫回任務列供前端顯示
+        estimate = await asyncio.to_thread(estimate_report_job_sync, request_data.source_path, request_data.model_id, request_data.output_options,
+                                           request_data.model_backend, request_data.backend_options)
+        estimated_seconds = estimate["estimated_processing_seconds"]
+        if request_data.model_id == AUTO_MODEL_ID:
+            request_data = request_data.model_copy(update={"model_id": estimate["model_id"]})
+            logger.info(f"[TASK {task_id}] 自動選擇模型: {estimate['model_id']} (預估 {estimated_seconds} 秒)")
+        _store_task_estimate(task_id, estimate)
+    async with task_scheduler.slot(task_id, estimated_seconds):
+        await process_audio_and_generate_report_task(task_id, request_data, key_pool)
+
+def schedule_report_task(task_id: str, request_data: "GenerateReportRequest", key_pool: ApiKeyPool, estimated_seconds: Optional[float] = None) -> asyncio.Task:
+    return start_task_coroutine(task_id, run_report_task_in_slot(task_id, request_data, key_pool, estimated_seconds))
+
+def _remove_files_quietly(file_paths: List[str], task_id: str):
+    for file_path in file_paths:
+        try:
+            if file_path and os.path.isfile(file_path):
+                os.remove(file_path)
+                logger.info(f"[TASK {task_id}] 已清理部分產出檔案: {file_path}")
+        except OSError as e_remove:
+            logger.warning(f"[TASK {task_id}] 清理檔案 {file_path} 時發生錯誤: {e_remove}")
+
+# --- 音訊前處理 (降混單聲道、重新取樣、壓縮靜音) ---
+# 前處理設定會併入快取鍵，調整任何參數後舊的快取自然失效
+AUDIO_PREPROCESS_PROFILE = f"mono|{AUDIO_PREPROCESS_SAMPLE_RATE}|{AUDIO_PREPROCESS_BITRATE}|{AUDIO_SILENCE_THRESHOLD}|{AUDIO_SILENCE_MIN_DURATION}|{AUDIO_SILENCE_KEEP_DURATION}"
+
+def _hash_file_sync(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+    hasher = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+def _preprocess_audio_sync(source_path: str, task_id_for_log: Optional[str]="N/A") -> str:
+    # 失敗時一律退回原始檔案，前處理只是最佳化，不應讓任務因此失敗
+    ffmpeg_path = shutil.which("ffmpeg")
+    if not ffmpeg_path:
+        logger.warning(f"[TASK {task_id_for_log}] [PREPROCESS] 找不到 ffmpeg，略過音訊前處理並使用原始檔案。")
+        return source_path
+
+    try:
+        cache_key = hashlib.sha256(f"{_hash_file_sync(source_path)}|{AUDIO_PREPROCESS_PROFILE}".encode("utf-8")).hexdigest()
+    except OSError as e_hash:
+        logger.warning(f"[TASK {task_id_for_log}] [PREPROCESS] 計算音訊內容雜湊失敗，使用原始檔案: {e_hash}")
+        return source_path
+
+    cached_path = os.path.join(AUDIO_CACHE_DIR, f"{cache_key}.mp3")
+    if os.path.exists(cached_path) and os.path.getsize(cached_path) > 0:
+        logger.info(f"[TASK {task_id_for_log}] [PREPROCESS] 命中快取，直接使用: {cached_path}")
+        with contextlib.suppress(OSError):
+            os.utime(cached_path) # 修改時間即最後使用時間，快取清理依此判斷新舊
+        return cached_path
+
+    os.makedirs(AUDIO_CACHE_DIR, exist_ok=True)
+    partial_path = os.path.join(AUDIO_CACHE_DIR, f"{cache_key}.{uuid.uuid4().hex[:8]}.partial.mp3")
+    silence_filter = (
+        f"silenceremove=start_periods=1:start_threshold={AUDIO_SILENCE_THRESHOLD}"
+        f":stop_periods=-1:stop_duration={AUDIO_SILENCE_MIN_DURATION}"
+        f":stop_threshold={AUDIO_SILENCE_THRESHOLD}:stop_silence={AUDIO_SILENCE_KEEP_DURATION}"
+    )
+    command = [
+        ffmpeg_path, "-hide_banner", "-loglevel", "error", "-nostdin", "-y",
+        "-i", source_path,
+        "-vn", "-ac", "1", "-ar", str(AUDIO_PREPROCESS_SAMPLE_RATE),
+        "-af", silence_filter,
+        "-c:a", "libmp3lame", "-b:a", AUDIO_PREPROCESS_BITRATE,
+        partial_path
+    ]
+    cancel_flag = task_cancel_flags.get(task_id_for_log)
+    try:
+        # 以短間隔輪詢 ffmpeg，任務被取消或逾時時立即終止子行程
+        process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        deadline = time.monotonic() + AUDIO_PREPROCESS_TIMEOUT
+        while True:
+            try:
+                _, stderr_bytes = process.communicate(timeout=0.5)
+                break
+            except subprocess.TimeoutExpired:
+                if cancel_flag is not None and cancel_flag.is_set():
+                    process.kill(); process.communicate()
+                    raise TaskCancelledError("任務已取消，ffmpeg 已終止。")
+                if time.monotonic() > deadline:
+                    process.kill(); process.communicate()
+                    raise
+        if process.returncode != 0:
+            raise subprocess.CalledProcessError(process.returncode, command, stderr=stderr_bytes)
+        if not os.path.exists(partial_path) or os.path.getsize(partial_path) == 0:
+            raise RuntimeError("ffmpeg 未產生任何輸出。")
+        os.replace(partial_path, cached_path) # 原子性地放入快取，避免其他任務讀到寫到一半的檔案
+        original_size = os.path.getsize(source_path)
+        processed_size = os.path.getsize(cached_path)
+        logger.info(f"[TASK {task_id_for_log}] [PREPROCESS] [SUCCESS] 音訊前處理完成: {original_size} -> {processed_size} bytes ({processed_size / original_size:.1%})")
+        return cached_path
+    except TaskCancelledError:
+        logger.info(f"[TASK {task_id_for_log}] [PREPROCESS] 任務已取消，中止音訊前處理。")
+        raise
+    except subprocess.CalledProcessError as e_ffmpeg:
+        stderr_text = e_ffmpeg.stderr.decode("utf-8", errors="replace").strip() if e_ffmpeg.stderr else ""
+        logger.warning(f"[TASK {task_id_for_log}] [PREPROCESS] ffmpeg 執行失敗 (返回碼 {e_ffmpeg.returncode})，使用原始檔案: {stderr_text[-500:]}")
+    except subprocess.TimeoutExpired:
+        logger.warning(f"[TASK {task_id_for_log}] [PREPROCESS] ffmpeg 執行超過 {AUDIO_PREPROCESS_TIMEOUT} 秒，使用原始檔案。")
+    except Exception as e:
+        logger.warning(f"[TASK {task_id_for_log}] [PREPROCESS] 音訊前處理時發生未預期錯誤，使用原始檔案: {e}")
+    finally:
+        if os.path.exists(partial_path):
+            try: os.remove(partial_path)
+            except OSError: pass
+    return source_path
+
+async def preprocess_audio_for_analysis(source_path: str, task_id: str) -> str:
+    if not AUDIO_PREPROCESS_ENABLED:
+        return source_path
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(audio_preprocess_executor, _preprocess_audio_sync, source_path, task_id)
+
+# --- 音訊長度與成本 / 延遲估算 ---
+# 音訊長度在匯入時 (上傳、YouTube 下載) 量測並記錄在 audio_metadata，提交任務時用來估算各模型的
+# token 數、處理時間與費用。下列模型效能數字是規劃用的概略值，只用於排程與自動選擇模型，
+# 依序比對模型 ID，第一個符合的規則生效。
+MODEL_PERFORMANCE_PROFILES = [
+    (r"^models/gemini-pro$", {"supports_audio": False, "max_input_tokens": 30720, "max_output_tokens": 2048,
+                              "input_tokens_per_second": 20000, "output_tokens_per_second": 80, "base_latency_seconds": 2.0,
+                              "input_cost_per_million": 0.5, "output_cost_per_million": 1.5}),
+    (r"flash-lite", {"supports_audio": True, "max_input_tokens": 1048576, "max_output_tokens": 8192,
+                     "input_tokens_per_second": 60000, "output_tokens_per_second": 250, "base_latency_seconds": 1.0,
+                     "input_cost_per_million": 0.075, "output_cost_per_million": 0.3}),
+    (r"flash", {"supports_audio": True, "max_input_tokens": 1048576, "max_output_tokens": 8192,
+                "input_tokens_per_second": 40000, "output_tokens_per_second": 180, "base_latency_seconds": 1.5,
+                "input_cost_per_million": 0.075, "output_cost_per_million": 0.3}),
+    (r"pro", {"supports_audio": True, "max_input_tokens": 2097152, "max_output_tokens": 8192,
+              "input_tokens_per_second": 12000, "output_tokens_per_second": 60, "base_latency_seconds": 4.0,
+              "input_cost_per_million": 1.25, "output_cost_per_million": 5.0}),
+]
+DEFAULT_MODEL_PERFORMANCE_PROFILE = MODEL_PERFORMANCE_PROFILES[-1][1] # 未知模型以較保守的 Pro 等級估算
+
+def get_model_performance_profile(model_id: str) -> Dict[str, Any]:
+    model_id_lower = model_id.lower()
+    for pattern, profile in MODEL_PERFORMANCE_PROFILES:
+        if re.search(pattern, model_id_lower):
+            return profile
+    return DEFAULT_MODEL_PERFORMANCE_PROFILE
+
+def _probe_audio_duration_sync(file_path: str) -> tuple:
+    ffprobe_path = shutil.which("ffprobe")
+    if ffprobe_path:
+        try:
+            completed = subprocess.run(
+                [ffprobe_path, "-v", "error", "-show_entries", "format=duration", "-of", "default=noprint_wrappers=1:nokey=1", file_path],
+                capture_output=True, text=True, timeout=30
+            )
+            if completed.returncode == 0 and completed.stdout.strip():
+                return float(completed.stdout.strip()), "ffprobe"
+        except (subprocess.SubprocessError, ValueError, OSError) as e_probe:
+            logger.warning(f"[AUDIO_META] ffprobe 無法讀取 '{file_path}' 的長度: {e_probe}")
+    # 沒有 ffprobe 時，以檔案大小與假設的位元率粗估
+    return os.path.getsize(file_path) * 8 / (AUDIO_FALLBACK_BITRATE_KBPS * 1000), "bitrate_estimate"
+
+def record_audio_metadata_sync(file_path: str, duration_hint: Optional[float] = None) -> Dict[str, Any]:
+    file_size = os.path.getsize(file_path)
+    if duration_hint:
+        duration_seconds, duration_method = float(duration_hint), "youtube"
+    else:
+        duration_seconds, duration_method = _probe_audio_duration_sync(file_path)
     try:
         conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("UPDATE tasks SET status = ?, start_time = ? WHERE task_id = ?",
-                       ("processing", start_time_iso, task_id))
+        conn.execute(
+            "INSERT OR REPLACE INTO audio_metadata (source_path, file_size, duration_seconds, duration_method, created_at) VALUES (?, ?, ?, ?, ?)",
+            (os.path.abspath(file_path), file_size, duration_seconds, duration_method, datetime.now(timezone.utc).isoformat())
+        )
         conn.commit()
-        logger.info(f"[TASK {task_id}] 狀態更新為 'processing', 開始時間: {start_time_iso}")
     except sqlite3.Error as e_sql:
-        logger.error(f"[TASK {task_id}] [ERROR_DB] 更新任務狀態為 'processing' 時 SQLite 錯誤: {e_sql}")
-        # 如果初始狀態更新失敗，可能需要決定是否繼續任務
-        # 此處選擇繼續，但記錄錯誤
+        logger.warning(f"[AUDIO_META] [ERROR_DB] 記錄音訊長度時 SQLite 錯誤: {e_sql}")
     finally:
         if 'conn' in locals() and conn: conn.close()
+    logger.info(f"[AUDIO_META] '{os.path.basename(file_path)}' 長度 {duration_seconds:.1f} 秒 (來源: {duration_method})。")
+    return {"duration_seconds": duration_seconds, "duration_method": duration_method,
+            "estimated_input_tokens": int(duration_seconds * AUDIO_TOKENS_PER_SECOND)}
 
-    logger.info(f"[TASK {task_id}] 處理開始: {request_data.source_path} (模型: {request_data.model_id})")
+def get_audio_duration_sync(file_path: str) -> float:
+    try:
+        conn = get_db_connection()
+        row = conn.execute("SELECT file_size, duration_seconds FROM audio_metadata WHERE source_path = ?", (os.path.abspath(file_path),)).fetchone()
+    finally:
+        if 'conn' in locals() and conn: conn.close()
+    if row and os.path.isfile(file_path) and row["file_size"] == os.path.getsize(file_path):
+        return row["duration_seconds"]
+    if not os.path.isfile(file_path):
+        return 0.0 # 檔案已不存在 (例如只剩檢查點的任務)，以 0 估算
+    return record_audio_metadata_sync(file_path)["duration_seconds"]
+
+def estimate_output_tokens(duration_seconds: float, output_options: List[str]) -> int:
+    wants_transcript = "summary_transcript_tc" in output_options or "transcript_bilingual_summary" in output_options
+    summary_tokens = SUMMARY_OUTPUT_TOKENS * (2 if "transcript_bilingual_summary" in output_options else 1)
+    return int(summary_tokens + (duration_seconds * TRANSCRIPT_TOKENS_PER_SECOND if wants_transcript else 0))
+
+def estimate_for_model(model_id: str, duration_seconds: float, output_options: List[str]) -> Dict[str, Any]:
+    profile = get_model_performance_profile(model_id)
+    input_tokens = int(duration_seconds * AUDIO_TOKENS_PER_SECOND)
+    output_tokens = estimate_output_tokens(duration_seconds, output_options)
+    processing_seconds = profile["base_latency_seconds"] + input_tokens / profile["input_tokens_per_second"] + output_tokens / profile["output_tokens_per_second"]
+    cost_usd = input_tokens / 1_000_000 * profile["input_cost_per_million"] + output_tokens / 1_000_000 * profile["output_cost_per_million"]
+    return {
+        "model_id": model_id,
+        "audio_duration_seconds": round(duration_seconds, 1),
+        "estimated_input_tokens": input_tokens,
+        "estimated_output_tokens": output_tokens,
+        "estimated_processing_seconds": round(processing_seconds, 1),
+        "estimated_cost_usd": round(cost_usd, 6),
+        "meets_requirements": profile["supports_audio"] and input_tokens <= profile["max_input_tokens"] and output_tokens <= profile["max_output_tokens"]
+    }
 
-    # Removed check for global_api_key and api_key_is_valid, as api_key is now passed and configured.
-    # if not global_api_key or not api_key_is_valid:
-    #     error_message = "API 金鑰無效或未設定於背景任務啟動時。請先設定有效的 API 金鑰。"
-    #     completion_time_iso = datetime.now(timezone.utc).isoformat()
-    #     try:
-    #         conn = get_db_connection()
-    #         cursor = conn.cursor()
-    #         cursor.execute("UPDATE tasks SET status = ?, error_message = ?, completion_time = ? WHERE task_id = ?",
-    #                        ("failed", error_message, completion_time_iso, task_id))
-    #         conn.commit()
-    #     except sqlite3.Error as e_sql_fail:
-    #         logger.error(f"[TASK {task_id}] [ERROR_DB] 更新任務狀態為 'failed' (API 金鑰無效) 時 SQLite 錯誤: {e_sql_fail}")
-    #     finally:
-    #         if 'conn' in locals() and conn: conn.close()
-    #     logger.error(f"[TASK {task_id}] [ERROR] 失敗 - {error_message}"); return
-
-    try:
-        # 模擬 AI 輸出和結構化資料轉換邏輯
-        # 這裡應該是實際調用 genai API 的地方
-        # 注意：之前使用 len(tasks_db) * 0.5 的模擬延時，現在 tasks_db 不再是記憶體字典。
-        # 如果需要基於當前任務數量的延時，需要從資料庫查詢。為簡化，這裡使用固定延時。
-        await asyncio.sleep(5 + 2 * 0.5) # 假設平均有2個任務在運行
-
-        # --- 指導原則：處理同步阻塞的 AI 呼叫 ---
-        # 未來將此處的模擬操作替換為實際的 AI 模型呼叫 (例如 google-generativeai)。
-        # 由於 genai.GenerativeModel().generate_content() 是同步阻塞操作，
-        # 必須在 asyncio 事件迴圈中透過 await asyncio.to_thread() 或
-        # await loop.run_in_executor(executor, ...) 來執行，以避免阻塞伺服器。
-        # 範例:
-        # model = genai.GenerativeModel(request_data.model_id) # 假設 genai 已配置 API Key
-        #
-        # # 使用 asyncio.to_thread (Python 3.9+)
-        # # response_summary = await asyncio.to_thread(model.generate_content, "提示詞摘要: " + source_basename)
-        # # simulated_summary_text = response_summary.text
-        #
-        # # 或者使用 loop.run_in_executor (需要獲取 loop 和 executor)
-        # # loop = asyncio.get_running_loop()
-        # # response_transcript = await loop.run_in_executor(executor, model.generate_content, "提示詞逐字稿: " + source_basename)
-        # # simulated_transcript_text = response_transcript.text
-        #
-        # # 請確保 genai.configure(api_key=...) 已在應用程式啟動時或透過依賴注入有效執行。
-        # --- 結束指導原則 ---
-
-        simulated_summary_text: Optional[str] = None
-        simulated_transcript_text: Optional[str] = None
-        source_basename = os.path.basename(request_data.source_path)
+def select_auto_model(duration_seconds: float, output_options: List[str]) -> Dict[str, Any]:
+    # 在可處理音訊的預定義模型中，選擇符合輸出需求且預估最快者；若都不符合 (例如逐字稿超過輸出上限)，退而選擇最快的音訊模型
+    candidates = [estimate_for_model(model_id, duration_seconds, output_options) for model_id in PREDEFINED_MODELS_DATA_APP
+                  if get_model_performance_profile(model_id)["supports_audio"]]
+    qualified = [estimate for estimate in candidates if estimate["meets_requirements"]] or candidates
+    return min(qualified, key=lambda estimate: (estimate["estimated_processing_seconds"], estimate["estimated_cost_usd"]))
+
+def estimate_report_job_sync(source_path: str, model_id: str, output_options: List[str],
+                             model_backend: Optional[str] = None, backend_options: Optional[Dict[str, float]] = None) -> Dict[str, Any]:
+    duration_seconds = get_audio_duration_sync(source_path)
+    if model_id == AUTO_MODEL_ID:
+        estimate = {**select_auto_model(duration_seconds, output_options), "auto_selected": True}
+    else:
+        estimate = {**estimate_for_model(model_id, duration_seconds, output_options), "auto_selected": False}
+    # 本地後端的延遲由設定決定，不依模型效能估算，也不產生費用
+    backend = get_model_backend(model_backend)
+    backend_seconds = backend.estimate_processing_seconds(duration_seconds, output_options, backend_options)
+    if backend_seconds is not None:
+        estimate.update({"estimated_processing_seconds": round(backend_seconds, 1), "estimated_cost_usd": 0.0})
+    estimate["model_backend"] = backend.name
+    return estimate
+
+def _store_task_estimate(task_id: str, estimate: Dict[str, Any]):
+    try:
+        conn = get_db_connection()
+        conn.execute("UPDATE tasks SET audio_duration_seconds = ?, estimated_seconds = ?, model_id = ? WHERE task_id = ?",
+                     (estimate["audio_duration_seconds"], estimate["estimated_processing_seconds"], estimate["model_id"], task_id))
+        conn.commit()
+        notify_task_changed(task_id)
+    except sqlite3.Error as e_sql:
+        logger.warning(f"[TASK {task_id}] [ERROR_DB] 儲存處理時間預估時 SQLite 錯誤: {e_sql}")
+    finally:
+        if 'conn' in locals() and conn: conn.close()
 
-        # 根據 output_options 和 custom_prompts 生成模擬內容
-        # 這裡可以加入 genai.GenerativeModel().generate_content() 的實際呼叫
-        # 示例：
-        # model = genai.GenerativeModel(request_data.model_id)
-        # response = model.generate_content("請總結這段音訊的內容：" + source_basename, stream=False)
-        # simulated_summary_text = response.text
-
-        if "summary_tc" in request_data.output_options or "summary_transcript_tc" in request_data.output_options or "transcript_bilingual_summary" in request_data.output_options:
-            base_summary = f"這是對 '{source_basename}' 使用 '{request_data.model_id}' 模型生成的繁體中文重點摘要的開頭總結段落。\n" \
-                           f"**重點1子標題**\n- 這是第一個重點的第一個細節。\n- 這是第一個重點的第二個細節。\n" \
-                           f"**重點2子標題**\n- 這是第二個重點的第一個細節，它可能比較長一點。\n- 這是第二個重點的第二個細節。"
-            if request_data.custom_prompts and request_data.custom_prompts.get("summary_prompt"):
-                base_summary = f"根據自訂提示詞 '{request_data.custom_prompts['summary_prompt'][:50]}...' 生成的摘要：\n" + base_summary
-            simulated_summary_text = base_summary
-            if "transcript_bilingual_summary" in request_data.output_options: simulated_summary_text += "\n(This is the English part of the bilingual summary.)"
+# --- 任務階段檢查點 ---
+# 每個階段完成後把產出寫入 task_checkpoints，重啟或重試的任務會從最後一個有效的檢查點繼續，
+# 已成功的模型呼叫不必重新付費。階段依序為：
+#   acquired_audio (僅批次下載) -> audio (前處理後音訊) -> model_output (模型原始文字)
+#   -> structured (結構化資料) -> rendered (預覽 HTML 與報告檔案)
+# 任務完成時，檢查點會在與 'completed' 狀態更新相同的交易中刪除。
+def save_task_checkpoint(task_id: str, stage: str, data: Dict[str, Any]):
+    try:
+        conn = get_db_connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO task_checkpoints (task_id, stage, data, created_at) VALUES (?, ?, ?, ?)",
+            (task_id, stage, json.dumps(data, ensure_ascii=False), datetime.now(timezone.utc).isoformat())
+        )
+        conn.commit()
+        logger.info(f"[TASK {task_id}] [CHECKPOINT] 已儲存階段 '{stage}' 的檢查點。")
+    except sqlite3.Error as e_sql:
+        # 檢查點寫入失敗不影響本次執行，只是中斷後無法從此階段恢復
+        logger.warning(f"[TASK {task_id}] [CHECKPOINT] [ERROR_DB] 儲存階段 '{stage}' 的檢查點時 SQLite 錯誤: {e_sql}")
+    finally:
+        if 'conn' in locals() and conn: conn.close()
 
-        if "summary_transcript_tc" in request_data.output_options or "transcript_bilingual_summary" in request_data.output_options:
-            base_transcript = f"這是 '{source_basename}' 的模擬逐字稿內容的第一段。\n" \
-                              f"這是第二段。\n發言者A：模擬對話開始。\n發言者B：好的。\n第五段，觸發分隔線。\n第六段。"
+def load_task_checkpoints(task_id: str) -> Dict[str, Dict[str, Any]]:
+    checkpoints = {}
+    try:
+        conn = get_db_connection()
+        for row in conn.execute("SELECT stage, data FROM task_checkpoints WHERE task_id = ?", (task_id,)).fetchall():
+            try:
+                checkpoints[row["stage"]] = json.loads(row["data"])
+            except json.JSONDecodeError:
+                logger.warning(f"[TASK {task_id}] [CHECKPOINT] 階段 '{row['stage']}' 的檢查點 JSON 無法解析，將重新執行該階段。")
+    except sqlite3.Error as e_sql:
+        logger.warning(f"[TASK {task_id}] [CHECKPOINT] [ERROR_DB] 讀取檢查點時 SQLite 錯誤: {e_sql}")
+    finally:
+        if 'conn' in locals() and conn: conn.close()
+    return checkpoints
+
+def _report_files_exist(download_links: Dict[str, str]) -> bool:
+    return bool(download_links) and all(
+        os.path.isfile(os.path.join(GENERATED_REPORTS_DIR, os.path.basename(link))) for link in download_links.values()
+    )
+
+# --- 獨立報告的關鍵 CSS ---
+# 下載的 HTML 報告不再連結 /static/style.css 與外部 CDN，而是只把會套用到報告內容的規則內嵌進 <style>，
+# 離線或在其他主機上開啟時也能立即正確顯示。規則的選取方式：選擇器中出現的 class / id 都存在於報告中。
+REPORT_PAGE_TEMPLATE = """<!DOCTYPE html><html lang="zh-Hant"><head><meta charset="UTF-8"><meta name="viewport" content="width=device-width, initial-scale=1.0"><title>{title}</title><style>{critical_css}</style></head><body class="dark-mode"><div class="container content-wrapper" style="padding-top: 20px; padding-bottom: 20px;"><section id="report-output-area" class="card animated" style="margin-bottom:0;">{content}</section></div></body></html>"""
+
+@functools.lru_cache(maxsize=8)
+def _parse_css_blocks(css_text: str) -> tuple:
+    # 將 CSS 拆成頂層的 (前導, 區塊內容) 列表；@media 等巢狀區塊的內容保持原樣，由呼叫端遞迴處理
+    css_text = re.sub(r"/\*.*?\*/", "", css_text, flags=re.DOTALL)
+    blocks = []
+    position = 0
+    while True:
+        open_brace = css_text.find("{", position)
+        if open_brace == -1:
+            break
+        prelude = css_text[position:open_brace]
+        if ";" in prelude: # 略過 @import / @charset 等沒有區塊的陳述式
+            prelude = prelude[prelude.rfind(";") + 1:]
+        depth = 1
+        cursor_index = open_brace + 1
+        while depth and cursor_index < len(css_text):
+            depth += {"{": 1, "}": -1}.get(css_text[cursor_index], 0)
+            cursor_index += 1
+        blocks.append((" ".join(prelude.split()), css_text[open_brace + 1:cursor_index - 1]))
+        position = cursor_index
+    return tuple(blocks)
+
+def _select_critical_css(css_text: str, used_classes: set, used_ids: set) -> List[str]:
+    selected_rules = []
+    for prelude, body in _parse_css_blocks(css_text):
+        if prelude.startswith(("@media", "@supports")):
+            inner_rules = _select_critical_css(body, used_classes, used_ids)
+            if inner_rules:
+                selected_rules.append(f"{prelude}{{{''.join(inner_rules)}}}")
+        elif prelude.startswith("@"):
+            continue # @keyframes 由呼叫端依是否被引用另外加入；@font-face 等不需要
+        else:
+            matching_selectors = [selector.strip() for selector in prelude.split(",")
+                                  if set(re.findall(r"\.([\w-]+)", selector)) <= used_classes and set(re.findall(r"#([\w-]+)", selector)) <= used_ids]
+            if matching_selectors:
+                selected_rules.append(f"{','.join(matching_selectors)}{{{' '.join(body.split())}}}")
+    return selected_rules
+
+def build_report_critical_css(css_text: str, page_html: str) -> str:
+    used_classes = {name for class_attr in re.findall(r"class=['\"]([^'\"]*)['\"]", page_html) for name in class_attr.split()}
+    used_ids = set(re.findall(r"id=['\"]([^'\"]*)['\"]", page_html))
+    critical_css = "".join(_select_critical_css(css_text, used_classes, used_ids))
+    for prelude, body in _parse_css_blocks(css_text):
+        keyframes_match = re.match(r"@(?:-webkit-)?keyframes\s+([\w-]+)", prelude)
+        if keyframes_match and keyframes_match.group(1) in critical_css:
+            critical_css += f"{prelude}{{{' '.join(body.split())}}}"
+    return critical_css
+
+# 報告內容中的 Font Awesome 圖示只是裝飾；獨立報告不載入 Font Awesome (內嵌字型檔太大)，因此直接移除，避免顯示成空白方框
+FONT_AWESOME_ICON_PATTERN = re.compile(r"<i class=['\"]fa[srb]? [^'\"]*['\"]></i>\s*")
+
+def render_standalone_report_page(report_title: str, preview_html: str) -> str:
+    preview_html = FONT_AWESOME_ICON_PATTERN.sub("", preview_html)
+    page_without_css = REPORT_PAGE_TEMPLATE.format(title=html.escape(report_title), critical_css="", content=preview_html)
+    critical_css = build_report_critical_css(static_assets.read_text("style.css"), page_without_css)
+    return REPORT_PAGE_TEMPLATE.format(title=html.escape(report_title), critical_css=critical_css, content=preview_html)
+
+# --- 模型後端 ---
+# 分析階段透過 ModelBackend 介面呼叫模型，任務以 model_backend 欄位選擇，未指定時使用 APP_MODEL_BACKEND：
+#   gemini：以金鑰池中各金鑰自己的 GenerativeServiceClient 呼叫 generate_content (音訊以 inline_data 傳送，
+#           超過 GEMINI_INLINE_AUDIO_MAX_BYTES 時改以 File API 上傳後引用)
+#   local：不連網、結果完全由輸入決定的本地後端，延遲與輸出大小可調，用來量測排程、解析、渲染與資料庫
+#          本身的吞吐上限，與上游模型延遲分開做容量規劃
+# 兩者的輸出格式相同 (摘要：首行總結、**子標題**、- 細節；逐字稿：每行一段，「發言者X：」開頭為發言行)，
+# 後續的結構化與渲染階段不需要知道使用的是哪個後端。
+def _wants_summary_output(output_options: List[str]) -> bool:
+    return any(option in output_options for option in ("summary_tc", "summary_transcript_tc", "transcript_bilingual_summary"))
+
+def _wants_transcript_output(output_options: List[str]) -> bool:
+    return any(option in output_options for option in ("summary_transcript_tc", "transcript_bilingual_summary"))
+
+class ModelBackend(abc.ABC):
+    name = "base"
+    requires_api_key = False
+
+    def validate_options(self, backend_options: Optional[Dict[str, float]]):
+        if backend_options:
+            raise ValueError(f"模型後端 '{self.name}' 不接受 backend_options。")
+
+    def estimate_processing_seconds(self, duration_seconds: float, output_options: List[str], backend_options: Optional[Dict[str, float]]) -> Optional[float]:
+        return None # None 表示依模型效能設定檔估算
+
+    @abc.abstractmethod
+    async def generate(self, request_data: "GenerateReportRequest", analysis_audio_path: str, key_pool: ApiKeyPool) -> Dict[str, Optional[str]]:
+        """回傳 {"summary_text": ..., "transcript_text": ...}；未要求的輸出為 None。"""
+
+class GeminiModelBackend(ModelBackend):
+    name = "gemini"
+    requires_api_key = True
+
+    @staticmethod
+    def _build_prompts(request_data: "GenerateReportRequest") -> Dict[str, str]:
+        custom_prompts = request_data.custom_prompts or {}
+        bilingual = "transcript_bilingual_summary" in request_data.output_options
+        prompts = {}
+        if _wants_summary_output(request_data.output_options):
+            prompts["summary_text"] = (
+                (custom_prompts.get("summary_prompt") or "請聆聽這段音訊，以繁體中文整理重點摘要。") +
+                "\n輸出格式：第一行是一段總結；接著每個重點以單獨一行的 **子標題** 開始，其下每個細節一行並以 \"- \" 開頭。不要輸出其他說明文字。" +
+                ("\n最後一行以 \"(This is the English part of the bilingual summary.)\" 開頭，接著在同一行寫出英文摘要。" if bilingual else "")
+            )
+        if _wants_transcript_output(request_data.output_options):
+            prompts["transcript_text"] = (
+                (custom_prompts.get("transcript_prompt") or "請將這段音訊完整轉錄為繁體中文逐字稿。") +
+                "\n輸出格式：每個段落一行；能分辨發言者時，該行以「發言者A：」、「發言者B：」等開頭。不要輸出其他說明文字。" +
+                ("\n第一行固定輸出 \"(Original Language Transcript)\"，接著以原始語言轉錄。" if bilingual else "")
+            )
+        return prompts
+
+    @staticmethod
+    def _load_audio_part_sync(analysis_audio_path: str):
+        mime_type = mimetypes.guess_type(analysis_audio_path)[0] or "audio/mpeg"
+        with open(analysis_audio_path, "rb") as f:
+            return glm.Part(inline_data=glm.Blob(mime_type=mime_type, data=f.read()))
+
+    @staticmethod
+    def _delete_uploaded_file_sync(key_state: ApiKeyState, file_name: str):
+        try:
+            key_state.file_client().delete_file(name=file_name)
+        except Exception as e_delete:
+            logger.warning(f"[GEMINI] 刪除 File API 暫存音訊 {file_name} 時發生錯誤 (48 小時後會自動過期): {e_delete}")
+
+    @classmethod
+    def _upload_audio_file_sync(cls, key_state: ApiKeyState, analysis_audio_path: str):
+        # 上傳的檔案只屬於該金鑰所在的專案，因此之後必須以同一把金鑰引用
+        mime_type = mimetypes.guess_type(analysis_audio_path)[0] or "audio/mpeg"
+        file_client = key_state.file_client()
+        uploaded_file = file_client.create_file(analysis_audio_path, mime_type=mime_type, display_name=os.path.basename(analysis_audio_path))
+        logger.info(f"[GEMINI] 音訊 '{os.path.basename(analysis_audio_path)}' 超過 inline 上限，已以金鑰 {key_state.label} 上傳至 File API ({uploaded_file.name})。")
+        try:
+            deadline = time.monotonic() + GEMINI_FILE_PROCESSING_TIMEOUT_SECONDS
+            while uploaded_file.state == glm.File.State.PROCESSING:
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"File API 處理音訊 {uploaded_file.name} 超過 {GEMINI_FILE_PROCESSING_TIMEOUT_SECONDS:.0f} 秒。")
+                time.sleep(GEMINI_FILE_POLL_INTERVAL_SECONDS)
+                uploaded_file = file_client.get_file(name=uploaded_file.name)
+            if uploaded_file.state != glm.File.State.ACTIVE:
+                raise RuntimeError(f"File API 無法處理上傳的音訊 {uploaded_file.name}: {uploaded_file.error.message}")
+        except Exception:
+            cls._delete_uploaded_file_sync(key_state, uploaded_file.name)
+            raise
+        return uploaded_file
+
+    @staticmethod
+    def _response_text(response) -> str:
+        if not response.candidates or not response.candidates[0].content.parts:
+            raise RuntimeError(f"模型未回傳任何內容 (prompt_feedback: {response.prompt_feedback})。")
+        return "".join(part.text for part in response.candidates[0].content.parts).strip()
+
+    async def generate(self, request_data: "GenerateReportRequest", analysis_audio_path: str, key_pool: ApiKeyPool) -> Dict[str, Optional[str]]:
+        audio_size = await asyncio.to_thread(os.path.getsize, analysis_audio_path)
+        inline_audio_part = await asyncio.to_thread(self._load_audio_part_sync, analysis_audio_path) if audio_size <= GEMINI_INLINE_AUDIO_MAX_BYTES else None
+        uploaded_files: Dict[ApiKeyState, Any] = {} # 大型音訊：每把用到的金鑰各上傳一次，所有輸出共用，結束後刪除
+        model_name = request_data.model_id if request_data.model_id.startswith("models/") else f"models/{request_data.model_id}"
+        outputs: Dict[str, Optional[str]] = {"summary_text": None, "transcript_text": None}
+        try:
+            for output_key, prompt in self._build_prompts(request_data).items():
+                async def _call_model(key_state: ApiKeyState, prompt=prompt):
+                    audio_part = inline_audio_part
+                    if audio_part is None:
+                        if key_state not in uploaded_files:
+                            uploaded_files[key_state] = await asyncio.to_thread(self._upload_audio_file_sync, key_state, analysis_audio_path)
+                        uploaded_file = uploaded_files[key_state]
+                        audio_part = glm.Part(file_data=glm.FileData(mime_type=uploaded_file.mime_type, file_uri=uploaded_file.uri))
+                    generate_request = glm.GenerateContentRequest(
+                        model=model_name,
+                        contents=[glm.Content(role="user", parts=[glm.Part(text=prompt), audio_part])]
+                    )
+                    # 用戶端的 generate_content() 是同步阻塞呼叫，必須在執行緒中執行；遇到速率限制時 key_pool.run 會改用下一把金鑰
+                    return await asyncio.to_thread(key_state.generative_client().generate_content, generate_request, timeout=GEMINI_REQUEST_TIMEOUT_SECONDS)
+                outputs[output_key] = self._response_text(await key_pool.run(_call_model))
+        finally:
+            for key_state, uploaded_file in uploaded_files.items():
+                await asyncio.to_thread(self._delete_uploaded_file_sync, key_state, uploaded_file.name)
+        return outputs
+
+class LocalModelBackend(ModelBackend):
+    name = "local"
+    requires_api_key = False
+    _PHRASES = ("本段說明了研究背景與動機", "講者比較了幾種不同的方法", "實驗結果顯示效能明顯提升", "這個觀點需要更多資料佐證",
+                "接下來討論實際應用時的限制", "重要的是理解其中的假設", "資料前處理對結果影響很大", "最後總結了未來的研究方向")
+
+    def _settings(self, backend_options: Optional[Dict[str, float]]) -> Dict[str, float]:
+        settings = {
+            "latency_seconds": LOCAL_BACKEND_LATENCY_SECONDS,
+            "latency_per_audio_minute": LOCAL_BACKEND_LATENCY_PER_AUDIO_MINUTE,
+            "summary_items": LOCAL_BACKEND_SUMMARY_ITEMS,
+            "transcript_paragraphs": LOCAL_BACKEND_TRANSCRIPT_PARAGRAPHS,
+            "paragraph_chars": LOCAL_BACKEND_PARAGRAPH_CHARS
+        }
+        settings.update(backend_options or {})
+        return settings
+
+    def validate_options(self, backend_options: Optional[Dict[str, float]]):
+        unknown_options = set(backend_options or {}) - set(self._settings(None))
+        if unknown_options:
+            raise ValueError(f"本地後端不支援的 backend_options: {sorted(unknown_options)}")
+        if any(value < 0 for value in (backend_options or {}).values()):
+            raise ValueError("backend_options 的數值不可為負數。")
+
+    def estimate_processing_seconds(self, duration_seconds: float, output_options: List[str], backend_options: Optional[Dict[str, float]]) -> Optional[float]:
+        settings = self._settings(backend_options)
+        return settings["latency_seconds"] + settings["latency_per_audio_minute"] * duration_seconds / 60
+
+    def _filler(self, rng: random.Random, target_chars: int) -> str:
+        text = ""
+        while len(text) < target_chars:
+            text += rng.choice(self._PHRASES) + "，"
+        return text[:max(target_chars, 1) - 1] + "。"
+
+    async def generate(self, request_data: "GenerateReportRequest", analysis_audio_path: str, key_pool: ApiKeyPool) -> Dict[str, Optional[str]]:
+        settings = self._settings(request_data.backend_options)
+        duration_seconds = await asyncio.to_thread(get_audio_duration_sync, analysis_audio_path) if settings["latency_per_audio_minute"] else 0.0
+        await asyncio.sleep(self.estimate_processing_seconds(duration_seconds, request_data.output_options, request_data.backend_options))
+
+        # 內容只由音訊來源與模型決定：調整延遲或其他 backend_options 時仍得到相同的文字，不同次的基準測試才能互相比較
+        source_basename = os.path.basename(request_data.source_path)
+        seed_material = json.dumps([source_basename, request_data.model_id])
+        rng = random.Random(hashlib.sha256(seed_material.encode("utf-8")).hexdigest())
+        paragraph_chars = int(settings["paragraph_chars"])
+        bilingual = "transcript_bilingual_summary" in request_data.output_options
+        summary_text: Optional[str] = None
+        transcript_text: Optional[str] = None
+
+        if _wants_summary_output(request_data.output_options):
+            summary_lines = [f"這是對 '{source_basename}' 使用 '{request_data.model_id}' 模型生成的繁體中文重點摘要的開頭總結段落。"]
+            if request_data.custom_prompts and request_data.custom_prompts.get("summary_prompt"):
+                summary_lines[0] = f"根據自訂提示詞 '{request_data.custom_prompts['summary_prompt'][:50]}...' 生成的摘要：{summary_lines[0]}"
+            for item_index in range(1, int(settings["summary_items"]) + 1):
+                summary_lines.append(f"**重點{item_index}子標題**")
+                summary_lines.extend(f"- {self._filler(rng, paragraph_chars)}" for _ in range(2))
+            if bilingual:
+                summary_lines.append("(This is the English part of the bilingual summary.)")
+            summary_text = "\n".join(summary_lines)
+
+        if _wants_transcript_output(request_data.output_options):
+            transcript_lines = [f"(Original Language Transcript for '{source_basename}')"] if bilingual else []
             if request_data.custom_prompts and request_data.custom_prompts.get("transcript_prompt"):
-                base_transcript = f"根據自訂提示詞 '{request_data.custom_prompts['transcript_prompt'][:50]}...' 生成的逐字稿：\n" + base_transcript
-            simulated_transcript_text = base_transcript
-            if "transcript_bilingual_summary" in request_data.output_options: simulated_transcript_text = f"(Original Language Transcript for '{source_basename}')\n" + simulated_transcript_text
-
-        # 轉換為結構化資料
-        structured_summary_data = None
-        if simulated_summary_text:
-            lines = simulated_summary_text.strip().split('\n')
-            intro = lines.pop(0) if lines else ""
-            bilingual_append_text = None
-            if "transcript_bilingual_summary" in request_data.output_options and lines and "(This is the English part" in lines[-1]:
-                bilingual_append_text = lines.pop(-1)
-            items = []
-            current_item_details = []
-            current_subtitle = None
-            for line in lines:
-                if line.startswith("**") and line.endswith("**"):
-                    if current_subtitle:
-                        items.append({"subtitle": current_subtitle.strip('*'), "details": list(current_item_details)})
-                    current_subtitle = line.strip('*')
-                    current_item_details.clear()
-                elif line.startswith("- ") and current_subtitle:
-                    current_item_details.append(line[2:])
-                elif current_subtitle and current_item_details: # 處理多行細節
-                    current_item_details[-1] += "\n" + line
-                elif current_subtitle: # 處理沒有 - 開頭的細節
-                    current_item_details.append(line)
-
-            if current_subtitle: # 添加最後一個項目
+                transcript_lines.append(f"根據自訂提示詞 '{request_data.custom_prompts['transcript_prompt'][:50]}...' 生成的逐字稿：")
+            for paragraph_index in range(int(settings["transcript_paragraphs"])):
+                speaker_prefix = f"發言者{'AB'[paragraph_index // 3 % 2]}：" if paragraph_index % 3 == 2 else ""
+                transcript_lines.append(speaker_prefix + self._filler(rng, paragraph_chars))
+            transcript_text = "\n".join(transcript_lines)
+
+        return {"summary_text": summary_text, "transcript_text": transcript_text}
+
+MODEL_BACKENDS: Dict[str, ModelBackend] = {backend.name: backend for backend in (GeminiModelBackend(), LocalModelBackend())}
+
+def get_model_backend(backend_name: Optional[str]) -> ModelBackend:
+    # 未指定時使用設定檔的預設值；名稱不存在時拋出 ValueError，由呼叫端轉為 400
+    resolved_name = (backend_name or MODEL_BACKEND).lower()
+    if resolved_name not in MODEL_BACKENDS:
+        raise ValueError(f"未知的模型後端 '{resolved_name}'，可用的後端: {sorted(MODEL_BACKENDS)}")
+    return MODEL_BACKENDS[resolved_name]
+
+# --- 報告生成各階段 ---
+async def _generate_model_output(request_data: GenerateReportRequest, analysis_audio_path: str, key_pool: ApiKeyPool) -> Dict[str, Optional[str]]:
+    backend = get_model_backend(request_data.model_backend)
+    return await backend.generate(request_data, analysis_audio_path, key_pool)
+
+def _build_structured_summary_data(summary_text: Optional[str], output_options: List[str]) -> Optional[Dict]:
+    if not summary_text:
+        return None
+    lines = summary_text.strip().split('\n')
+    intro = lines.pop(0) if lines else ""
+    bilingual_append_text = None
+    if "transcript_bilingual_summary" in output_options and lines and "(This is the English part" in lines[-1]:
+        bilingual_append_text = lines.pop(-1)
+    items = []
+    current_item_details = []
+    current_subtitle = None
+    for line in lines:
+        if line.startswith("**") and line.endswith("**"):
+            if current_subtitle:
                 items.append({"subtitle": current_subtitle.strip('*'), "details": list(current_item_details)})
-            structured_summary_data = {"intro_paragraph": intro, "items": items, "bilingual_append": bilingual_append_text}
-
-        structured_transcript_data = None
-        if simulated_transcript_text:
-            paragraphs_raw = simulated_transcript_text.strip().split('\n')
-            hr_interval = 5
-            formatted_paragraphs = []
-            bilingual_prepend_text = None
-            if "transcript_bilingual_summary" in request_data.output_options and paragraphs_raw and paragraphs_raw[0].startswith("(Original Language Transcript"):
-                bilingual_prepend_text = paragraphs_raw.pop(0)
-            for i, p_text in enumerate(paragraphs_raw):
-                if p_text.strip():
-                    match = re.match(r"^(發言者\s?[A-Za-z0-9]+)[:：]\s*(.*)", p_text)
-                    formatted_paragraphs.append({
-                        "content": match.group(2) if match else p_text,
-                        "is_speaker_line": bool(match),
-                        "speaker": match.group(1) if match else None,
-                        "insert_hr_after": (i + 1) % hr_interval == 0 and i < len(paragraphs_raw) - 1
-                    })
-            structured_transcript_data = {"bilingual_prepend": bilingual_prepend_text, "paragraphs": formatted_paragraphs}
-
-        # 檔案生成邏輯
+            current_subtitle = line.strip('*')
+            current_item_details.clear()
+        elif line.startswith("- ") and current_subtitle:
+            current_item_details.append(line[2:])
+        elif current_subtitle and current_item_details: # 處理多行細節
+            current_item_details[-1] += "\n" + line
+        elif current_subtitle: # 處理沒有 - 開頭的細節
+            current_item_details.append(line)
+
+    if current_subtitle: # 添加最後一個項目
+        items.append({"subtitle": current_subtitle.strip('*'), "details": list(current_item_details)})
+    return {"intro_paragraph": intro, "items": items, "bilingual_append": bilingual_append_text}
+
+def _build_structured_transcript_data(transcript_text: Optional[str], output_options: List[str]) -> Optional[Dict]:
+    if not transcript_text:
+        return None
+    paragraphs_raw = transcript_text.strip().split('\n')
+    hr_interval = 5
+    formatted_paragraphs = []
+    bilingual_prepend_text = None
+    if "transcript_bilingual_summary" in output_options and paragraphs_raw and paragraphs_raw[0].startswith("(Original Language Transcript"):
+        bilingual_prepend_text = paragraphs_raw.pop(0)
+    for i, p_text in enumerate(paragraphs_raw):
+        if p_text.strip():
+            match = re.match(r"^(發言者\s?[A-Za-z0-9]+)[:：]\s*(.*)", p_text)
+            formatted_paragraphs.append({
+                "content": match.group(2) if match else p_text,
+                "is_speaker_line": bool(match),
+                "speaker": match.group(1) if match else None,
+                "insert_hr_after": (i + 1) % hr_interval == 0 and i < len(paragraphs_raw) - 1
+            })
+    return {"bilingual_prepend": bilingual_prepend_text, "paragraphs": formatted_paragraphs}
+
+def _render_report_files(task_id: str, report_title: str, preview_html: str, structured_summary_data: Optional[Dict],
+                         structured_transcript_data: Optional[Dict], request_data: GenerateReportRequest,
+                         written_report_paths: List[str]) -> Dict[str, str]:
+    source_basename = os.path.basename(request_data.source_path)
+    # 加上 task_id 前綴：同一秒內完成、來源與模型相同的任務不會互相覆寫報告檔案
+    base_report_filename = f"{sanitize_base_filename(source_basename, 30)}_{sanitize_base_filename(request_data.model_id.replace('models/', ''), 40)}_{datetime.now().strftime('%Y%m%d%H%M%S')}_{task_id[:8]}"
+    download_links = {}
+
+    # 生成完整的 HTML 報告
+    full_html_content = render_standalone_report_page(report_title, preview_html) # 內嵌關鍵 CSS，不依賴伺服器或 CDN
+    html_file_path = os.path.join(GENERATED_REPORTS_DIR, f"{base_report_filename}.html")
+    _raise_if_task_cancelled(task_id, "任務已取消，停止寫出報告檔案。")
+    try:
+        written_report_paths.append(html_file_path)
+        with open(html_file_path, "w", encoding="utf-8") as f:
+            f.write(full_html_content)
+        download_links["html"] = f"/generated_reports/{os.path.basename(html_file_path)}"
+    except Exception as e:
+        logger.error(f"[TASK {task_id}] [ERROR] 儲存 HTML 報告時發生錯誤: {e}")
+
+    # 生成 Markdown 報告
+    if "md" in request_data.output_options:
+        md_parts = [f"# {report_title}\n\n"]
+        if structured_summary_data:
+            md_parts.extend(
+                [f"## 重點摘要\n\n{structured_summary_data['intro_paragraph']}\n\n" if structured_summary_data.get('intro_paragraph') else "## 重點摘要\n\n"] +
+                [f"### {item['subtitle']}\n" + "".join([f"- {d}\n" for d in item.get('details', [])]) + "\n" for item in structured_summary_data.get('items', [])] +
+                ([f"{structured_summary_data['bilingual_append']}\n\n"] if structured_summary_data.get('bilingual_append') else [])
+            )
+        if structured_transcript_data:
+            md_parts.extend(
+                ["## 逐字稿\n\n"] +
+                ([f"{structured_transcript_data['bilingual_prepend']}\n\n"] if structured_transcript_data.get('bilingual_prepend') else []) +
+                [f"**{p['speaker']}:** {p['content']}\n\n" if p["is_speaker_line"] else f"{p['content']}\n\n" for p in structured_transcript_data.get('paragraphs', [])]
+            )
+        md_file_path = os.path.join(GENERATED_REPORTS_DIR, f"{base_report_filename}.md")
+        _raise_if_task_cancelled(task_id, "任務已取消，停止寫出報告檔案。")
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute("UPDATE tasks SET status = ? WHERE task_id = ?", ("generating_report", task_id))
-            conn.commit()
-            logger.info(f"[TASK {task_id}] 狀態更新為 'generating_report'")
-        except sqlite3.Error as e_sql_gen_report_status:
-            logger.warning(f"[TASK {task_id}] [ERROR_DB] 更新任務狀態為 'generating_report' 時 SQLite 錯誤: {e_sql_gen_report_status}")
-        finally:
-            if 'conn' in locals() and conn: conn.close()
+            written_report_paths.append(md_file_path)
+            with open(md_file_path, "w", encoding="utf-8") as f:
+                f.write("".join(md_parts))
+            download_links["md"] = f"/generated_reports/{os.path.basename(md_file_path)}"
+        except Exception as e:
+            logger.error(f"[TASK {task_id}] [ERROR] 儲存 Markdown 報告錯誤: {e}")
+
+    # 生成 TXT 報告
+    if "txt" in request_data.output_options:
+        txt_parts = [f"{report_title}\n\n"]
+        if structured_summary_data:
+            txt_parts.extend(
+                ["重點摘要\n--------------------\n"] +
+                ([f"{structured_summary_data['intro_paragraph']}\n\n"] if structured_summary_data.get('intro_paragraph') else []) +
+                [f"{item['subtitle']}\n" + "".join([f"  - {d}\n" for d in item.get('details', [])]) + "\n" for item in structured_summary_data.get('items', [])] +
+                ([f"{structured_summary_data['bilingual_append']}\n\n"] if structured_summary_data.get('bilingual_append') else [])
+            )
+        if structured_transcript_data:
+            txt_parts.extend(
+                ["逐字稿\n--------------------\n"] +
+                ([f"{structured_transcript_data['bilingual_prepend']}\n\n"] if structured_transcript_data.get('bilingual_prepend') else []) +
+                [f"{p['speaker']}: {p['content']}\n\n" if p["is_speaker_line"] else f"{p['content']}\n\n" for p in structured_transcript_data.get('paragraphs', [])]
+            )
+        txt_file_path = os.path.join(GENERATED_REPORTS_DIR, f"{base_report_filename}.txt")
+        _raise_if_task_cancelled(task_id, "任務已取消，停止寫出報告檔案。")
+        try:
+            written_report_paths.append(txt_file_path)
+            with open(txt_file_path, "w", encoding="utf-8") as f:
+                f.write("".join(txt_parts))
+            download_links["txt"] = f"/generated_reports/{os.path.basename(txt_file_path)}"
+        except Exception as e:
+            logger.error(f"[TASK {task_id}] [ERROR] 儲存 TXT 報告錯誤: {e}")
 
-        await asyncio.sleep(1) # 模擬生成報告的時間
+    return download_links
 
-        report_title = f"'{source_basename}' 的 AI 分析報告"
-        preview_html = generate_html_report_content_via_jinja(report_title, structured_summary_data, structured_transcript_data, request_data.model_id)
+def _update_task_status(task_id: str, new_status: str):
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute("UPDATE tasks SET status = ? WHERE task_id = ?", (new_status, task_id))
+        conn.commit()
+        notify_task_changed(task_id)
+        logger.info(f"[TASK {task_id}] 狀態更新為 '{new_status}'")
+    except sqlite3.Error as e_sql_status:
+        logger.warning(f"[TASK {task_id}] [ERROR_DB] 更新任務狀態為 '{new_status}' 時 SQLite 錯誤: {e_sql_status}")
+    finally:
+        if 'conn' in locals() and conn: conn.close()
 
-        base_report_filename = f"{sanitize_base_filename(source_basename, 30)}_{request_data.model_id}_{datetime.now().strftime('%Y%m%d%H%M%S')}"
-        download_links = {}
+def _mark_task_started_sync(task_id: str, initial_status: str):
+    start_time_iso = datetime.now(timezone.utc).isoformat()
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute("UPDATE tasks SET status = ?, start_time = ? WHERE task_id = ?",
+                       (initial_status, start_time_iso, task_id))
+        conn.commit()
+        notify_task_changed(task_id)
+        logger.info(f"[TASK {task_id}] 狀態更新為 '{initial_status}', 開始時間: {start_time_iso}")
+    except sqlite3.Error as e_sql:
+        logger.error(f"[TASK {task_id}] [ERROR_DB] 更新任務狀態為 '{initial_status}' 時 SQLite 錯誤: {e_sql}")
+        # 如果初始狀態更新失敗，可能需要決定是否繼續任務
+        # 此處選擇繼續，但記錄錯誤
+    finally:
+        if 'conn' in locals() and conn: conn.close()
 
-        # 生成完整的 HTML 報告
-        full_html_content = f"""<!DOCTYPE html><html lang="zh-Hant"><head><meta charset="UTF-8"><meta name="viewport" content="width=device-width, initial-scale=1.0"><title>{report_title}</title><link rel="stylesheet" href="/static/style.css"><link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0-beta3/css/all.min.css"></head><body class="dark-mode"><div class="container content-wrapper" style="padding-top: 20px; padding-bottom: 20px;"><section class="card animated" style="margin-bottom:0;">{preview_html}</section></div></body></html>"""
-        html_file_path = os.path.join(GENERATED_REPORTS_DIR, f"{base_report_filename}.html")
-        try:
-            with open(html_file_path, "w", encoding="utf-8") as f:
-                f.write(full_html_content)
-            download_links["html"] = f"/generated_reports/{os.path.basename(html_file_path)}"
-        except Exception as e:
-            logger.error(f"[TASK {task_id}] [ERROR] 儲存 HTML 報告時發生錯誤: {e}")
-
-        # 生成 Markdown 報告
-        if "md" in request_data.output_options:
-            md_parts = [f"# {report_title}\n\n"]
-            if structured_summary_data:
-                md_parts.extend(
-                    [f"## 重點摘要\n\n{structured_summary_data['intro_paragraph']}\n\n" if structured_summary_data.get('intro_paragraph') else "## 重點摘要\n\n"] +
-                    [f"### {item['subtitle']}\n" + "".join([f"- {d}\n" for d in item.get('details', [])]) + "\n" for item in structured_summary_data.get('items', [])] +
-                    ([f"{structured_summary_data['bilingual_append']}\n\n"] if structured_summary_data.get('bilingual_append') else [])
-                )
-            if structured_transcript_data:
-                md_parts.extend(
-                    ["## 逐字稿\n\n"] +
-                    ([f"{structured_transcript_data['bilingual_prepend']}\n\n"] if structured_transcript_data.get('bilingual_prepend') else []) +
-                    [f"**{p['speaker']}:** {p['content']}\n\n" if p["is_speaker_line"] else f"{p['content']}\n\n" for p in structured_transcript_data.get('paragraphs', [])]
-                )
-            md_file_path = os.path.join(GENERATED_REPORTS_DIR, f"{base_report_filename}.md")
-            try:
-                with open(md_file_path, "w", encoding="utf-8") as f:
-                    f.write("".join(md_parts))
-                download_links["md"] = f"/generated_reports/{os.path.basename(md_file_path)}"
-            except Exception as e:
-                logger.error(f"[TASK {task_id}] [ERROR] 儲存 Markdown 報告錯誤: {e}")
-
-        # 生成 TXT 報告
-        if "txt" in request_data.output_options:
-            txt_parts = [f"{report_title}\n\n"]
-            if structured_summary_data:
-                txt_parts.extend(
-                    ["重點摘要\n--------------------\n"] +
-                    ([f"{structured_summary_data['intro_paragraph']}\n\n"] if structured_summary_data.get('intro_paragraph') else []) +
-                    [f"{item['subtitle']}\n" + "".join([f"  - {d}\n" for d in item.get('details', [])]) + "\n" for item in structured_summary_data.get('items', [])] +
-                    ([f"{structured_summary_data['bilingual_append']}\n\n"] if structured_summary_data.get('bilingual_append') else [])
-                )
-            if structured_transcript_data:
-                txt_parts.extend(
-                    ["逐字稿\n--------------------\n"] +
-                    ([f"{structured_transcript_data['bilingual_prepend']}\n\n"] if structured_transcript_data.get('bilingual_prepend') else []) +
-                    [f"{p['speaker']}: {p['content']}\n\n" if p["is_speaker_line"] else f"{p['content']}\n\n" for p in structured_transcript_data.get('paragraphs', [])]
-                )
-            txt_file_path = os.path.join(GENERATED_REPORTS_DIR, f"{base_report_filename}.txt")
-            try:
-                with open(txt_file_path, "w", encoding="utf-8") as f:
-                    f.write("".join(txt_parts))
-                download_links["txt"] = f"/generated_reports/{os.path.basename(txt_file_path)}"
-            except Exception as e:
-                logger.error(f"[TASK {task_id}] [ERROR] 儲存 TXT 報告錯誤: {e}")
+def _render_report_stage_sync(task_id: str, report_title: str, structured_summary_data: Optional[Dict],
+                              structured_transcript_data: Optional[Dict], request_data: GenerateReportRequest,
+                              written_report_paths: List[str]) -> Dict[str, Any]:
+    # 模板渲染與檔案寫出都是阻塞操作，整段在執行緒中執行，並在每次寫檔前檢查取消旗標
+    preview_html = generate_html_report_content_via_jinja(report_title, structured_summary_data, structured_transcript_data, request_data.model_id)
+    download_links = _render_report_files(task_id, report_title, preview_html, structured_summary_data,
+                                          structured_transcript_data, request_data, written_report_paths)
+    rendered_checkpoint = {"preview_html": preview_html, "download_links": download_links}
+    save_task_checkpoint(task_id, "rendered", rendered_checkpoint)
+    return rendered_checkpoint
+
+def _mark_task_completed_sync(task_id: str, source_basename: str, preview_html: str, download_links: Dict[str, str],
+                              structured_checkpoint: Optional[Dict[str, Any]]):
+    completion_time_iso = datetime.now(timezone.utc).isoformat()
+    download_links_json = json.dumps(download_links)
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            "UPDATE tasks SET status = ?, result_preview_html = ?, download_links = ?, completion_time = ? WHERE task_id = ?",
+            ("completed", preview_html, download_links_json, completion_time_iso, task_id)
+        )
+        if structured_checkpoint is not None:
+            index_report_for_search(cursor, task_id, source_basename, structured_checkpoint.get("summary_data"), structured_checkpoint.get("transcript_data"))
+        cursor.execute("DELETE FROM task_checkpoints WHERE task_id = ?", (task_id,)) # 結果已完整保存，不再需要檢查點
+        conn.commit()
+        notify_task_changed(task_id)
+        logger.info(f"[TASK {task_id}] [SUCCESS] 處理完成。結果已存入資料庫。")
+    except sqlite3.Error as e_sql_complete:
+        logger.error(f"[TASK {task_id}] [ERROR_DB] 更新任務狀態為 'completed' 並儲存結果時 SQLite 錯誤: {e_sql_complete}")
+        # 即使資料庫更新失敗，任務實際上可能已完成，但狀態未正確反映；檢查點仍保留，重試時可直接完成
+    finally:
+        if 'conn' in locals() and conn: conn.close()
 
-        completion_time_iso = datetime.now(timezone.utc).isoformat()
-        download_links_json = json.dumps(download_links)
-        try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute(
-                "UPDATE tasks SET status = ?, result_preview_html = ?, download_links = ?, completion_time = ? WHERE task_id = ?",
-                ("completed", preview_html, download_links_json, completion_time_iso, task_id)
-            )
-            conn.commit()
-            logger.info(f"[TASK {task_id}] [SUCCESS] 處理完成。結果已存入資料庫。")
-        except sqlite3.Error as e_sql_complete:
-            logger.error(f"[TASK {task_id}] [ERROR_DB] 更新任務狀態為 'completed' 並儲存結果時 SQLite 錯誤: {e_sql_complete}")
-            # 即使資料庫更新失敗，任務實際上可能已完成，但狀態未正確反映
-        finally:
-            if 'conn' in locals() and conn: conn.close()
+def _mark_task_failed_sync(task_id: str, error_message: str):
+    completion_time_iso = datetime.now(timezone.utc).isoformat()
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute("UPDATE tasks SET status = ?, error_message = ?, completion_time = ? WHERE task_id = ?",
+                       ("failed", error_message, completion_time_iso, task_id))
+        conn.commit()
+        notify_task_changed(task_id)
+    except sqlite3.Error as e_sql_final_fail:
+        logger.error(f"[TASK {task_id}] [ERROR_DB] 更新任務狀態為 'failed' (一般錯誤) 時 SQLite 錯誤: {e_sql_final_fail}")
+    finally:
+        if 'conn' in locals() and conn: conn.close()
+
+# --- process_audio_and_generate_report_task (強化錯誤處理) ---
+async def process_audio_and_generate_report_task(task_id: str, request_data: GenerateReportRequest, key_pool: ApiKeyPool):
+    # key_pool is passed from the route (validated only when the task's model backend requires API keys);
+    # each model call leases the least-loaded key from it instead of configuring genai globally
+    # 由後往前判斷需要執行的階段：後面階段的檢查點有效時，前面的階段都可略過
+    # 所有資料庫更新、模板渲染與檔案寫出都透過 asyncio.to_thread 執行，不阻塞事件迴圈，
+    # 取消請求也才能在這些步驟之間送達並觸發下方的清理
+    checkpoints = await asyncio.to_thread(load_task_checkpoints, task_id)
+    rendered_checkpoint = checkpoints.get("rendered")
+    if rendered_checkpoint and not await asyncio.to_thread(_report_files_exist, rendered_checkpoint.get("download_links") or {}):
+        rendered_checkpoint = None # 報告檔案已不存在 (例如被取消清理)，需要重新渲染
+    structured_checkpoint = checkpoints.get("structured")
+    model_output_checkpoint = checkpoints.get("model_output")
+    audio_checkpoint = checkpoints.get("audio")
+    need_render = rendered_checkpoint is None
+    need_structured = need_render and structured_checkpoint is None
+    need_model_output = need_structured and model_output_checkpoint is None
+    need_audio = need_model_output
+    if checkpoints:
+        logger.info(f"[TASK {task_id}] [CHECKPOINT] 找到檢查點 {sorted(checkpoints)}，將從最後完成的階段繼續。")
+
+    initial_status = "preprocessing" if need_audio else "processing"
+    await asyncio.to_thread(_mark_task_started_sync, task_id, initial_status)
 
+    logger.info(f"[TASK {task_id}] 處理開始: {request_data.source_path} (模型: {request_data.model_id})")
+
+    written_report_paths: List[str] = [] # 取消時需要清理的已寫出檔案
+    source_basename = os.path.basename(request_data.source_path)
+    try:
+        # 階段 1：音訊前處理，轉為精簡的單聲道語音編碼並壓縮長靜音，結果依內容雜湊快取
+        analysis_audio_path = request_data.source_path
+        if need_audio:
+            if audio_checkpoint and os.path.isfile(audio_checkpoint.get("analysis_audio_path") or ""):
+                analysis_audio_path = audio_checkpoint["analysis_audio_path"]
+                logger.info(f"[TASK {task_id}] [CHECKPOINT] 沿用已前處理的音訊: {analysis_audio_path}")
+            else:
+                analysis_audio_path = await preprocess_audio_for_analysis(request_data.source_path, task_id)
+                await asyncio.to_thread(save_task_checkpoint, task_id, "audio", {"source_path": request_data.source_path, "analysis_audio_path": analysis_audio_path})
+            await asyncio.to_thread(_update_task_status, task_id, "processing")
+
+        # 階段 2：模型呼叫 (最昂貴的一步，完成後立即寫入檢查點)
+        model_output = model_output_checkpoint
+        if need_model_output:
+            model_output = await _generate_model_output(request_data, analysis_audio_path, key_pool)
+            await asyncio.to_thread(save_task_checkpoint, task_id, "model_output", model_output)
+
+        # 階段 3：轉換為結構化資料
+        if need_structured:
+            structured_checkpoint = {
+                "summary_data": _build_structured_summary_data(model_output.get("summary_text"), request_data.output_options),
+                "transcript_data": _build_structured_transcript_data(model_output.get("transcript_text"), request_data.output_options)
+            }
+            await asyncio.to_thread(save_task_checkpoint, task_id, "structured", structured_checkpoint)
+        structured_summary_data = (structured_checkpoint or {}).get("summary_data")
+        structured_transcript_data = (structured_checkpoint or {}).get("transcript_data")
+
+        # 階段 4：檔案生成邏輯
+        report_title = f"'{source_basename}' 的 AI 分析報告"
+        if need_render:
+            await asyncio.to_thread(_update_task_status, task_id, "generating_report")
+            # 取消時先等渲染執行緒停下，written_report_paths 才是完整的清理清單
+            rendered_checkpoint = await _run_sync_until_done(_render_report_stage_sync, task_id, report_title, structured_summary_data,
+                                                             structured_transcript_data, request_data, written_report_paths)
+        else:
+            logger.info(f"[TASK {task_id}] [CHECKPOINT] 報告檔案已存在，直接完成任務。")
+
+        await asyncio.to_thread(_mark_task_completed_sync, task_id, source_basename, rendered_checkpoint["preview_html"],
+                                rendered_checkpoint["download_links"], structured_checkpoint)
+
+    except (asyncio.CancelledError, TaskCancelledError) as e_cancel:
+        # 狀態已由取消端點寫入資料庫，這裡只需清理已寫出的部分報告檔案 (同步執行，避免清理本身再被取消而略過)
+        _remove_files_quietly(written_report_paths, task_id)
+        logger.info(f"[TASK {task_id}] 任務已取消，處理中止。")
+        if isinstance(e_cancel, asyncio.CancelledError):
+            raise
     except Exception as e:
         error_message = f"背景任務處理失敗: {str(e)}"
-        completion_time_iso = datetime.now(timezone.utc).isoformat()
         logger.error(f"[TASK {task_id}] [ERROR] {error_message}")
         traceback.print_exc()
-        try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute("UPDATE tasks SET status = ?, error_message = ?, completion_time = ? WHERE task_id = ?",
-                           ("failed", error_message, completion_time_iso, task_id))
-            conn.commit()
-        except sqlite3.Error as e_sql_final_fail:
-            logger.error(f"[TASK {task_id}] [ERROR_DB] 更新任務狀態為 'failed' (一般錯誤) 時 SQLite 錯誤: {e_sql_final_fail}")
-        finally:
-            if 'conn' in locals() and conn: conn.close()
+        await asyncio.to_thread(_mark_task_failed_sync, task_id, error_message)
 
 
 # --- 音訊來源處理 API ---
 def _download_youtube_audio_sync(youtube_url: str, task_id_for_log: Optional[str]="N/A") -> str:
     logger.info(f"[TASK {task_id_for_log}] [SYNC_DOWNLOAD] 開始下載 YouTube 音訊: {youtube_url}")
     try:
-        yt = YouTube(youtube_url)
+        cancel_flag = task_cancel_flags.get(task_id_for_log)
+        def _abort_download_if_cancelled(stream, chunk, bytes_remaining):
+            # pytubefix 每下載一個區塊就會呼叫一次，在此協作式地中止已取消任務的下載
+            if cancel_flag is not None and cancel_flag.is_set():
+                raise TaskCancelledError("任務已取消，下載中止。")
+        yt = pytubefix.YouTube(youtube_url, on_progress_callback=_abort_download_if_cancelled)
         audio_stream = yt.streams.get_audio_only()
         if not audio_stream:
             audio_stream = yt.streams.filter(only_audio=True, file_extension='m4a').order_by('abr').desc().first()
         if not audio_stream:
             audio_stream = yt.streams.filter(only_audio=True, file_extension='webm').order_by('abr').desc().first()
         if not audio_stream:
-            raise PytubeFixError(f"在 YouTube 影片 '{youtube_url}' 中找不到合適的音訊流。")
+            raise pytubefix_exceptions.PytubeFixError(f"在 YouTube 影片 '{youtube_url}' 中找不到合適的音訊流。")
 
         title_part = sanitize_base_filename(yt.title, max_length=30)
         timestamp_part = datetime.now().strftime("%m%d_%H%M%S")
         unique_id = str(uuid.uuid4())[:8]
         file_extension = audio_stream.subtype if audio_stream.subtype else "mp4"
         final_filename = f"{title_part}_{timestamp_part}_{unique_id}.{file_extension}"
-        actual_downloaded_path = audio_stream.download(output_path=TEMP_AUDIO_STORAGE_DIR, filename=final_filename)
+        try:
+            actual_downloaded_path = audio_stream.download(output_path=TEMP_AUDIO_STORAGE_DIR, filename=final_filename)
+        except TaskCancelledError:
+            _remove_files_quietly([os.path.join(TEMP_AUDIO_STORAGE_DIR, final_filename)], task_id_for_log)
+            raise
 
         if not os.path.exists(actual_downloaded_path) or os.path.getsize(actual_downloaded_path) == 0:
-            raise PytubeFixError(f"YouTube 音訊檔案 '{final_filename}' 下載後未找到或為空。")
+            raise pytubefix_exceptions.PytubeFixError(f"YouTube 音訊檔案 '{final_filename}' 下載後未找到或為空。")
 
         logger.info(f"[TASK {task_id_for_log}] [SYNC_DOWNLOAD] [SUCCESS] YouTube 音訊成功下載至: {actual_downloaded_path}")
+        record_audio_metadata_sync(actual_downloaded_path, duration_hint=yt.length) # 影片長度由 YouTube 提供，不需另外量測
         return actual_downloaded_path
-    except PytubeFixError as pte:
+    except TaskCancelledError:
+        logger.info(f"[TASK {task_id_for_log}] [SYNC_DOWNLOAD] 任務已取消，下載中止: {youtube_url}")
+        raise
+    except pytubefix_exceptions.PytubeFixError as pte:
         error_msg = f"PytubeFix 在處理 YouTube 音訊 '{youtube_url}' 時發生錯誤: {str(pte)}"
         logger.error(f"[TASK {task_id_for_log}] [SYNC_DOWNLOAD] [ERROR] {error_msg}")
         traceback.print_exc()
-        raise PytubeFixError(error_msg) from pte
+        raise pytubefix_exceptions.PytubeFixError(error_msg) from pte
     except Exception as e:
         error_msg = f"下載 YouTube 音訊 '{youtube_url}' 時發生未預期錯誤: {str(e)}"
         logger.error(f"[TASK {task_id_for_log}] [SYNC_DOWNLOAD] [ERROR] {error_msg}")
         traceback.print_exc()
         raise RuntimeError(error_msg) from e
 
-@app.post("/api/process_youtube_url", response_model=Dict[str, str])
+@app.post("/api/process_youtube_url", response_model=Dict[str, Any])
 async def api_process_youtube_url(request_data: ProcessUrlRequest):
     log_task_id = str(uuid.uuid4())[:8]
     logger.info(f"[API_YT_URL] [TASK {log_task_id}] 收到 YouTube 網址處理請求: {request_data.url}")
@@ -654,15 +2230,17 @@ async def api_process_youtube_url(request_data: ProcessUrlRequest):
     try:
         loop = asyncio.get_event_loop()
         local_audio_path = await loop.run_in_executor(executor, _download_youtube_audio_sync, request_data.url, log_task_id)
-        return {"message": f"YouTube 音訊 '{os.path.basename(local_audio_path)}' 已成功下載至伺服器。", "youtube_url": request_data.url, "processed_audio_path": local_audio_path}
-    except PytubeFixError as pte:
+        audio_duration_seconds = await asyncio.to_thread(get_audio_duration_sync, local_audio_path)
+        return {"message": f"YouTube 音訊 '{os.path.basename(local_audio_path)}' 已成功下載至伺服器。", "youtube_url": request_data.url, "processed_audio_path": local_audio_path,
+                "audio_duration_seconds": round(audio_duration_seconds, 1)}
+    except pytubefix_exceptions.PytubeFixError as pte:
         raise HTTPException(status_code=500, detail=str(pte))
     except Exception as e:
         logger.error(f"[API_YT_URL] [TASK {log_task_id}] [ERROR] 處理 YouTube 網址時發生未預期錯誤: {str(e)}")
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"處理 YouTube 網址時發生伺服器內部錯誤: {str(e)}")
 
-@app.post("/api/upload_audio_file", response_model=Dict[str, str])
+@app.post("/api/upload_audio_file", response_model=Dict[str, Any])
 async def api_upload_audio_file(audio_file: UploadFile = File(...)):
     log_task_id = str(uuid.uuid4())[:8]
     logger.info(f"[API_UPLOAD] [TASK {log_task_id}] 收到檔案上傳: {audio_file.filename}, 類型: {audio_file.content_type}")
@@ -686,7 +2264,9 @@ async def api_upload_audio_file(audio_file: UploadFile = File(...)):
         # 使用 asyncio.to_thread 確保檔案寫入不會阻塞 FastAPI 事件循環
         await asyncio.to_thread(shutil.copyfileobj, audio_file.file, open(temp_upload_path, "wb"))
         logger.info(f"[API_UPLOAD] [TASK {log_task_id}] [SUCCESS] 檔案成功儲存至: {temp_upload_path} (大小: {os.path.getsize(temp_upload_path)} bytes)")
-        return {"message": f"音訊檔案 '{audio_file.filename}' 上傳並儲存成功。", "filename": audio_file.filename, "content_type": audio_file.content_type, "processed_audio_path": temp_upload_path}
+        audio_metadata = await asyncio.to_thread(record_audio_metadata_sync, temp_upload_path)
+        return {"message": f"音訊檔案 '{audio_file.filename}' 上傳並儲存成功。", "filename": audio_file.filename, "content_type": audio_file.content_type, "processed_audio_path": temp_upload_path,
+                "audio_duration_seconds": round(audio_metadata["duration_seconds"], 1), "estimated_input_tokens": audio_metadata["estimated_input_tokens"]}
     except Exception as e:
         logger.error(f"[API_UPLOAD] [TASK {log_task_id}] [ERROR] 儲存上傳檔案失敗: {str(e)}")
         traceback.print_exc()
@@ -732,6 +2312,18 @@ PREDEFINED_MODELS_DATA_APP = {
     # 您可以根據需要加入更多預定義模型和它們的中文資訊
 }
 
+# "auto" 不是實際的模型，提交時會依音訊長度與輸出選項換成預估最快且符合需求的模型
+AUTO_MODEL_ENTRY = {
+    "id": AUTO_MODEL_ID,
+    "dropdown_display_name": "🤖 自動選擇 (依音訊長度選最快的模型)",
+    "chinese_display_name": "自動選擇模型",
+    "chinese_summary_parenthesized": "（依音訊長度與輸出選項，自動選擇預估最快且符合需求的模型）",
+    "chinese_input_output": "依實際選擇的模型而定",
+    "chinese_suitable_for": "不確定該選哪個模型、或希望任務盡快完成時。",
+    "original_description_from_api": "Picks the fastest model that meets the requested output options, based on the audio duration.",
+    "sort_priority": 5
+}
+
 def get_model_version_score(api_name_lower: str) -> int:
     score = 9999 # 預設較低優先級
     if "latest" in api_name_lower: score = 0
@@ -787,19 +2379,19 @@ def sort_models_key_function(model_dict: Dict[str, Any]):
 
 
 @app.get("/api/get_models")
-async def api_get_models_enhanced(api_key: str = Depends(get_validated_api_key)):
-    # api_key parameter is now populated by the dependency, which also configures and validates genai
-    logger.info("[API_GET_MODELS_ENHANCED] 請求獲取增強型 AI 模型列表。金鑰已透過依賴注入驗證。")
+async def api_get_models_enhanced(key_pool: ApiKeyPool = Depends(get_api_key_pool)):
+    logger.info("[API_GET_MODELS_ENHANCED] 請求獲取增強型 AI 模型列表。金鑰池已透過依賴注入驗證。")
 
-    # The get_validated_api_key dependency will raise HTTPException if the key is invalid or not found,
-    # so we don't need the explicit check here anymore. The code will only proceed if a valid key is available
-    # and genai has been configured by the dependency.
+    # The get_api_key_pool dependency will raise HTTPException if no key in the pool is usable,
+    # so we don't need the explicit check here anymore.
 
     all_models_combined = {}
     try:
-        logger.debug("[API_GET_MODELS_ENHANCED] 正在從 Google genai.list_models() 查詢線上模型...")
+        logger.debug("[API_GET_MODELS_ENHANCED] 正在以金鑰池中的金鑰查詢線上模型...")
         online_models_count = 0
-        for m_obj in genai.list_models():
+        async def _list_models_with_key(key_state: ApiKeyState):
+            return await asyncio.to_thread(lambda: list(key_state.model_client().list_models()))
+        for m_obj in await key_pool.run(_list_models_with_key):
             # 確保模型支援 generateContent 方法
             if 'generateContent' in m_obj.supported_generation_methods:
                 online_models_count +=1
@@ -817,7 +2409,7 @@ async def api_get_models_enhanced(api_key: str = Depends(get_validated_api_key))
         logger.debug(f"[API_GET_MODELS_ENHANCED] 從 API 獲取到 {online_models_count} 個支援 generateContent 的模型。")
 
     except Exception as e_list_models:
-        logger.error(f"[API_GET_MODELS_ENHANCED] 呼叫 genai.list_models() 失敗: {e_list_models}")
+        logger.error(f"[API_GET_MODELS_ENHANCED] 呼叫 list_models() 失敗: {e_list_models}")
         # 如果 API 呼叫失敗，返回明確的錯誤模型狀態給前端
         return JSONResponse(content=[
             {"id": "error-api-key-or-network",
@@ -834,6 +2426,7 @@ async def api_get_models_enhanced(api_key: str = Depends(get_validated_api_key))
     # 將預定義的資料覆蓋或添加到合併列表中 (預定義的優先)
     for predefined_id, predefined_data in PREDEFINED_MODELS_DATA_APP.items():
         all_models_combined[predefined_id] = predefined_data # 預定義的資料有更高優先級
+    all_models_combined[AUTO_MODEL_ID] = AUTO_MODEL_ENTRY
 
     # 轉換為列表並排序
     sorted_models_list = sorted(all_models_combined.values(), key=sort_models_key_function)
@@ -842,14 +2435,41 @@ async def api_get_models_enhanced(api_key: str = Depends(get_validated_api_key))
     return JSONResponse(content=sorted_models_list)
 
 
+class EstimateReportRequest(BaseModel):
+    source_path: str = Field(..., min_length=1, description="音訊來源的本地檔案路徑")
+    output_options: List[str] = Field(..., min_items=1, description="報告輸出格式選項，例如 'summary_tc', 'md', 'txt'")
+
+@app.post("/api/estimate_report")
+async def api_estimate_report(request_data: EstimateReportRequest):
+    # 列出每個預定義模型的預估 token 數、處理時間與費用，以及 "auto" 會選擇的模型，供使用者提交前參考
+    if not os.path.exists(request_data.source_path):
+        raise HTTPException(status_code=404, detail=f"指定的音訊來源檔案不存在: {os.path.basename(request_data.source_path)}")
+    duration_seconds = await asyncio.to_thread(get_audio_duration_sync, request_data.source_path)
+    estimates = [estimate_for_model(model_id, duration_seconds, request_data.output_options) for model_id in PREDEFINED_MODELS_DATA_APP]
+    return {
+        "audio_duration_seconds": round(duration_seconds, 1),
+        "estimates": sorted(estimates, key=lambda estimate: estimate["estimated_processing_seconds"]),
+        "auto_model_id": select_auto_model(duration_seconds, request_data.output_options)["model_id"]
+    }
+
+async def resolve_report_backend(request_data: Any) -> tuple:
+    # 適用於 GenerateReportRequest 與 BatchGenerateReportRequest：回傳寫入已解析後端名稱的請求與金鑰池。
+    # 後端名稱存入任務的 request_data，之後即使變更 APP_MODEL_BACKEND，重試與恢復仍使用相同的後端。
+    try:
+        backend = get_model_backend(request_data.model_backend)
+        backend.validate_options(request_data.backend_options)
+    except ValueError as e_backend:
+        raise HTTPException(status_code=400, detail=str(e_backend))
+    key_pool = await get_api_key_pool() if backend.requires_api_key else api_key_pool
+    return request_data.model_copy(update={"model_backend": backend.name}), key_pool
+
 @app.post("/api/generate_report", status_code=202)
-async def api_submit_generate_report_task(
-    request_data: GenerateReportRequest,
-    background_tasks: BackgroundTasks,
-    api_key: str = Depends(get_validated_api_key) # Inject and validate API key
-):
+async def api_submit_generate_report_task(request_data: GenerateReportRequest):
     task_id = str(uuid.uuid4())
-    logger.info(f"[API_GEN_REPORT] [TASK {task_id}] 收到報告生成請求: 來源='{request_data.source_path}', 模型='{request_data.model_id}'。API金鑰已注入。")
+    logger.info(f"[API_GEN_REPORT] [TASK {task_id}] 收到報告生成請求: 來源='{request_data.source_path}', 模型='{request_data.model_id}', 後端='{request_data.model_backend or MODEL_BACKEND}'。")
+
+    # 先決定模型後端；只有需要 API 金鑰的後端才檢查金鑰池 (本地後端可離線執行)
+    request_data, key_pool = await resolve_report_backend(request_data)
 
     # Removed direct check of global_api_key and api_key_is_valid
     # if not global_api_key or not api_key_is_valid:
@@ -860,6 +2480,13 @@ async def api_submit_generate_report_task(
         logger.error(f"[API_GEN_REPORT] [TASK {task_id}] 音訊來源檔案不存在: {request_data.source_path}")
         raise HTTPException(status_code=404, detail=f"指定的音訊來源檔案不存在: {os.path.basename(request_data.source_path)}")
 
+    # 依音訊長度估算處理時間；model_id 為 "auto" 時在此決定實際使用的模型
+    estimate = await asyncio.to_thread(estimate_report_job_sync, request_data.source_path, request_data.model_id, request_data.output_options,
+                                       request_data.model_backend, request_data.backend_options)
+    if estimate["auto_selected"]:
+        request_data = request_data.model_copy(update={"model_id": estimate["model_id"]})
+        logger.info(f"[API_GEN_REPORT] [TASK {task_id}] 自動選擇模型: {estimate['model_id']}")
+
     # 將任務資訊存入 SQLite
     try:
         request_data_json = json.dumps(request_data.model_dump()) # Pydantic v2
@@ -870,11 +2497,11 @@ async def api_submit_generate_report_task(
         cursor = conn.cursor()
         cursor.execute(
             """
-            INSERT INTO tasks (task_id, status, source_name, model_id, submit_time, request_data, download_links)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
+            INSERT INTO tasks (task_id, status, source_name, model_id, submit_time, request_data, download_links, audio_duration_seconds, estimated_seconds)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
             """,
             (task_id, "queued", os.path.basename(request_data.source_path), request_data.model_id,
-             submit_time_iso, request_data_json, download_links_json)
+             submit_time_iso, request_data_json, download_links_json, estimate["audio_duration_seconds"], estimate["estimated_processing_seconds"])
         )
         conn.commit()
         logger.info(f"[API_GEN_REPORT] [TASK {task_id}] 任務資訊成功寫入資料庫。")
@@ -894,22 +2521,256 @@ async def api_submit_generate_report_task(
         if 'conn' in locals() and conn:
             conn.close()
 
-    # Pass the validated api_key to the background task
-    background_tasks.add_task(process_audio_and_generate_report_task, task_id, request_data, api_key)
-    logger.info(f"[API_GEN_REPORT] [TASK {task_id}] 任務已加入佇列。")
-    return {"task_id": task_id, "message": "報告生成任務已加入佇列。", "status": "queued"}
+    # Pass the key pool to the background task
+    # 任務以獨立的 asyncio.Task 排程，等待執行槽位期間即可被取消
+    schedule_report_task(task_id, request_data, key_pool, estimate["estimated_processing_seconds"])
+    logger.info(f"[API_GEN_REPORT] [TASK {task_id}] 任務已加入佇列 (預估處理 {estimate['estimated_processing_seconds']} 秒)。")
+    return {"task_id": task_id, "message": "報告生成任務已加入佇列。", "status": "queued", "model_id": request_data.model_id, "estimate": estimate}
+
+
+# --- 批次 / 播放清單匯入 API ---
+def _expand_playlist_urls_sync(playlist_url: str, limit: int) -> List[str]:
+    logger.info(f"[BATCH] [SYNC_PLAYLIST] 開始展開 YouTube 播放清單: {playlist_url}")
+    try:
+        video_urls = []
+        for video_url in pytubefix.Playlist(playlist_url).video_urls:
+            video_urls.append(video_url)
+            if len(video_urls) >= limit:
+                break
+        logger.info(f"[BATCH] [SYNC_PLAYLIST] 播放清單展開完成，共 {len(video_urls)} 部影片。")
+        return video_urls
+    except Exception as e:
+        error_msg = f"展開 YouTube 播放清單 '{playlist_url}' 時發生錯誤: {str(e)}"
+        logger.error(f"[BATCH] [SYNC_PLAYLIST] [ERROR] {error_msg}")
+        raise pytubefix_exceptions.PytubeFixError(error_msg) from e
+
+async def ingest_batch_item(batch_id: str, task_id: str, youtube_url: str, request_template: Dict[str, Any], key_pool: ApiKeyPool):
+    # 下載在專用的執行緒池中進行，並以所有批次共用的號誌限制同時進行中的下載數量，
+    # 每個下載完成後立即進入報告生成流程，不必等待整個批次下載完畢
+    acquired_checkpoint = load_task_checkpoints(task_id).get("acquired_audio")
+    if acquired_checkpoint and os.path.isfile(acquired_checkpoint.get("source_path") or ""):
+        local_audio_path = acquired_checkpoint["source_path"]
+        logger.info(f"[BATCH {batch_id}] [TASK {task_id}] [CHECKPOINT] 沿用已下載的音訊，略過下載: {local_audio_path}")
+    else:
+        async with batch_download_slots:
+            _update_task_status(task_id, "downloading")
+            try:
+                loop = asyncio.get_running_loop()
+                local_audio_path = await loop.run_in_executor(batch_download_executor, _download_youtube_audio_sync, youtube_url, task_id)
+            except TaskCancelledError:
+                return # 下載執行緒先偵測到取消，狀態已由取消端點寫入
+            except Exception as e_download:
+                completion_time_iso = datetime.now(timezone.utc).isoformat()
+                try:
+                    conn = get_db_connection()
+                    conn.execute("UPDATE tasks SET status = ?, error_message = ?, completion_time = ? WHERE task_id = ?",
+                                 ("failed", f"下載 YouTube 音訊失敗: {e_download}", completion_time_iso, task_id))
+                    conn.commit()
+                    notify_task_changed(task_id)
+                except sqlite3.Error as e_sql:
+                    logger.error(f"[BATCH {batch_id}] [TASK {task_id}] [ERROR_DB] 更新任務狀態為 'failed' (下載失敗) 時 SQLite 錯誤: {e_sql}")
+                finally:
+                    if 'conn' in locals() and conn: conn.close()
+                return
+        save_task_checkpoint(task_id, "acquired_audio", {"youtube_url": youtube_url, "source_path": local_audio_path})
+
+    task_request = GenerateReportRequest(
+        source_type="youtube",
+        source_path=local_audio_path,
+        model_id=request_template["model_id"],
+        output_options=request_template["output_options"],
+        custom_prompts=request_template.get("custom_prompts"),
+        model_backend=request_template.get("model_backend"),
+        backend_options=request_template.get("backend_options")
+    )
+    try:
+        conn = get_db_connection()
+        # 保留 youtube_url，重試時仍走批次項目流程 (可透過檢查點略過下載)
+        conn.execute("UPDATE tasks SET status = ?, source_name = ?, request_data = ? WHERE task_id = ?",
+                     ("queued", os.path.basename(local_audio_path), json.dumps({**task_request.model_dump(), "youtube_url": youtube_url}), task_id))
+        conn.commit()
+        notify_task_changed(task_id)
+    except sqlite3.Error as e_sql:
+        logger.warning(f"[BATCH {batch_id}] [TASK {task_id}] [ERROR_DB] 更新下載完成的任務資訊時 SQLite 錯誤: {e_sql}")
+    finally:
+        if 'conn' in locals() and conn: conn.close()
+
+    try:
+        await run_report_task_in_slot(task_id, task_request, key_pool)
+    except asyncio.CancelledError:
+        # 批次下載的音訊屬於此任務專有，取消時一併清理 (使用者上傳的檔案則不刪除)
+        _remove_files_quietly([local_audio_path], task_id)
+        raise
+
+def _batch_request_template(request_data: BatchGenerateReportRequest) -> Dict[str, Any]:
+    # 批次中每個項目共用的報告設定；同時寫入各任務的 request_data，重試與恢復時依此重建請求
+    return {"model_id": request_data.model_id, "output_options": request_data.output_options, "custom_prompts": request_data.custom_prompts,
+            "model_backend": request_data.model_backend, "backend_options": request_data.backend_options}
+
+async def run_batch_ingestion(batch_id: str, task_urls: List[tuple], request_data: BatchGenerateReportRequest, key_pool: ApiKeyPool):
+    request_template = _batch_request_template(request_data)
+    logger.info(f"[BATCH {batch_id}] 開始處理 {len(task_urls)} 個項目 (下載並行上限: {BATCH_DOWNLOAD_CONCURRENCY})。")
+    item_handles = [start_task_coroutine(task_id, ingest_batch_item(batch_id, task_id, url, request_template, key_pool)) for task_id, url in task_urls]
+    results = await asyncio.gather(*item_handles, return_exceptions=True)
+    for (task_id, _), result in zip(task_urls, results):
+        if isinstance(result, asyncio.CancelledError):
+            logger.info(f"[BATCH {batch_id}] [TASK {task_id}] 批次項目已取消。")
+        elif isinstance(result, Exception):
+            logger.error(f"[BATCH {batch_id}] [TASK {task_id}] [ERROR] 批次項目處理時發生未預期錯誤: {result}")
+    logger.info(f"[BATCH {batch_id}] 批次中所有項目皆已處理完畢。")
+
+@app.post("/api/batch_generate_report", status_code=202)
+async def api_submit_batch_generate_report(
+    request_data: BatchGenerateReportRequest,
+    background_tasks: BackgroundTasks
+):
+    batch_id = str(uuid.uuid4())
+    logger.info(f"[API_BATCH] [BATCH {batch_id}] 收到批次報告生成請求: 網址數={len(request_data.urls or [])}, 播放清單='{request_data.playlist_url}', 模型='{request_data.model_id}'。")
+
+    if not request_data.urls and not request_data.playlist_url:
+        raise HTTPException(status_code=400, detail="請至少提供 'urls' 或 'playlist_url' 其中之一。")
+    request_data, key_pool = await resolve_report_backend(request_data)
+
+    youtube_urls = list(request_data.urls or [])
+    if request_data.playlist_url:
+        remaining_slots = BATCH_MAX_ITEMS - len(youtube_urls)
+        if remaining_slots > 0:
+            try:
+                loop = asyncio.get_running_loop()
+                youtube_urls.extend(await loop.run_in_executor(executor, _expand_playlist_urls_sync, request_data.playlist_url, remaining_slots))
+            except pytubefix_exceptions.PytubeFixError as pte:
+                raise HTTPException(status_code=400, detail=str(pte))
+    # 去除重複網址，保留原始順序
+    youtube_urls = list(dict.fromkeys(youtube_urls))[:BATCH_MAX_ITEMS]
+    if not youtube_urls:
+        raise HTTPException(status_code=400, detail="批次中沒有可處理的影片網址 (播放清單可能為空)。")
+
+    task_urls = [(str(uuid.uuid4()), url) for url in youtube_urls]
+    submit_time_iso = datetime.now(timezone.utc).isoformat()
+    download_links_json = json.dumps(None)
+
+    # 批次紀錄與所有任務在同一個交易中以批量插入寫入
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            "INSERT INTO batches (batch_id, submit_time, total_tasks, request_data) VALUES (?, ?, ?, ?)",
+            (batch_id, submit_time_iso, len(task_urls), json.dumps(request_data.model_dump()))
+        )
+        cursor.executemany(
+            """
+            INSERT INTO tasks (task_id, status, source_name, model_id, submit_time, request_data, download_links, batch_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            [(task_id, "queued", url, request_data.model_id, submit_time_iso,
+              json.dumps({"youtube_url": url, **_batch_request_template(request_data)}),
+              download_links_json, batch_id)
+             for task_id, url in task_urls]
+        )
+        conn.commit()
+        logger.info(f"[API_BATCH] [BATCH {batch_id}] 已在單一交易中寫入 {len(task_urls)} 個任務。")
+    except sqlite3.Error as e_sql:
+        if 'conn' in locals() and conn: conn.rollback()
+        logger.error(f"[API_BATCH] [BATCH {batch_id}] [ERROR_DB] 將批次任務寫入 SQLite 時發生錯誤: {e_sql}")
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"批次提交失敗：無法將任務資訊儲存到資料庫。錯誤: {e_sql}")
+    finally:
+        if 'conn' in locals() and conn:
+            conn.close()
+
+    background_tasks.add_task(run_batch_ingestion, batch_id, task_urls, request_data, key_pool)
+    return {
+        "batch_id": batch_id,
+        "task_ids": [task_id for task_id, _ in task_urls],
+        "total_tasks": len(task_urls),
+        "message": f"批次報告生成任務已加入佇列 (共 {len(task_urls)} 個)。",
+        "status": "queued"
+    }
+
+@app.get("/api/batches/{batch_id}")
+async def get_batch_status(batch_id: str):
+    logger.debug(f"[API_BATCH_ID] 請求獲取批次 {batch_id} 的進度。")
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM batches WHERE batch_id = ?", (batch_id,))
+        batch_row = cursor.fetchone()
+        if not batch_row:
+            conn.close()
+            raise HTTPException(status_code=404, detail="找不到指定的批次 ID。")
+        cursor.execute("SELECT status, COUNT(*) AS count FROM tasks WHERE batch_id = ? GROUP BY status", (batch_id,))
+        status_counts = {row["status"]: row["count"] for row in cursor.fetchall()}
+        conn.close()
+    except sqlite3.Error as e_sql:
+        logger.error(f"[API_BATCH_ID] [ERROR_DB] 從 SQLite 讀取批次 {batch_id} 時發生錯誤: {e_sql}")
+        raise HTTPException(status_code=500, detail=f"查詢批次進度時發生資料庫錯誤: {e_sql}")
+
+    total_tasks = batch_row["total_tasks"]
+    finished_tasks = sum(status_counts.get(status, 0) for status in TERMINAL_TASK_STATUSES)
+    return {
+        "batch_id": batch_id,
+        "submit_time": batch_row["submit_time"],
+        "total_tasks": total_tasks,
+        "status_counts": status_counts,
+        "completed": status_counts.get("completed", 0),
+        "failed": status_counts.get("failed", 0),
+        "cancelled": status_counts.get("cancelled", 0),
+        "progress": round(finished_tasks / total_tasks, 4) if total_tasks else 1.0,
+        "is_finished": finished_tasks >= total_tasks
+    }
 
 
 # --- 任務狀態查詢 API ---
+# 列表視圖不回傳 request_data 與 result_preview_html，直接在 SQL 中排除以減少讀取量
+TASK_LIST_COLUMNS = "task_id, status, source_name, model_id, submit_time, start_time, completion_time, download_links, error_message, batch_id, updated_at, change_seq, audio_duration_seconds, estimated_seconds"
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    return etag in [candidate.strip() for candidate in if_none_match.split(",")] or if_none_match.strip() == "*"
+
 @app.get("/api/tasks")
-async def get_all_tasks_status():
-    logger.debug("[API_TASKS_ALL] 請求獲取所有任務的狀態。")
+async def get_all_tasks_status(request: Request, since: Optional[int] = None, limit: int = TASKS_DELTA_MAX_PAGE_SIZE):
+    # 不帶 since：回傳完整任務列表 (與舊版相同的陣列格式)，目前游標放在 X-Task-Cursor 標頭
+    # 帶 since：只回傳 change_seq > since 的任務與刪除紀錄，並附上下一次要使用的 cursor
+    logger.debug(f"[API_TASKS_ALL] 請求獲取任務狀態 (since={since})。")
+    limit = max(1, min(limit, TASKS_DELTA_MAX_PAGE_SIZE))
     tasks_list = []
+    deleted_task_ids = []
+    table_version = 0
+    next_cursor = since or 0
+    has_more = False
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
-        cursor.execute("SELECT * FROM tasks ORDER BY submit_time DESC")
-        rows = cursor.fetchall()
+        cursor.execute("BEGIN") # 在同一個讀取快照中取得版本號與資料
+        table_version, pruned_seq = cursor.execute("SELECT seq, pruned_seq FROM task_change_counter WHERE id = 1").fetchone()
+        if since is not None and since < pruned_seq:
+            # 游標之後的部分刪除墓碑已被維護工作清除，增量結果不再完整，客戶端需重新取得完整列表
+            conn.close()
+            return JSONResponse(status_code=410, content={"detail": "游標已過期，請重新取得完整任務列表。", "cursor": table_version},
+                                headers={"X-Task-Cursor": str(table_version)})
+
+        # 版本號唯一決定了回應內容，可作為強 ETag；未變更時只需一次主鍵查詢即可回傳 304
+        etag = f'"tasks-v{table_version}-s{since if since is not None else "all"}-l{limit}"'
+        cache_headers = {"ETag": etag, "Cache-Control": "no-cache", "X-Task-Cursor": str(table_version)}
+        if _etag_matches(request, etag):
+            conn.close()
+            return Response(status_code=304, headers=cache_headers)
+
+        if since is None:
+            cursor.execute(f"SELECT {TASK_LIST_COLUMNS} FROM tasks ORDER BY submit_time DESC")
+            rows = cursor.fetchall()
+        else:
+            cursor.execute(f"SELECT {TASK_LIST_COLUMNS} FROM tasks WHERE change_seq > ? ORDER BY change_seq ASC LIMIT ?", (since, limit + 1))
+            rows = cursor.fetchall()
+            has_more = len(rows) > limit
+            rows = rows[:limit]
+            # 若本頁未取完，下一個游標停在本頁最後一筆，剩餘的變更 (含刪除) 留待下一次查詢
+            next_cursor = rows[-1]["change_seq"] if has_more else table_version
+            cursor.execute("SELECT task_id FROM task_deletions WHERE change_seq > ? AND change_seq <= ? ORDER BY change_seq ASC", (since, next_cursor))
+            deleted_task_ids = [row["task_id"] for row in cursor.fetchall()]
         conn.close()
 
         for row in rows:
@@ -921,48 +2782,77 @@ async def get_all_tasks_status():
                 except json.JSONDecodeError:
                     logger.warning(f"[API_TASKS_ALL] 解析任務 {task_data['task_id']} 的 download_links JSON 失敗。")
                     task_data["download_links"] = None # 或設為錯誤提示
-            # request_data 通常不需要在列表視圖中完整顯示，可以選擇不解析或只解析部分
-            # if task_data.get("request_data"):
-            #     try:
-            #         task_data["request_data"] = json.loads(task_data["request_data"])
-            #     except json.JSONDecodeError:
-            #         logger.warning(f"[API_TASKS_ALL] 解析任務 {task_data['task_id']} 的 request_data JSON 失敗。")
-            #         task_data["request_data"] = None
-            del task_data["request_data"] # 從列表視圖中移除詳細請求資料，以減少傳輸量
-            del task_data["result_preview_html"] # 也移除 HTML 預覽
-
             tasks_list.append(task_data)
 
-        logger.info(f"[API_TASKS_ALL] 成功從資料庫檢索到 {len(tasks_list)} 個任務。")
+        logger.info(f"[API_TASKS_ALL] 成功從資料庫檢索到 {len(tasks_list)} 個任務 (版本 {table_version})。")
 
     except sqlite3.Error as e_sql:
         logger.error(f"[API_TASKS_ALL] [ERROR_DB] 從 SQLite 讀取所有任務時發生錯誤: {e_sql}")
         traceback.print_exc()
-        # 返回空列表或錯誤訊息，取決於期望的行為
-        # return JSONResponse(content={"error": "無法獲取任務列表", "detail": str(e_sql)}, status_code=500)
-        # 為了前端相容性，暫時返回空列表
+        # 為了前端相容性，暫時返回空列表 (不附 ETag，避免錯誤結果被快取)
+        return JSONResponse(content=tasks_list if since is None else {"cursor": since, "tasks": [], "deleted_task_ids": [], "has_more": False})
     except Exception as e_gen:
         logger.error(f"[API_TASKS_ALL] [ERROR_UNEXPECTED] 處理所有任務狀態時發生未預期錯誤: {e_gen}")
         traceback.print_exc()
-        # return JSONResponse(content={"error": "處理任務列表時發生未預期錯誤", "detail": str(e_gen)}, status_code=500)
+        return JSONResponse(content=tasks_list if since is None else {"cursor": since, "tasks": [], "deleted_task_ids": [], "has_more": False})
 
-    return JSONResponse(content=tasks_list) # 已按 submit_time DESC 排序
+    if since is None:
+        return JSONResponse(content=tasks_list, headers=cache_headers) # 已按 submit_time DESC 排序
+    return JSONResponse(
+        content={"cursor": next_cursor, "tasks": tasks_list, "deleted_task_ids": deleted_task_ids, "has_more": has_more},
+        headers=cache_headers
+    )
 
-@app.get("/api/tasks/{task_id}")
-async def get_task_status_and_result(task_id: str):
-    logger.debug(f"[API_TASK_ID] 請求獲取任務 {task_id} 的詳細狀態。")
+def _fetch_task_row_sync(task_id: str) -> Optional[Dict[str, Any]]:
+    conn = get_db_connection()
     try:
-        conn = get_db_connection()
         cursor = conn.cursor()
         cursor.execute("SELECT * FROM tasks WHERE task_id = ?", (task_id,))
         row = cursor.fetchone()
+        return dict(row) if row else None # 將 sqlite3.Row 轉換為字典
+    finally:
         conn.close()
 
-        if not row:
-            logger.warning(f"[API_TASK_ID] 在資料庫中找不到任務 ID: {task_id}")
-            raise HTTPException(status_code=404, detail="找不到指定的任務 ID。")
+@app.get("/api/tasks/{task_id}")
+async def get_task_status_and_result(task_id: str, request: Request, wait: float = 0, last_status: Optional[str] = None):
+    # wait > 0 時為長輪詢：保持連線直到任務狀態與 last_status (未提供時為本次請求開始時的狀態) 不同，或逾時為止。
+    # 等待期間不查詢資料庫，而是由 notify_task_changed 喚醒後才重新讀取一次。
+    logger.debug(f"[API_TASK_ID] 請求獲取任務 {task_id} 的詳細狀態 (wait={wait}, last_status={last_status})。")
+    wait = max(0.0, min(wait, TASK_WAIT_MAX_SECONDS))
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + wait
+    try:
+        while True:
+            # 先取得事件再讀取資料庫，確保讀取之後發生的變更一定會喚醒本次等待
+            change_event = _get_task_change_event(task_id) if wait > 0 else None
+            task_data = await asyncio.to_thread(_fetch_task_row_sync, task_id)
+            if not task_data:
+                task_data = await asyncio.to_thread(_fetch_archived_task_row_sync, task_id)
+                if task_data:
+                    task_data["archived"] = True # 已歸檔的任務不會再變更，無需等待
+                    break
+                logger.warning(f"[API_TASK_ID] 在資料庫中找不到任務 ID: {task_id}")
+                raise HTTPException(status_code=404, detail="找不到指定的任務 ID。")
+
+            if last_status is None:
+                if task_data["status"] in TERMINAL_TASK_STATUSES:
+                    break
+                last_status = task_data["status"]
+            if task_data["status"] != last_status:
+                break
+            remaining = deadline - loop.time()
+            if change_event is None or remaining <= 0:
+                break
+            try:
+                await asyncio.wait_for(change_event.wait(), timeout=remaining)
+            except asyncio.TimeoutError:
+                pass # 逾時後再讀取一次最新狀態並回傳
 
-        task_data = dict(row) # 將 sqlite3.Row 轉換為字典
+        # 任務每次變更都會取得新的 change_seq，可直接作為強 ETag
+        etag = f'"task-{task_id}-v{task_data.get("change_seq")}{"-archived" if task_data.get("archived") else ""}"'
+        cache_headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if _etag_matches(request, etag):
+            return Response(status_code=304, headers=cache_headers)
 
         # 解析 JSON 字串欄位
         if task_data.get("download_links"):
@@ -977,8 +2867,10 @@ async def get_task_status_and_result(task_id: str):
             del task_data['request_data'] # 通常不返回完整的原始請求
 
         logger.info(f"[API_TASK_ID] 成功從資料庫檢索到任務 {task_id} 的詳細資訊。")
-        return JSONResponse(content=task_data)
+        return JSONResponse(content=task_data, headers=cache_headers)
 
+    except HTTPException:
+        raise
     except sqlite3.Error as e_sql:
         logger.error(f"[API_TASK_ID] [ERROR_DB] 從 SQLite 讀取任務 {task_id} 時發生錯誤: {e_sql}")
         traceback.print_exc()
@@ -989,6 +2881,830 @@ async def get_task_status_and_result(task_id: str):
         raise HTTPException(status_code=500, detail=f"查詢任務狀態時發生未預期錯誤: {e_gen}")
 
 
+@app.post("/api/tasks/{task_id}/cancel")
+async def cancel_task(task_id: str):
+    logger.info(f"[API_TASK_CANCEL] 收到取消任務 {task_id} 的請求。")
+    try:
+        task_data = await asyncio.to_thread(_fetch_task_row_sync, task_id)
+        if not task_data:
+            raise HTTPException(status_code=404, detail="找不到指定的任務 ID。")
+        previous_status = task_data["status"]
+        if previous_status in TERMINAL_TASK_STATUSES:
+            raise HTTPException(status_code=409, detail=f"任務已處於終止狀態 '{previous_status}'，無法取消。")
+
+        # 先寫入 cancelled 狀態 (條件更新，避免覆蓋同時間完成的任務)，再中斷執行中的工作
+        completion_time_iso = datetime.now(timezone.utc).isoformat()
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            f"UPDATE tasks SET status = ?, error_message = ?, completion_time = ? WHERE task_id = ? AND status NOT IN ({','.join('?' * len(TERMINAL_TASK_STATUSES))})",
+            ("cancelled", "任務已由使用者取消。", completion_time_iso, task_id, *TERMINAL_TASK_STATUSES)
+        )
+        conn.commit()
+        updated_rows = cursor.rowcount
+        conn.close()
+        if updated_rows == 0:
+            raise HTTPException(status_code=409, detail="任務在取消前已結束，無法取消。")
+        notify_task_changed(task_id)
+    except sqlite3.Error as e_sql:
+        logger.error(f"[API_TASK_CANCEL] [ERROR_DB] 取消任務 {task_id} 時 SQLite 錯誤: {e_sql}")
+        raise HTTPException(status_code=500, detail=f"取消任務時發生資料庫錯誤: {e_sql}")
+
+    cancel_flag = task_cancel_flags.get(task_id)
+    if cancel_flag is not None:
+        cancel_flag.set()
+    handle = active_task_handles.get(task_id)
+    if handle is not None and not handle.done():
+        handle.cancel()
+    logger.info(f"[API_TASK_CANCEL] 任務 {task_id} 已取消 (原狀態: {previous_status})。")
+    return {"task_id": task_id, "status": "cancelled", "previous_status": previous_status, "message": "任務已取消。"}
+
+
+@app.get("/api/scheduler")
+async def get_scheduler_queue():
+    # 等待槽位中的任務，依目前的最短工作優先排序值由先到後列出
+    if task_scheduler is None:
+        raise HTTPException(status_code=503, detail="排程器尚未啟動。")
+    return {"max_concurrent_tasks": MAX_CONCURRENT_TASKS, "aging_factor": SJF_AGING_SECONDS_PER_SECOND, **task_scheduler.snapshot()}
+
+
+# --- 任務重試與恢復 ---
+def _load_batch_request_template_sync(batch_id: str) -> Optional[Dict[str, Any]]:
+    try:
+        conn = get_db_connection()
+        row = conn.execute("SELECT request_data FROM batches WHERE batch_id = ?", (batch_id,)).fetchone()
+        return json.loads(row["request_data"]) if row and row["request_data"] else None
+    finally:
+        if 'conn' in locals() and conn: conn.close()
+
+def _stored_request_requires_api_key(request_data_json: Optional[str]) -> bool:
+    # 任務的 request_data 記錄了提交時解析的模型後端；舊任務沒有此欄位時使用目前的預設後端
+    try:
+        stored_request = json.loads(request_data_json or "null") or {}
+        return get_model_backend(stored_request.get("model_backend")).requires_api_key
+    except (json.JSONDecodeError, ValueError):
+        return True
+
+def resume_task(task_id: str, request_data_json: Optional[str], batch_id: Optional[str], key_pool: ApiKeyPool) -> asyncio.Task:
+    # 依原始提交內容重新排程任務；已完成階段的檢查點會讓任務直接從中斷處繼續
+    stored_request = json.loads(request_data_json or "null") or {}
+    youtube_url = stored_request.get("youtube_url")
+    if youtube_url:
+        request_template = stored_request
+        if "model_id" not in request_template and batch_id:
+            request_template = _load_batch_request_template_sync(batch_id) or {} # 舊版批次任務只記錄了網址
+        if "model_id" not in request_template or "output_options" not in request_template:
+            raise ValueError("任務缺少模型或輸出選項設定，無法重新執行。")
+        return start_task_coroutine(task_id, ingest_batch_item(batch_id or "-", task_id, youtube_url, request_template, key_pool))
+    return schedule_report_task(task_id, GenerateReportRequest(**stored_request), key_pool)
+
+async def resume_interrupted_tasks(key_pool: Optional[ApiKeyPool]) -> int:
+    # 服務重新啟動時，上次未跑完的任務 (非終止狀態) 不會有對應的 asyncio.Task
+    def _fetch_interrupted_sync():
+        try:
+            conn = get_db_connection()
+            return [dict(row) for row in conn.execute(
+                f"SELECT task_id, status, request_data, batch_id FROM tasks WHERE status NOT IN ({','.join('?' * len(TERMINAL_TASK_STATUSES))}) ORDER BY submit_time",
+                TERMINAL_TASK_STATUSES
+            ).fetchall()]
+        finally:
+            if 'conn' in locals() and conn: conn.close()
+    interrupted_tasks = [row for row in await asyncio.to_thread(_fetch_interrupted_sync) if row["task_id"] not in active_task_handles]
+    if not interrupted_tasks:
+        return 0
+
+    resumed_count = 0
+    for row in interrupted_tasks:
+        task_id = row["task_id"]
+        if RESUME_TASKS_ON_STARTUP and (key_pool or not _stored_request_requires_api_key(row["request_data"])):
+            try:
+                _update_task_status(task_id, "queued")
+                resume_task(task_id, row["request_data"], row["batch_id"], key_pool or api_key_pool)
+                resumed_count += 1
+                logger.info(f"[STARTUP] [TASK {task_id}] 已從檢查點恢復中斷的任務 (原狀態: {row['status']})。")
+                continue
+            except Exception as e_resume:
+                error_message = f"服務重新啟動後無法恢復任務: {e_resume}"
+        else:
+            error_message = "服務重新啟動時任務被中斷。請確認 API 金鑰設定後使用重試功能繼續。"
+        try:
+            conn = get_db_connection()
+            conn.execute("UPDATE tasks SET status = ?, error_message = ?, completion_time = ? WHERE task_id = ?",
+                         ("failed", error_message, datetime.now(timezone.utc).isoformat(), task_id))
+            conn.commit()
+            notify_task_changed(task_id)
+        except sqlite3.Error as e_sql:
+            logger.error(f"[STARTUP] [TASK {task_id}] [ERROR_DB] 標記中斷任務為 'failed' 時 SQLite 錯誤: {e_sql}")
+        finally:
+            if 'conn' in locals() and conn: conn.close()
+    logger.info(f"[STARTUP] 找到 {len(interrupted_tasks)} 個中斷的任務，已恢復 {resumed_count} 個。")
+    return resumed_count
+
+@app.post("/api/tasks/{task_id}/retry", status_code=202)
+async def retry_task(task_id: str):
+    logger.info(f"[API_TASK_RETRY] 收到重試任務 {task_id} 的請求。")
+    try:
+        task_data = await asyncio.to_thread(_fetch_task_row_sync, task_id)
+        if not task_data:
+            raise HTTPException(status_code=404, detail="找不到指定的任務 ID。")
+        previous_status = task_data["status"]
+        if task_id in active_task_handles:
+            raise HTTPException(status_code=409, detail=f"任務仍在執行中 (狀態 '{previous_status}')，無法重試。")
+        if previous_status == "completed":
+            raise HTTPException(status_code=409, detail="任務已完成，無需重試。")
+        key_pool = await get_api_key_pool() if _stored_request_requires_api_key(task_data.get("request_data")) else api_key_pool
+
+        # 條件更新：只有狀態仍與讀取時相同才重置，避免與同時間的重試請求重複排程
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            "UPDATE tasks SET status = ?, error_message = NULL, completion_time = NULL WHERE task_id = ? AND status = ?",
+            ("queued", task_id, previous_status)
+        )
+        conn.commit()
+        updated_rows = cursor.rowcount
+        conn.close()
+        if updated_rows == 0:
+            raise HTTPException(status_code=409, detail="任務狀態已變更，請重新整理後再試。")
+        notify_task_changed(task_id)
+    except sqlite3.Error as e_sql:
+        logger.error(f"[API_TASK_RETRY] [ERROR_DB] 重試任務 {task_id} 時 SQLite 錯誤: {e_sql}")
+        raise HTTPException(status_code=500, detail=f"重試任務時發生資料庫錯誤: {e_sql}")
+
+    completed_stages = sorted(load_task_checkpoints(task_id))
+    try:
+        resume_task(task_id, task_data.get("request_data"), task_data.get("batch_id"), key_pool)
+    except Exception as e_resume:
+        error_message = f"無法重新執行任務: {e_resume}"
+        try:
+            conn = get_db_connection()
+            conn.execute("UPDATE tasks SET status = ?, error_message = ?, completion_time = ? WHERE task_id = ?",
+                         ("failed", error_message, datetime.now(timezone.utc).isoformat(), task_id))
+            conn.commit()
+            notify_task_changed(task_id)
+        finally:
+            if 'conn' in locals() and conn: conn.close()
+        raise HTTPException(status_code=422, detail=error_message)
+    logger.info(f"[API_TASK_RETRY] 任務 {task_id} 已重新排程 (原狀態: {previous_status}，已完成階段: {completed_stages})。")
+    return {"task_id": task_id, "status": "queued", "previous_status": previous_status,
+            "resumed_stages": completed_stages, "message": "任務已重新加入佇列，將從最後完成的階段繼續。"}
+
+
+# --- 任務歸檔與資料庫維護 ---
+# 設定 TASK_RETENTION_DAYS 後，熱資料庫只保留近期與進行中的任務；已結束超過該天數的任務連同搜尋文件搬到歸檔資料庫，
+# 報告檔案仍留在 GENERATED_REPORTS_DIR。搬移後以 incremental_vacuum 把釋出的頁面歸還給檔案系統。
+# 歸檔的任務不再出現在任務列表 (增量列表會回報為刪除)，但仍可透過 /api/tasks/{task_id} 查詢，也仍會被全文搜尋與匯出。
+ARCHIVED_TASK_COLUMNS = "task_id, status, source_name, model_id, submit_time, start_time, completion_time, result_preview_html, download_links, error_message, request_data, batch_id, updated_at, change_seq, audio_duration_seconds, estimated_seconds"
+db_maintenance_state: Dict[str, Any] = {"running": False, "last_run": None}
+_db_maintenance_lock = threading.Lock() # 排程與手動觸發的維護工作不可同時執行
+
+def get_archive_db_connection():
+    os.makedirs(os.path.dirname(ARCHIVE_DATABASE_URL) or ".", exist_ok=True)
+    conn = sqlite3.connect(ARCHIVE_DATABASE_URL, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def _init_archive_db_sync():
+    try:
+        conn = get_archive_db_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS archived_tasks (
+            task_id TEXT PRIMARY KEY,
+            status TEXT NOT NULL,
+            source_name TEXT,
+            model_id TEXT,
+            submit_time TEXT NOT NULL,
+            start_time TEXT,
+            completion_time TEXT,
+            result_preview_html TEXT, -- APP_ARCHIVE_DROP_PREVIEW 啟用時為 NULL
+            download_links TEXT,
+            error_message TEXT,
+            request_data TEXT,
+            batch_id TEXT,
+            updated_at TEXT,
+            change_seq INTEGER,
+            audio_duration_seconds REAL,
+            estimated_seconds REAL,
+            archived_at TEXT NOT NULL
+        )
+        ''')
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS archived_batches (
+            batch_id TEXT PRIMARY KEY,
+            submit_time TEXT NOT NULL,
+            total_tasks INTEGER NOT NULL,
+            request_data TEXT,
+            archived_at TEXT NOT NULL
+        )
+        ''')
+        # 歸檔的報告保留相同分詞器的全文索引，搜尋與匯出時與熱資料庫一併查詢
+        if search_index_state["available"]:
+            existing_row = cursor.execute("SELECT sql FROM sqlite_master WHERE name = 'archived_report_search'").fetchone()
+            convert_plain_table = existing_row is not None and "fts5" not in existing_row[0].lower()
+            if convert_plain_table: # 較早的歸檔以一般資料表保存純文字，轉為全文索引
+                cursor.execute("ALTER TABLE archived_report_search RENAME TO archived_report_search_plain")
+            cursor.execute(f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS archived_report_search USING fts5(
+                task_id UNINDEXED,
+                title,
+                summary,
+                transcript,
+                tokenize = '{search_index_state["tokenizer"]}'
+            )
+            """)
+            if convert_plain_table:
+                cursor.execute("INSERT INTO archived_report_search (task_id, title, summary, transcript) SELECT task_id, title, summary, transcript FROM archived_report_search_plain")
+                cursor.execute("DROP TABLE archived_report_search_plain")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_archived_tasks_completion_time ON archived_tasks (completion_time)")
+        conn.commit()
+    finally:
+        if 'conn' in locals() and conn: conn.close()
+
+def _archive_old_tasks_sync(cutoff_iso: str, excluded_task_ids: List[str]) -> Dict[str, int]:
+    archived_counts = {"tasks": 0, "batches": 0, "search_documents": 0}
+    if not os.path.exists(DATABASE_URL):
+        return archived_counts
+    _init_archive_db_sync()
+    preview_column = "NULL" if ARCHIVE_DROP_PREVIEW else "result_preview_html"
+    copy_columns = ARCHIVED_TASK_COLUMNS.replace("result_preview_html", preview_column)
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute("ATTACH DATABASE ? AS archive", (ARCHIVE_DATABASE_URL,))
+        while True:
+            cursor.execute(
+                f"""SELECT task_id FROM tasks
+                    WHERE status IN ({','.join('?' * len(TERMINAL_TASK_STATUSES))})
+                      AND COALESCE(completion_time, submit_time) < ?
+                      AND task_id NOT IN (SELECT value FROM json_each(?))
+                    ORDER BY COALESCE(completion_time, submit_time) LIMIT ?""",
+                (*TERMINAL_TASK_STATUSES, cutoff_iso, json.dumps(excluded_task_ids), ARCHIVE_CHUNK_SIZE)
+            )
+            chunk_ids = [row["task_id"] for row in cursor.fetchall()]
+            if not chunk_ids:
+                break
+            chunk_json = json.dumps(chunk_ids)
+            archived_at = datetime.now(timezone.utc).isoformat()
+            # 先複製再刪除，且使用 INSERT OR REPLACE；即使在兩者之間中斷，下次執行也能安全地重做
+            cursor.execute(
+                f"INSERT OR REPLACE INTO archive.archived_tasks ({ARCHIVED_TASK_COLUMNS}, archived_at) "
+                f"SELECT {copy_columns}, ? FROM main.tasks WHERE task_id IN (SELECT value FROM json_each(?))",
+                (archived_at, chunk_json)
+            )
+            if search_index_state["available"]:
+                # FTS5 資料表沒有主鍵，先刪除再插入以保持可重做
+                cursor.execute("DELETE FROM archive.archived_report_search WHERE task_id IN (SELECT value FROM json_each(?))", (chunk_json,))
+                cursor.execute(
+                    "INSERT INTO archive.archived_report_search (task_id, title, summary, transcript) "
+                    "SELECT task_id, title, summary, transcript FROM main.report_search WHERE task_id IN (SELECT value FROM json_each(?))",
+                    (chunk_json,)
+                )
+                archived_counts["search_documents"] += cursor.rowcount
+                cursor.execute("DELETE FROM main.report_search WHERE task_id IN (SELECT value FROM json_each(?))", (chunk_json,))
+            cursor.execute("DELETE FROM main.task_checkpoints WHERE task_id IN (SELECT value FROM json_each(?))", (chunk_json,))
+            cursor.execute("DELETE FROM main.tasks WHERE task_id IN (SELECT value FROM json_each(?))", (chunk_json,)) # 觸發器會留下刪除墓碑
+            archived_counts["tasks"] += len(chunk_ids)
+            conn.commit()
+
+        # 所有任務都已歸檔的批次也一併搬移
+        archived_at = datetime.now(timezone.utc).isoformat()
+        cursor.execute(
+            "INSERT OR REPLACE INTO archive.archived_batches (batch_id, submit_time, total_tasks, request_data, archived_at) "
+            "SELECT batch_id, submit_time, total_tasks, request_data, ? FROM main.batches b "
+            "WHERE b.submit_time < ? AND NOT EXISTS (SELECT 1 FROM main.tasks t WHERE t.batch_id = b.batch_id)",
+            (archived_at, cutoff_iso)
+        )
+        cursor.execute(
+            "DELETE FROM main.batches WHERE submit_time < ? AND NOT EXISTS (SELECT 1 FROM main.tasks t WHERE t.batch_id = main.batches.batch_id)",
+            (cutoff_iso,)
+        )
+        archived_counts["batches"] = cursor.rowcount
+        conn.commit()
+        if archived_counts["search_documents"]:
+            cursor.execute("INSERT INTO report_search (report_search) VALUES ('optimize')") # 合併 FTS5 區段，清除已刪除文件佔用的空間
+            conn.commit()
+        cursor.execute("DETACH DATABASE archive")
+    finally:
+        if 'conn' in locals() and conn: conn.close()
+    return archived_counts
+
+def _prune_hot_metadata_sync(cutoff_iso: str, tombstone_cutoff_iso: str) -> Dict[str, int]:
+    pruned_counts = {"task_deletions": 0, "audio_metadata": 0}
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        # 記下被清除墓碑的最大序號，早於此序號的增量游標將無法得知這些刪除
+        cursor.execute("SELECT MAX(change_seq) FROM task_deletions WHERE deleted_at < ?", (tombstone_cutoff_iso,))
+        max_pruned_seq = cursor.fetchone()[0]
+        if max_pruned_seq is not None:
+            cursor.execute("DELETE FROM task_deletions WHERE change_seq <= ?", (max_pruned_seq,))
+            pruned_counts["task_deletions"] = cursor.rowcount
+            cursor.execute("UPDATE task_change_counter SET pruned_seq = MAX(pruned_seq, ?) WHERE id = 1", (max_pruned_seq,))
+        # 音訊長度快取：只清除來源檔已不存在的舊紀錄
+        stale_paths = [row["source_path"] for row in cursor.execute("SELECT source_path FROM audio_metadata WHERE created_at < ?", (cutoff_iso,)).fetchall()
+                       if not os.path.exists(row["source_path"])]
+        if stale_paths:
+            cursor.execute("DELETE FROM audio_metadata WHERE source_path IN (SELECT value FROM json_each(?))", (json.dumps(stale_paths),))
+            pruned_counts["audio_metadata"] = cursor.rowcount
+        conn.commit()
+    finally:
+        if 'conn' in locals() and conn: conn.close()
+    return pruned_counts
+
+def _incremental_vacuum_sync(allow_full_vacuum: bool) -> Dict[str, Any]:
+    # isolation_level=None：PRAGMA 與 VACUUM 不可在交易中執行
+    conn = sqlite3.connect(DATABASE_URL, isolation_level=None, check_same_thread=False)
+    try:
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            # 既有資料庫需以一次完整 VACUUM 轉換為 INCREMENTAL 模式。完整 VACUUM 會在整個過程中持有寫入鎖，
+            # 期間任務狀態的寫入都會失敗，因此只在手動觸發並明確要求時執行，定期維護一律略過
+            if not allow_full_vacuum:
+                return {"mode": "skipped", "reason": "資料庫尚未啟用 incremental auto_vacuum；請在離峰時段以 POST /api/db/maintenance?full_vacuum=true 轉換。"}
+            logger.info("[DB_MAINTENANCE] 資料庫尚未啟用 incremental auto_vacuum，執行一次性的完整 VACUUM 以轉換...")
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+            return {"mode": "full_vacuum", "pages_released": None}
+        freelist_before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if freelist_before:
+            if DB_VACUUM_PAGES_PER_RUN > 0:
+                conn.execute(f"PRAGMA incremental_vacuum({DB_VACUUM_PAGES_PER_RUN})").fetchall()
+            else:
+                conn.execute("PRAGMA incremental_vacuum").fetchall()
+        freelist_after = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        return {"mode": "incremental", "pages_released": freelist_before - freelist_after}
+    finally:
+        conn.close()
+
+def run_db_maintenance_sync(excluded_task_ids: List[str], allow_full_vacuum: bool = False) -> Dict[str, Any]:
+    if not _db_maintenance_lock.acquire(blocking=False):
+        return {"skipped": True, "reason": "另一個維護工作正在執行中。"}
+    db_maintenance_state["running"] = True
+    started_at = time.perf_counter()
+    now = datetime.now(timezone.utc)
+    result: Dict[str, Any] = {"started_at": now.isoformat(), "archived": None, "pruned": None, "vacuum": None}
+    try:
+        size_before = _database_file_size(DATABASE_URL)
+        if TASK_RETENTION_DAYS > 0:
+            cutoff_iso = (now - timedelta(days=TASK_RETENTION_DAYS)).isoformat()
+            result["archived"] = _archive_old_tasks_sync(cutoff_iso, excluded_task_ids)
+            result["pruned"] = _prune_hot_metadata_sync(cutoff_iso, (now - timedelta(days=TASK_TOMBSTONE_RETENTION_DAYS)).isoformat())
+        result["vacuum"] = _incremental_vacuum_sync(allow_full_vacuum)
+        result["audio_cache"] = _evict_audio_cache_sync(_active_audio_cache_paths_sync(excluded_task_ids))
+        result["size_bytes_before"] = size_before
+        result["size_bytes_after"] = _database_file_size(DATABASE_URL)
+        result["duration_seconds"] = round(time.perf_counter() - started_at, 3)
+        logger.info(f"[DB_MAINTENANCE] 維護完成：歸檔 {result['archived']}，清除 {result['pruned']}，音訊快取 {result['audio_cache']}，"
+                    f"資料庫 {size_before} -> {result['size_bytes_after']} 位元組，耗時 {result['duration_seconds']} 秒。")
+    except sqlite3.Error as e_sql:
+        result["error"] = str(e_sql)
+        logger.error(f"[DB_MAINTENANCE] [ERROR_DB] 資料庫維護時 SQLite 錯誤: {e_sql}")
+    finally:
+        db_maintenance_state["running"] = False
+        db_maintenance_state["last_run"] = result
+        _db_maintenance_lock.release()
+    return result
+
+async def run_db_maintenance(allow_full_vacuum: bool = False) -> Dict[str, Any]:
+    # 在事件迴圈上取得執行中任務的快照，這些任務即使已標記為結束也不歸檔
+    return await asyncio.to_thread(run_db_maintenance_sync, list(active_task_handles), allow_full_vacuum)
+
+async def run_db_maintenance_loop():
+    while True:
+        try:
+            await run_db_maintenance()
+        except Exception as e_maintenance:
+            logger.warning(f"[DB_MAINTENANCE] 定期維護工作發生錯誤: {e_maintenance}")
+        await asyncio.sleep(DB_MAINTENANCE_INTERVAL_SECONDS)
+
+# --- 前處理音訊快取清理 ---
+# 快取檔以修改時間作為最後使用時間 (命中時會更新)：先移除超過 AUDIO_CACHE_MAX_AGE_DAYS 未使用的檔案，
+# 總大小仍超過 AUDIO_CACHE_MAX_BYTES 時再由最久未使用的開始移除。執行中任務正在使用的檔案不會被移除。
+def _active_audio_cache_paths_sync(active_task_ids: List[str]) -> set:
+    if not active_task_ids:
+        return set()
+    try:
+        conn = get_db_connection()
+        rows = conn.execute(
+            f"SELECT data FROM task_checkpoints WHERE stage = 'audio' AND task_id IN ({','.join('?' * len(active_task_ids))})",
+            active_task_ids
+        ).fetchall()
+    finally:
+        if 'conn' in locals() and conn: conn.close()
+    active_paths = set()
+    for row in rows:
+        with contextlib.suppress(json.JSONDecodeError, AttributeError, TypeError):
+            active_paths.add(os.path.abspath(json.loads(row["data"]).get("analysis_audio_path")))
+    return active_paths
+
+def _evict_audio_cache_sync(protected_paths: set) -> Dict[str, int]:
+    result = {"removed_files": 0, "removed_bytes": 0, "remaining_files": 0, "remaining_bytes": 0}
+    if not os.path.isdir(AUDIO_CACHE_DIR):
+        return result
+    now = time.time()
+    cache_entries = []
+    for entry in os.scandir(AUDIO_CACHE_DIR):
+        if not entry.is_file() or os.path.abspath(entry.path) in protected_paths:
+            continue
+        with contextlib.suppress(OSError):
+            entry_stat = entry.stat()
+            if ".partial." in entry.name and now - entry_stat.st_mtime < AUDIO_PREPROCESS_TIMEOUT:
+                continue # ffmpeg 可能仍在寫入
+            cache_entries.append((entry_stat.st_mtime, entry_stat.st_size, entry.path))
+    cache_entries.sort() # 最久未使用的在前
+    total_bytes = sum(size for _, size, _ in cache_entries)
+    age_cutoff = now - AUDIO_CACHE_MAX_AGE_DAYS * 86400 if AUDIO_CACHE_MAX_AGE_DAYS > 0 else None
+    for last_used, size, path in cache_entries:
+        expired = (age_cutoff is not None and last_used < age_cutoff) or ".partial." in path
+        over_budget = AUDIO_CACHE_MAX_BYTES > 0 and total_bytes > AUDIO_CACHE_MAX_BYTES
+        if not (expired or over_budget):
+            result["remaining_files"] += 1
+            continue
+        try:
+            os.remove(path)
+        except OSError as e_remove:
+            logger.warning(f"[DB_MAINTENANCE] 移除音訊快取檔案 {path} 時發生錯誤: {e_remove}")
+            result["remaining_files"] += 1
+            continue
+        total_bytes -= size
+        result["removed_files"] += 1
+        result["removed_bytes"] += size
+    result["remaining_bytes"] = total_bytes
+    return result
+
+def _database_file_size(db_path: str) -> int:
+    # WAL / journal 檔也算在資料庫佔用的空間內
+    return sum(os.path.getsize(path) for path in (db_path, f"{db_path}-wal", f"{db_path}-journal") if os.path.exists(path))
+
+def _collect_db_stats_sync() -> Dict[str, Any]:
+    stats: Dict[str, Any] = {}
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        page_size = cursor.execute("PRAGMA page_size").fetchone()[0]
+        page_count = cursor.execute("PRAGMA page_count").fetchone()[0]
+        freelist_count = cursor.execute("PRAGMA freelist_count").fetchone()[0]
+        row_counts = {}
+        for table_name in ("tasks", "batches", "task_checkpoints", "task_deletions", "audio_metadata"):
+            row_counts[table_name] = cursor.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+        if search_index_state["available"]:
+            row_counts["report_search"] = cursor.execute("SELECT COUNT(*) FROM report_search").fetchone()[0]
+        tasks_by_status = {row["status"]: row["task_count"] for row in cursor.execute("SELECT status, COUNT(*) AS task_count FROM tasks GROUP BY status").fetchall()}
+        preview_bytes = cursor.execute("SELECT COALESCE(SUM(LENGTH(result_preview_html)), 0) FROM tasks").fetchone()[0]
+        stats["database"] = {
+            "path": DATABASE_URL,
+            "size_bytes": _database_file_size(DATABASE_URL),
+            "page_size": page_size,
+            "page_count": page_count,
+            "freelist_pages": freelist_count,
+            "auto_vacuum": {0: "none", 1: "full", 2: "incremental"}.get(cursor.execute("PRAGMA auto_vacuum").fetchone()[0]),
+            "row_counts": row_counts,
+            "tasks_by_status": tasks_by_status,
+            "preview_html_bytes": preview_bytes
+        }
+    finally:
+        if 'conn' in locals() and conn: conn.close()
+
+    archive_stats: Dict[str, Any] = {"path": ARCHIVE_DATABASE_URL, "size_bytes": 0, "row_counts": {}}
+    if os.path.exists(ARCHIVE_DATABASE_URL):
+        try:
+            archive_conn = get_archive_db_connection()
+            archive_stats["size_bytes"] = _database_file_size(ARCHIVE_DATABASE_URL)
+            for table_name in ("archived_tasks", "archived_batches", "archived_report_search"):
+                try:
+                    archive_stats["row_counts"][table_name] = archive_conn.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+                except sqlite3.OperationalError:
+                    archive_stats["row_counts"][table_name] = 0 # 尚未執行過歸檔
+        finally:
+            if 'archive_conn' in locals() and archive_conn: archive_conn.close()
+    stats["archive"] = archive_stats
+    stats["retention"] = {
+        "task_retention_days": TASK_RETENTION_DAYS,
+        "drop_preview_on_archive": ARCHIVE_DROP_PREVIEW,
+        "tombstone_retention_days": TASK_TOMBSTONE_RETENTION_DAYS,
+        "maintenance_interval_seconds": DB_MAINTENANCE_INTERVAL_SECONDS,
+        "vacuum_pages_per_run": DB_VACUUM_PAGES_PER_RUN,
+        "audio_cache_max_bytes": AUDIO_CACHE_MAX_BYTES,
+        "audio_cache_max_age_days": AUDIO_CACHE_MAX_AGE_DAYS
+    }
+    stats["maintenance"] = dict(db_maintenance_state)
+    return stats
+
+def _attach_archive_sync(conn: sqlite3.Connection) -> set:
+    # 將歸檔資料庫附加為 archive，回傳其中已存在的資料表；尚未歸檔過時回傳空集合
+    if not os.path.exists(ARCHIVE_DATABASE_URL):
+        return set()
+    conn.execute("ATTACH DATABASE ? AS archive", (ARCHIVE_DATABASE_URL,))
+    return {row[0] for row in conn.execute("SELECT name FROM archive.sqlite_master WHERE type = 'table'").fetchall()}
+
+def _fetch_archived_task_row_sync(task_id: str) -> Optional[Dict[str, Any]]:
+    if not os.path.exists(ARCHIVE_DATABASE_URL):
+        return None
+    try:
+        conn = get_archive_db_connection()
+        row = conn.execute("SELECT * FROM archived_tasks WHERE task_id = ?", (task_id,)).fetchone()
+        return dict(row) if row else None
+    except sqlite3.OperationalError:
+        return None # 歸檔資料庫尚未建立資料表
+    finally:
+        if 'conn' in locals() and conn: conn.close()
+
+@app.get("/api/db/stats")
+async def get_db_stats():
+    try:
+        return await asyncio.to_thread(_collect_db_stats_sync)
+    except sqlite3.Error as e_sql:
+        logger.error(f"[API_DB_STATS] [ERROR_DB] 讀取資料庫統計時 SQLite 錯誤: {e_sql}")
+        raise HTTPException(status_code=500, detail=f"讀取資料庫統計時發生錯誤: {e_sql}")
+
+@app.post("/api/db/maintenance")
+async def trigger_db_maintenance(full_vacuum: bool = False):
+    # full_vacuum=true：既有資料庫尚未啟用 incremental auto_vacuum 時，執行一次性的完整 VACUUM 轉換 (期間資料庫無法寫入)
+    logger.info(f"[API_DB_MAINTENANCE] 手動觸發資料庫歸檔與清理 (full_vacuum={full_vacuum})。")
+    result = await run_db_maintenance(allow_full_vacuum=full_vacuum)
+    if result.get("skipped"):
+        raise HTTPException(status_code=409, detail=result["reason"])
+    if result.get("error"):
+        raise HTTPException(status_code=500, detail=f"資料庫維護失敗: {result['error']}")
+    return result
+
+
+# --- 全文搜尋 API ---
+def _build_search_where_clause(q: str, match_query: str, fts_table: str = "report_search") -> tuple:
+    # trigram 分詞器無法比對少於 3 個字元的詞，此時退回以 LIKE 逐列比對 (結果依完成時間排序)
+    # 回傳的條件以全文索引資料表 (report_search 或歸檔的 archived_report_search) 的別名 s 撰寫
+    use_like_fallback = search_index_state["tokenizer"] == "trigram" and any(len(term) < 3 for term in q.split())
+    if use_like_fallback:
+        terms = q.split()
+        where_sql = " AND ".join(["(s.title || ' ' || s.summary || ' ' || s.transcript) LIKE ?"] * len(terms))
+        return where_sql, [f"%{term}%" for term in terms], True
+    return f"{fts_table} MATCH ?", [match_query], False
+
+def _search_reports_sync(q: str, match_query: str, limit: int, offset: int) -> tuple:
+    try:
+        conn = get_db_connection()
+        # (全文索引, 任務資料表, FTS5 資料表名稱)；歸檔中的任務排除仍留在熱資料庫的重複列 (歸檔中斷時可能發生)
+        sources = [("main.report_search", "main.tasks", "report_search", "")]
+        if {"archived_tasks", "archived_report_search"} <= _attach_archive_sync(conn):
+            sources.append(("archive.archived_report_search", "archive.archived_tasks", "archived_report_search", " AND t.task_id NOT IN (SELECT task_id FROM main.tasks)"))
+        count_queries, select_queries, count_params, select_params = [], [], [], []
+        for search_table, task_table, fts_table, extra_where_sql in sources:
+            where_sql, where_params, use_like_fallback = _build_search_where_clause(q, match_query, fts_table)
+            if use_like_fallback:
+                sort_sql = "t.completion_time"
+                snippet_sql = "substr(s.summary || ' ' || s.transcript, 1, 120)"
+            else:
+                sort_sql = f"bm25({fts_table})"
+                # 以控制字元標記命中詞，HTML 跳脫後再換成 <mark>，避免報告內容被當成 HTML 注入
+                snippet_sql = f"snippet({fts_table}, -1, char(2), char(3), '…', 24)"
+            count_queries.append(f"SELECT COUNT(*) FROM {search_table} s JOIN {task_table} t ON t.task_id = s.task_id WHERE {where_sql}{extra_where_sql}")
+            select_queries.append(f"""
+                SELECT s.task_id, t.source_name, t.model_id, t.completion_time, t.download_links, {snippet_sql} AS snippet, {sort_sql} AS sort_key
+                FROM {search_table} s JOIN {task_table} t ON t.task_id = s.task_id
+                WHERE {where_sql}{extra_where_sql}""")
+            count_params += where_params
+            select_params += where_params
+        cursor = conn.cursor()
+        cursor.execute("SELECT " + " + ".join(f"({count_query})" for count_query in count_queries), count_params)
+        total = cursor.fetchone()[0]
+        cursor.execute(" UNION ALL ".join(select_queries) + f" ORDER BY sort_key {'DESC' if use_like_fallback else 'ASC'} LIMIT ? OFFSET ?",
+                       select_params + [limit, offset])
+        return total, cursor.fetchall()
+    finally:
+        if 'conn' in locals() and conn: conn.close()
+
+@app.get("/api/search")
+async def search_reports(q: str, limit: int = 20, offset: int = 0):
+    logger.debug(f"[API_SEARCH] 搜尋報告: '{q}' (limit={limit}, offset={offset})")
+    if not search_index_state["available"]:
+        raise HTTPException(status_code=503, detail="全文搜尋索引不可用 (SQLite 不支援 FTS5)。")
+    match_query = _build_fts_match_query(q)
+    if not match_query:
+        raise HTTPException(status_code=400, detail="搜尋關鍵字不可為空。")
+    limit = max(1, min(limit, SEARCH_MAX_PAGE_SIZE))
+    offset = max(0, offset)
+
+    # 計數與查詢在大量逐字稿上可能需要數百毫秒，在執行緒中執行以免阻塞事件迴圈
+    try:
+        total, rows = await asyncio.to_thread(_search_reports_sync, q, match_query, limit, offset)
+    except sqlite3.Error as e_sql:
+        logger.error(f"[API_SEARCH] [ERROR_DB] 全文搜尋時 SQLite 錯誤: {e_sql}")
+        raise HTTPException(status_code=400, detail=f"搜尋失敗: {e_sql}")
+
+    results = []
+    for row in rows:
+        snippet_html = html.escape(row["snippet"] or "").replace("\x02", "<mark>").replace("\x03", "</mark>")
+        try:
+            download_links = json.loads(row["download_links"]) if row["download_links"] else None
+        except json.JSONDecodeError:
+            download_links = None
+        results.append({
+            "task_id": row["task_id"],
+            "source_name": row["source_name"],
+            "model_id": row["model_id"],
+            "completion_time": row["completion_time"],
+            "download_links": download_links,
+            "snippet_html": snippet_html
+        })
+    logger.info(f"[API_SEARCH] 搜尋 '{q}' 共 {total} 筆結果，回傳 {len(results)} 筆。")
+    return {"query": q, "total": total, "limit": limit, "offset": offset, "results": results}
+
+
+# --- 報告批次匯出 (串流 ZIP) ---
+REPORT_EXPORT_FORMATS = ("html", "md", "txt")
+
+class ExportReportsRequest(BaseModel):
+    # 各篩選條件取交集；全部留空時匯出所有已完成的報告
+    task_ids: Optional[List[str]] = Field(None, max_length=REPORT_EXPORT_MAX_TASKS, description="要匯出的任務 ID 列表")
+    batch_id: Optional[str] = Field(None, description="只匯出此批次的報告")
+    q: Optional[str] = Field(None, description="只匯出符合全文搜尋關鍵字的報告")
+    model_id: Optional[str] = Field(None, description="只匯出以此模型生成的報告")
+    completed_after: Optional[str] = Field(None, description="完成時間下限 (ISO 8601，含)")
+    completed_before: Optional[str] = Field(None, description="完成時間上限 (ISO 8601，不含)")
+    formats: List[Annotated[str, Field(pattern="^(html|md|txt)$")]] = Field(default_factory=lambda: list(REPORT_EXPORT_FORMATS), min_length=1, description="要包含的檔案格式")
+
+def _select_export_report_files_sync(selection: ExportReportsRequest, match_query: Optional[str]) -> tuple:
+    # 只在此查詢任務列表並確認檔案存在；檔案內容留到串流時才逐塊讀取
+    where_clauses = ["t.status = 'completed'", "t.download_links IS NOT NULL"]
+    params: List[Any] = []
+    if selection.task_ids:
+        where_clauses.append("t.task_id IN (SELECT value FROM json_each(?))") # 以 JSON 陣列傳入，避免超過 SQLite 的參數數量上限
+        params.append(json.dumps(selection.task_ids))
+    if selection.batch_id:
+        where_clauses.append("t.batch_id = ?")
+        params.append(selection.batch_id)
+    if selection.model_id:
+        where_clauses.append("t.model_id = ?")
+        params.append(selection.model_id)
+    if selection.completed_after:
+        where_clauses.append("t.completion_time >= ?")
+        params.append(selection.completed_after)
+    if selection.completed_before:
+        where_clauses.append("t.completion_time < ?")
+        params.append(selection.completed_before)
+
+    def _task_query(task_table: str, search_table: str, fts_table: str, extra_where_sql: str) -> tuple:
+        query_clauses, query_params = list(where_clauses), list(params)
+        if match_query:
+            search_where_sql, search_params, _ = _build_search_where_clause(selection.q, match_query, fts_table)
+            query_clauses.append(f"t.task_id IN (SELECT s.task_id FROM {search_table} s WHERE {search_where_sql})")
+            query_params.extend(search_params)
+        return f"SELECT t.task_id, t.download_links, t.completion_time FROM {task_table} t WHERE {' AND '.join(query_clauses)}{extra_where_sql}", query_params
+
+    try:
+        conn = get_db_connection()
+        # 已歸檔的任務報告檔案仍在磁碟上，一併納入匯出
+        task_queries = [_task_query("main.tasks", "main.report_search", "report_search", "")]
+        archive_tables = _attach_archive_sync(conn)
+        if "archived_tasks" in archive_tables and (not match_query or "archived_report_search" in archive_tables):
+            task_queries.append(_task_query("archive.archived_tasks", "archive.archived_report_search", "archived_report_search",
+                                            " AND t.task_id NOT IN (SELECT task_id FROM main.tasks)"))
+        cursor = conn.cursor()
+        cursor.execute(" UNION ALL ".join(query_sql for query_sql, _ in task_queries) + " ORDER BY completion_time ASC LIMIT ?",
+                       [param for _, query_params in task_queries for param in query_params] + [REPORT_EXPORT_MAX_TASKS + 1])
+        rows = cursor.fetchall()
+    finally:
+        if 'conn' in locals() and conn: conn.close()
+    if len(rows) > REPORT_EXPORT_MAX_TASKS:
+        return [], True
+
+    entries = []
+    used_arcnames = set()
+    used_paths = set()
+    for row in rows:
+        try:
+            download_links = json.loads(row["download_links"]) or {}
+        except json.JSONDecodeError:
+            logger.warning(f"[API_EXPORT] 解析任務 {row['task_id']} 的 download_links JSON 失敗，略過。")
+            continue
+        for report_format in selection.formats:
+            link = download_links.get(report_format)
+            if not link:
+                continue
+            file_name = os.path.basename(link) # 只取檔名，確保路徑不會跳出報告目錄
+            file_path = os.path.join(GENERATED_REPORTS_DIR, file_name)
+            if file_path in used_paths:
+                continue
+            if not os.path.isfile(file_path):
+                logger.warning(f"[API_EXPORT] 任務 {row['task_id']} 的 {report_format} 報告檔案不存在，略過: {file_path}")
+                continue
+            arcname = file_name if file_name not in used_arcnames else f"{row['task_id'][:8]}_{file_name}"
+            used_arcnames.add(arcname)
+            used_paths.add(file_path)
+            entries.append({"task_id": row["task_id"], "path": file_path, "arcname": arcname})
+    return entries, False
+
+class _ZipStreamSink(io.RawIOBase):
+    # zipfile 的輸出目標：只暫存尚未送出的位元組。不支援 seek，因此 zipfile 會以資料描述區 (data descriptor)
+    # 在每個檔案之後記錄 CRC 與大小，整個壓縮檔可以邊產生邊送出，不需要暫存檔
+    def __init__(self):
+        super().__init__()
+        self._pending_chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._pending_chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._pending_chunks)
+        self._pending_chunks.clear()
+        return data
+
+def _iter_report_zip(entries: List[Dict[str, Any]]) -> Iterator[bytes]:
+    # 同步產生器：StreamingResponse 會在執行緒池中逐塊迭代，記憶體用量只與 REPORT_EXPORT_CHUNK_BYTES 有關
+    sink = _ZipStreamSink()
+    written_count = 0
+    with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for entry in entries:
+            try:
+                with open(entry["path"], "rb") as source_file:
+                    zip_info = zipfile.ZipInfo.from_file(entry["path"], arcname=entry["arcname"])
+                    zip_info.compress_type = zipfile.ZIP_DEFLATED
+                    with archive.open(zip_info, mode="w") as archive_member:
+                        while True:
+                            chunk = source_file.read(REPORT_EXPORT_CHUNK_BYTES)
+                            if not chunk:
+                                break
+                            archive_member.write(chunk)
+                            pending = sink.drain()
+                            if pending:
+                                yield pending
+                written_count += 1
+            except OSError as e_os:
+                # 選取後才被刪除的檔案直接略過 (尚未寫入任何資料到壓縮檔)
+                logger.warning(f"[API_EXPORT] 讀取報告檔案失敗，略過 {entry['path']}: {e_os}")
+            pending = sink.drain()
+            if pending:
+                yield pending
+    yield sink.drain() # 中央目錄
+    logger.info(f"[API_EXPORT] ZIP 匯出完成，共 {written_count} 個檔案，{sink.tell()} 位元組。")
+
+async def _stream_report_export(selection: ExportReportsRequest) -> StreamingResponse:
+    match_query = None
+    if selection.q is not None:
+        if not search_index_state["available"]:
+            raise HTTPException(status_code=503, detail="全文搜尋索引不可用 (SQLite 不支援 FTS5)。")
+        match_query = _build_fts_match_query(selection.q)
+        if not match_query:
+            raise HTTPException(status_code=400, detail="搜尋關鍵字不可為空。")
+
+    loop = asyncio.get_running_loop()
+    try:
+        entries, exceeds_limit = await loop.run_in_executor(None, _select_export_report_files_sync, selection, match_query)
+    except sqlite3.Error as e_sql:
+        logger.error(f"[API_EXPORT] [ERROR_DB] 查詢要匯出的報告時 SQLite 錯誤: {e_sql}")
+        raise HTTPException(status_code=500, detail="查詢要匯出的報告時發生資料庫錯誤。")
+    if exceeds_limit:
+        raise HTTPException(status_code=400, detail=f"符合條件的報告超過 {REPORT_EXPORT_MAX_TASKS} 個，請縮小篩選範圍。")
+    if not entries:
+        raise HTTPException(status_code=404, detail="沒有符合條件的報告檔案可供匯出。")
+
+    archive_name = f"ai_paper_reports_{datetime.now().strftime('%Y%m%d%H%M%S')}.zip"
+    logger.info(f"[API_EXPORT] 開始串流匯出 {len(entries)} 個報告檔案至 {archive_name}。")
+    return StreamingResponse(
+        _iter_report_zip(entries),
+        media_type="application/zip",
+        headers={
+            "Content-Disposition": f'attachment; filename="{archive_name}"',
+            "Cache-Control": "no-store",
+            "X-Export-File-Count": str(len(entries))
+        }
+    )
+
+@app.post("/api/reports/export")
+async def export_reports(request_data: ExportReportsRequest):
+    return await _stream_report_export(request_data)
+
+@app.get("/api/reports/export")
+async def export_reports_via_query(
+    task_id: Optional[List[str]] = Query(None, description="可重複指定多個任務 ID"),
+    batch_id: Optional[str] = None,
+    q: Optional[str] = None,
+    model_id: Optional[str] = None,
+    completed_after: Optional[str] = None,
+    completed_before: Optional[str] = None,
+    formats: str = ",".join(REPORT_EXPORT_FORMATS)
+):
+    # 供瀏覽器直接以連結下載 (不需先以 fetch 讀取整個壓縮檔)；大量任務請改用 POST
+    try:
+        selection = ExportReportsRequest(
+            task_ids=task_id, batch_id=batch_id, q=q, model_id=model_id,
+            completed_after=completed_after, completed_before=completed_before,
+            formats=[fmt.strip() for fmt in formats.split(",") if fmt.strip()]
+        )
+    except ValueError as e_val:
+        raise HTTPException(status_code=422, detail=str(e_val))
+    return await _stream_report_export(selection)
+
+
 # --- 下載生成的報告檔案 API ---
 try:
     if os.path.exists(GENERATED_REPORTS_DIR):
@@ -1005,7 +3721,14 @@ async def read_root(request: Request):
         error_msg = "<html><body><h1>錯誤：主模板引擎未初始化。請檢查伺服器日誌。</h1></body></html>"
         logger.critical("主模板引擎未初始化。")
         return HTMLResponse(error_msg, status_code=500)
-    return templates.TemplateResponse("index.html", {"request": request, "title": "AI_paper 智能助理 v2.4 (穩定版)"})
+    page_response = templates.TemplateResponse(request, "index.html", {"title": "AI_paper 智能助理 v2.4 (穩定版)"})
+    # 頁面本身每次都需驗證，但內容未變時只回傳 304；靜態資源則透過指紋網址直接命中瀏覽器快取
+    etag = f'"{hashlib.sha256(page_response.body).hexdigest()[:16]}"'
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    page_response.headers["ETag"] = etag
+    page_response.headers["Cache-Control"] = "no-cache"
+    return page_response
 
 
 # --- API 狀態 ---
@@ -1014,6 +3737,23 @@ async def get_api_status():
     logger.debug("[API_STATUS] 請求 API 狀態。")
     return {"status": "AI_paper API v2.4 is running", "version": "2.4.0_optimized"}
 
+@app.get("/api/health/live")
+async def get_liveness():
+    # 存活檢查：只要事件迴圈能回應即可，不觸及資料庫或外部服務
+    return {"status": "alive"}
+
+@app.get("/api/health/ready")
+async def get_readiness():
+    # 就緒檢查：資料庫初始化成功且背景啟動工作完成後才回傳 200
+    payload = {
+        "status": "ready" if startup_state["ready"] else "starting",
+        "db_ready": startup_state["db_ready"],
+        "api_key_check": startup_state["api_key_check"],
+        "temp_cleanup_done": startup_state["temp_cleanup_done"],
+        "timings": startup_state["timings"]
+    }
+    return JSONResponse(content=payload, status_code=200 if startup_state["ready"] else 503)
+
 if __name__ == "__main__":
     logger.info("若在本地執行 app.py，請確保 CWD 設定正確。")
     uvicorn.run("app:app", host="0.0.0.0", port=8000, reload=True, workers=1)
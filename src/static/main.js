@@ -521,7 +521,7 @@ document.addEventListener('DOMContentLoaded', () => {
             taskElement.classList.add('task-item', 'card');
             if (task.status === 'completed') {
                 taskElement.classList.add('task-completed');
-            } else if (task.status === 'failed') {
+            } else if (task.status === 'failed' || task.status === 'cancelled') {
                 taskElement.classList.add('task-failed');
             } else {
                 taskElement.classList.add('task-processing');
@@ -537,6 +537,16 @@ document.addEventListener('DOMContentLoaded', () => {
                     statusText = '佇列中';
                     statusClass = 'status-queued';
                     break;
+                case 'downloading':
+                    statusIcon = '<i class="fas fa-cloud-download-alt"></i>';
+                    statusText = '下載中';
+                    statusClass = 'status-queued';
+                    break;
+                case 'preprocessing':
+                    statusIcon = '<i class="fas fa-sliders-h"></i>';
+                    statusText = '音訊前處理中';
+                    statusClass = 'status-processing';
+                    break;
                 case 'processing':
                     statusIcon = '<i class="fas fa-spinner fa-spin"></i>';
                     statusText = '處理中';
@@ -552,6 +562,11 @@ document.addEventListener('DOMContentLoaded', () => {
                     statusText = '失敗';
                     statusClass = 'status-failed';
                     break;
+                case 'cancelled':
+                    statusIcon = '<i class="fas fa-ban"></i>';
+                    statusText = '已取消';
+                    statusClass = 'status-failed';
+                    break;
                 default:
                     statusIcon = '<i class="fas fa-question-circle"></i>';
                     statusText = '未知狀態';
@@ -570,18 +585,23 @@ document.addEventListener('DOMContentLoaded', () => {
                 </div>
                 <div class="task-details">
                     <p><strong>模型:</strong> ${task.model_id}</p>
+                    ${task.estimated_seconds != null ? `<p><strong>預估處理時間:</strong> 約 ${Math.round(task.estimated_seconds)} 秒 (音訊長度 ${Math.round((task.audio_duration_seconds || 0) / 60)} 分鐘)</p>` : ''}
                     <p><strong>提交時間:</strong> ${submitTime}</p>
                     <p><strong>開始時間:</strong> ${startTime}</p>
                     <p><strong>完成時間:</strong> ${completionTime}</p>
                     ${task.status === 'failed' && task.error_message ? `<p class="error-message"><strong>錯誤:</strong> ${task.error_message}</p>` : ''}
                     <div class="task-actions">
                         ${task.status === 'completed' ? `<button class="view-report-btn button-secondary" data-task-id="${task.task_id}"><i class="fas fa-eye"></i> 查看報告</button>` : ''}
+                        ${!['completed', 'failed', 'cancelled'].includes(task.status) ? `<button class="cancel-task-btn button-secondary" data-task-id="${task.task_id}"><i class="fas fa-ban"></i> 取消任務</button>` : ''}
+                        ${['failed', 'cancelled'].includes(task.status) ? `<button class="retry-task-btn button-secondary" data-task-id="${task.task_id}"><i class="fas fa-redo"></i> 重試</button>` : ''}
                     </div>
                 </div>
             `;
             taskQueueContainer.appendChild(taskElement);
         });
         attachViewReportListeners(); // 重新綁定事件監聽器
+        attachCancelTaskListeners();
+        attachRetryTaskListeners();
     }
 
     async function fetchTaskQueue() {
@@ -603,7 +623,7 @@ document.addEventListener('DOMContentLoaded', () => {
 
             currentPollingDelay = INITIAL_POLLING_INTERVAL; // Reset delay on successful fetch
 
-            const anyProcessingOrQueued = tasks.some(task => task.status === 'processing' || task.status === 'queued');
+            const anyProcessingOrQueued = tasks.some(task => !['completed', 'failed', 'cancelled'].includes(task.status));
             if (!anyProcessingOrQueued && tasks.length > 0) { // tasks.length > 0 ensures we don't stop if initially empty
                 isPollingStoppedManually = true;
                 pollingTimeoutId = null; // Clear timeoutId as we are stopping
@@ -627,6 +647,59 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
+    // 綁定取消任務按鈕的事件監聽器
+    function attachCancelTaskListeners() {
+        document.querySelectorAll('.cancel-task-btn').forEach(button => {
+            if (button.dataset.listenerAttached) return;
+            button.dataset.listenerAttached = 'true';
+
+            button.addEventListener('click', async (event) => {
+                const taskId = event.currentTarget.dataset.taskId;
+                _disableButton(event.currentTarget, '取消中...', 'fas fa-sync-alt fa-spin');
+                try {
+                    const response = await fetch(`/api/tasks/${taskId}/cancel`, { method: 'POST' });
+                    const data = await response.json().catch(() => ({}));
+                    if (!response.ok) {
+                        throw new Error(data.detail || `取消任務失敗 (狀態: ${response.status})`);
+                    }
+                    logStatus(`任務 ${taskId.substring(0,8)} 已取消。`, 'success', {clearExisting: false});
+                } catch (error) {
+                    console.error("取消任務時發生錯誤:", error);
+                    logStatus(`取消任務失敗: ${error.message}`, 'error', {clearExisting: false});
+                } finally {
+                    fetchTaskQueue(); // 立即刷新佇列
+                }
+            });
+        });
+    }
+
+    // 綁定重試任務按鈕的事件監聽器 (後端會從最後完成的階段繼續)
+    function attachRetryTaskListeners() {
+        document.querySelectorAll('.retry-task-btn').forEach(button => {
+            if (button.dataset.listenerAttached) return;
+            button.dataset.listenerAttached = 'true';
+
+            button.addEventListener('click', async (event) => {
+                const taskId = event.currentTarget.dataset.taskId;
+                _disableButton(event.currentTarget, '重試中...', 'fas fa-sync-alt fa-spin');
+                try {
+                    const response = await fetch(`/api/tasks/${taskId}/retry`, { method: 'POST' });
+                    const data = await response.json().catch(() => ({}));
+                    if (!response.ok) {
+                        throw new Error(data.detail || `重試任務失敗 (狀態: ${response.status})`);
+                    }
+                    logStatus(`任務 ${taskId.substring(0,8)} 已重新加入佇列。`, 'success', {clearExisting: false});
+                } catch (error) {
+                    console.error("重試任務時發生錯誤:", error);
+                    logStatus(`重試任務失敗: ${error.message}`, 'error', {clearExisting: false});
+                } finally {
+                    isPollingStoppedManually = false; // 任務重新進入佇列，恢復輪詢
+                    fetchTaskQueue();
+                }
+            });
+        });
+    }
+
     // 重新綁定查看報告按鈕的事件監聽器
     function attachViewReportListeners() {
         document.querySelectorAll('.view-report-btn').forEach(button => {
@@ -766,7 +839,8 @@ document.addEventListener('DOMContentLoaded', () => {
                     }
                     throw new Error(readableError);
                 }
-                logStatus(`任務 ${result.task_id} 已成功提交: ${result.message}`, 'success');
+                const estimateText = result.estimate ? ` (模型: ${result.model_id.replace("models/", "")}，預估處理約 ${Math.round(result.estimate.estimated_processing_seconds)} 秒)` : '';
+                logStatus(`任務 ${result.task_id} 已成功提交: ${result.message}${estimateText}`, 'success');
                 console.info(`[AnalysisStart] 任務 ${result.task_id} 已提交。`);
 
                 // New polling (re)start logic
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import sys
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import pytest
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.insert(0, os.path.abspath(SRC_DIR))
+
+# 測試不應依賴網路或真實的 API 金鑰；測試音訊不是有效的音訊檔，略過 ffmpeg
+for _env_name in ("GOOGLE_API_KEY", "GOOGLE_API_KEYS"):
+    os.environ.pop(_env_name, None)
+os.environ["APP_AUDIO_PREPROCESS_ENABLED"] = "false"
+os.environ["APP_DB_MAINTENANCE_INTERVAL_SECONDS"] = "0"
+
+import app as app_module  # noqa: E402
+
+@pytest.fixture
+def app_env(tmp_path, monkeypatch):
+    """在臨時工作目錄中執行 app，資料庫、暫存音訊與報告都寫在該目錄下。"""
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("generated_reports", exist_ok=True)
+    # 關閉事件會關閉模組層級的執行緒池；每個測試各自使用新的執行緒池，才能在同一個行程中多次啟動 app
+    for executor_name, max_workers in (("executor", app_module.MAX_CONCURRENT_TASKS), ("batch_download_executor", app_module.BATCH_DOWNLOAD_CONCURRENCY),
+                                       ("audio_preprocess_executor", app_module.AUDIO_PREPROCESS_WORKERS)):
+        monkeypatch.setattr(app_module, executor_name, ThreadPoolExecutor(max_workers=max_workers))
+
+    def _fake_download(youtube_url, task_id="N/A"):
+        os.makedirs(app_module.TEMP_AUDIO_STORAGE_DIR, exist_ok=True)
+        audio_path = os.path.join(app_module.TEMP_AUDIO_STORAGE_DIR, f"dl_{task_id[:8]}.m4a")
+        with open(audio_path, "wb") as f:
+            f.write(b"\0" * 1000)
+        return audio_path
+
+    monkeypatch.setattr(app_module, "_download_youtube_audio_sync", _fake_download)
+    return app_module
+
+@pytest.fixture
+def seed_report(app_env):
+    """直接寫入一筆已完成的任務與其全文搜尋文件，回傳 task_id；不經過處理管線，方便控制報告內容。"""
+    assert app_env.init_db()
+
+    def _seed(title, summary_text, transcript_text, completion_time=None, download_links=None):
+        task_id = str(uuid.uuid4())
+        completion_time = completion_time or datetime.now(timezone.utc).isoformat()
+        conn = app_env.get_db_connection()
+        try:
+            conn.execute(
+                "INSERT INTO tasks (task_id, status, source_name, model_id, submit_time, completion_time, download_links) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (task_id, "completed", title, "models/gemini-1.5-flash-latest", completion_time, completion_time, json.dumps(download_links))
+            )
+            app_env.index_report_for_search(conn.cursor(), task_id, title, {"intro_paragraph": summary_text, "items": []},
+                                             {"paragraphs": [{"content": transcript_text, "is_speaker_line": False}]})
+            conn.commit()
+        finally:
+            conn.close()
+        return task_id
+    return _seed
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+import pytest
+
+def _pool_with_keys(app_env, count):
+    pool = app_env.ApiKeyPool()
+    return pool, [pool.add_key(f"test-key-{index:04d}", "runtime") for index in range(count)]
+
+def test_run_rotates_to_next_key_on_rate_limit(app_env):
+    pool, (first_key, second_key) = _pool_with_keys(app_env, 2)
+    used_keys = []
+
+    async def _call(key_state):
+        used_keys.append(key_state)
+        if key_state is first_key:
+            raise app_env.google_api_exceptions.ResourceExhausted("429 quota exceeded")
+        return "ok"
+
+    assert asyncio.run(pool.run(_call)) == "ok"
+    assert used_keys == [first_key, second_key]
+    assert first_key.status == "rate_limited"
+    assert first_key.cooldown_until > 0
+    assert second_key.status == "healthy"
+    assert [key_state.in_flight for key_state in (first_key, second_key)] == [0, 0]
+    # 冷卻中的金鑰不參與輪替
+    assert pool.acquire() is second_key
+
+def test_cooldown_backs_off_and_key_returns_after_expiry(app_env, monkeypatch):
+    monkeypatch.setattr(app_env, "API_KEY_COOLDOWN_SECONDS", 10)
+    monkeypatch.setattr(app_env, "API_KEY_MAX_COOLDOWN_SECONDS", 15)
+    pool, (key_state,) = _pool_with_keys(app_env, 1)
+    rate_limit_error = app_env.google_api_exceptions.ResourceExhausted("429 quota exceeded")
+
+    cooldowns = []
+    for _ in range(3):
+        pool.release(pool.acquire(), rate_limit_error)
+        assert key_state.status == "rate_limited"
+        remaining = key_state.cooldown_until - app_env.time.monotonic()
+        cooldowns.append(round(remaining))
+        with pytest.raises(app_env.NoAvailableApiKeyError) as exc_info:
+            pool.acquire()
+        assert exc_info.value.retry_after == pytest.approx(remaining, abs=1)
+        key_state.cooldown_until = 0 # 模擬冷卻時間已過，下次取用時恢復輪替
+    assert cooldowns == [10, 15, 15] # 連續觸發時加倍，但不超過上限
+
+    pool.release(pool.acquire())
+    assert key_state.status == "healthy"
+    assert key_state.consecutive_rate_limits == 0
+
+def test_acquire_spreads_load_across_keys(app_env):
+    pool, key_states = _pool_with_keys(app_env, 3)
+    leased = [pool.acquire() for _ in range(3)]
+    assert sorted(key_state.api_key for key_state in leased) == sorted(key_state.api_key for key_state in key_states)
+    for key_state in leased:
+        pool.release(key_state)
+    assert pool.acquire() in key_states
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+import io
+import os
+import zipfile
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+
+def _write_report_file(app_env, file_name, content):
+    with open(os.path.join(app_env.GENERATED_REPORTS_DIR, file_name), "w", encoding="utf-8") as f:
+        f.write(content)
+    return f"/generated_reports/{file_name}"
+
+@pytest.fixture
+def archived_task_id(app_env, seed_report, monkeypatch):
+    if app_env.search_index_state["tokenizer"] != "trigram":
+        pytest.skip("此 SQLite 不支援 trigram 分詞器")
+    monkeypatch.setattr(app_env, "TASK_RETENTION_DAYS", 30)
+    old_completion = (datetime.now(timezone.utc) - timedelta(days=60)).isoformat()
+    task_id = seed_report("學期第一週講座", "介紹課程安排與評分方式", "同學們好，本學期我們會討論分散式系統",
+                          completion_time=old_completion,
+                          download_links={"md": _write_report_file(app_env, "week1.md", "# 第一週"), "txt": _write_report_file(app_env, "week1.txt", "第一週")})
+    seed_report("學期第十週講座", "期末專題說明", "本週說明分散式系統的期末專題")
+    result = app_env.run_db_maintenance_sync([])
+    assert result["archived"]["tasks"] == 1
+    assert result["archived"]["search_documents"] == 1
+    return task_id
+
+def test_archived_task_is_still_searchable(app_env, archived_task_id):
+    with TestClient(app_env.app) as client:
+        body = client.get("/api/search", params={"q": "分散式系統"}).json()
+        assert body["total"] == 2
+        assert archived_task_id in [result["task_id"] for result in body["results"]]
+        # 兩個字元的詞走 LIKE 路徑，同樣包含歸檔的報告
+        assert [result["task_id"] for result in client.get("/api/search", params={"q": "評分"}).json()["results"]] == [archived_task_id]
+        assert client.get(f"/api/tasks/{archived_task_id}").json()["archived"] is True
+
+def test_archived_task_is_still_exportable(app_env, archived_task_id):
+    with TestClient(app_env.app) as client:
+        response = client.get("/api/reports/export", params={"task_id": archived_task_id})
+        assert response.status_code == 200
+        assert sorted(zipfile.ZipFile(io.BytesIO(response.content)).namelist()) == ["week1.md", "week1.txt"]
+        response = client.get("/api/reports/export", params={"q": "課程安排", "formats": "md"})
+        assert response.status_code == 200
+        assert zipfile.ZipFile(io.BytesIO(response.content)).namelist() == ["week1.md"]
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import time
+
+def _make_cache_file(cache_dir, name, size, days_ago):
+    path = os.path.join(cache_dir, name)
+    with open(path, "wb") as f:
+        f.write(b"\0" * size)
+    last_used = time.time() - days_ago * 86400
+    os.utime(path, (last_used, last_used))
+    return path
+
+def test_evicts_expired_then_least_recently_used(app_env, monkeypatch, tmp_path):
+    cache_dir = str(tmp_path / "audio_cache")
+    os.makedirs(cache_dir)
+    monkeypatch.setattr(app_env, "AUDIO_CACHE_DIR", cache_dir)
+    monkeypatch.setattr(app_env, "AUDIO_CACHE_MAX_AGE_DAYS", 14)
+    monkeypatch.setattr(app_env, "AUDIO_CACHE_MAX_BYTES", 250)
+    expired = _make_cache_file(cache_dir, "expired.mp3", 100, days_ago=30)
+    protected = _make_cache_file(cache_dir, "protected.mp3", 100, days_ago=20)
+    oldest = _make_cache_file(cache_dir, "oldest.mp3", 100, days_ago=3)
+    older = _make_cache_file(cache_dir, "older.mp3", 100, days_ago=2)
+    newest = _make_cache_file(cache_dir, "newest.mp3", 100, days_ago=1)
+    stale_partial = _make_cache_file(cache_dir, "x.1234abcd.partial.mp3", 10, days_ago=1)
+    fresh_partial = _make_cache_file(cache_dir, "y.1234abcd.partial.mp3", 10, days_ago=0)
+
+    result = app_env._evict_audio_cache_sync({os.path.abspath(protected)})
+
+    remaining = {path for path in (expired, protected, oldest, older, newest, stale_partial, fresh_partial) if os.path.exists(path)}
+    assert remaining == {protected, older, newest, fresh_partial}
+    assert result == {"removed_files": 3, "removed_bytes": 210, "remaining_files": 2, "remaining_bytes": 200}
+
+def test_maintenance_protects_audio_of_active_tasks(app_env, monkeypatch, tmp_path):
+    cache_dir = str(tmp_path / "audio_cache")
+    os.makedirs(cache_dir)
+    monkeypatch.setattr(app_env, "AUDIO_CACHE_DIR", cache_dir)
+    monkeypatch.setattr(app_env, "AUDIO_CACHE_MAX_BYTES", 1)
+    in_use = _make_cache_file(cache_dir, "in_use.mp3", 100, days_ago=1)
+    unused = _make_cache_file(cache_dir, "unused.mp3", 100, days_ago=1)
+    assert app_env.init_db()
+    app_env.save_task_checkpoint("active-task", "audio", {"source_path": "a.m4a", "analysis_audio_path": in_use})
+
+    result = app_env.run_db_maintenance_sync(["active-task"])
+
+    assert result["audio_cache"]["removed_files"] == 1
+    assert os.path.exists(in_use) and not os.path.exists(unused)
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+import json
+import time
+
+from fastapi.testclient import TestClient
+
+def _wait_for_batch(client, batch_id, timeout_seconds=30):
+    deadline = time.monotonic() + timeout_seconds
+    while time.monotonic() < deadline:
+        batch = client.get(f"/api/batches/{batch_id}").json()
+        if batch["is_finished"]:
+            return batch
+        time.sleep(0.05)
+    raise AssertionError(f"批次 {batch_id} 未在 {timeout_seconds} 秒內完成")
+
+def test_batch_items_use_requested_backend(app_env, monkeypatch):
+    local_backend = app_env.MODEL_BACKENDS["local"]
+    original_generate = local_backend.generate
+    seen_requests = []
+
+    async def _recording_generate(request_data, analysis_audio_path, key_pool):
+        seen_requests.append((request_data.model_backend, request_data.backend_options))
+        return await original_generate(request_data, analysis_audio_path, key_pool)
+
+    monkeypatch.setattr(local_backend, "generate", _recording_generate)
+    backend_options = {"latency_seconds": 0, "transcript_paragraphs": 1}
+    with TestClient(app_env.app) as client:
+        response = client.post("/api/batch_generate_report", json={
+            "urls": ["https://www.youtube.com/watch?v=aaaaaaaaaaa", "https://www.youtube.com/watch?v=bbbbbbbbbbb"],
+            "model_id": "models/gemini-1.5-flash-latest", "output_options": ["summary_transcript_tc", "md"],
+            "model_backend": "local", "backend_options": backend_options
+        })
+        assert response.status_code == 202
+        batch_id = response.json()["batch_id"]
+        _wait_for_batch(client, batch_id)
+        tasks = [client.get(f"/api/tasks/{task_id}").json() for task_id in response.json()["task_ids"]]
+
+    assert seen_requests == [("local", backend_options)] * 2
+    assert all(task["status"] == "completed" for task in tasks)
+
+    # 重試與恢復依 request_data 重建請求，必須保留後端設定
+    conn = app_env.get_db_connection()
+    try:
+        stored_requests = [json.loads(row["request_data"]) for row in conn.execute("SELECT request_data FROM tasks WHERE batch_id = ?", (batch_id,))]
+    finally:
+        conn.close()
+    assert len(stored_requests) == 2
+    for stored_request in stored_requests:
+        assert stored_request["model_backend"] == "local"
+        assert stored_request["backend_options"] == backend_options
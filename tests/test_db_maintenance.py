@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+import os
+import sqlite3
+
+from fastapi.testclient import TestClient
+
+def _create_legacy_database(app_env):
+    # 較早版本建立的資料庫沒有啟用 incremental auto_vacuum
+    os.makedirs(os.path.dirname(app_env.DATABASE_URL), exist_ok=True)
+    conn = sqlite3.connect(app_env.DATABASE_URL)
+    conn.execute("CREATE TABLE tasks (task_id TEXT PRIMARY KEY, status TEXT NOT NULL, source_name TEXT, model_id TEXT, submit_time TEXT NOT NULL, "
+                 "start_time TEXT, completion_time TEXT, result_preview_html TEXT, download_links TEXT, error_message TEXT, request_data TEXT)")
+    conn.commit()
+    conn.close()
+    assert app_env.init_db()
+
+def _auto_vacuum_mode(app_env) -> int:
+    conn = sqlite3.connect(app_env.DATABASE_URL)
+    try:
+        return conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+    finally:
+        conn.close()
+
+def test_periodic_maintenance_never_runs_full_vacuum(app_env):
+    _create_legacy_database(app_env)
+    result = app_env.run_db_maintenance_sync([])
+    assert result["vacuum"]["mode"] == "skipped"
+    assert _auto_vacuum_mode(app_env) == 0
+
+def test_explicit_request_converts_to_incremental(app_env):
+    _create_legacy_database(app_env)
+    with TestClient(app_env.app) as client:
+        assert client.post("/api/db/maintenance").json()["vacuum"]["mode"] == "skipped"
+        assert client.post("/api/db/maintenance", params={"full_vacuum": "true"}).json()["vacuum"]["mode"] == "full_vacuum"
+        assert _auto_vacuum_mode(app_env) == 2
+        assert client.post("/api/db/maintenance").json()["vacuum"]["mode"] == "incremental"
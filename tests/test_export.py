@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+import io
+import os
+import zipfile
+
+import pytest
+from fastapi.testclient import TestClient
+
+def _write_report_file(app_env, file_name, content):
+    with open(os.path.join(app_env.GENERATED_REPORTS_DIR, file_name), "w", encoding="utf-8") as f:
+        f.write(content)
+    return f"/generated_reports/{file_name}"
+
+def _zip_contents(response):
+    archive = zipfile.ZipFile(io.BytesIO(response.content))
+    assert archive.testzip() is None
+    return {name: archive.read(name).decode("utf-8") for name in archive.namelist()}
+
+@pytest.fixture
+def exported_reports(app_env, seed_report, monkeypatch):
+    # 縮小讀取區塊，讓較大的報告分成多塊串流寫入壓縮檔
+    monkeypatch.setattr(app_env, "REPORT_EXPORT_CHUNK_BYTES", 64)
+    long_transcript = "第一週講座逐字稿。" * 200
+    first_id = seed_report("week1", "課程介紹", "逐字稿", completion_time="2026-01-01T10:00:00+00:00", download_links={
+        "html": _write_report_file(app_env, "week1.html", "<h1>第一週</h1>"),
+        "md": _write_report_file(app_env, "week1.md", long_transcript),
+        "txt": _write_report_file(app_env, "week1.txt", "第一週")
+    })
+    second_id = seed_report("week2", "期中考說明", "逐字稿", completion_time="2026-01-08T10:00:00+00:00", download_links={
+        "md": _write_report_file(app_env, "week2.md", "# 第二週"),
+        "txt": "/generated_reports/week2_missing.txt" # 檔案已被刪除，匯出時略過
+    })
+    return {"first": first_id, "second": second_id, "long_transcript": long_transcript}
+
+def test_export_zip_contains_report_files(app_env, exported_reports):
+    with TestClient(app_env.app) as client:
+        response = client.post("/api/reports/export", json={"task_ids": [exported_reports["first"], exported_reports["second"]]})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/zip"
+    assert response.headers["content-disposition"].startswith('attachment; filename="ai_paper_reports_')
+    assert response.headers["x-export-file-count"] == "4"
+    assert _zip_contents(response) == {
+        "week1.html": "<h1>第一週</h1>",
+        "week1.md": exported_reports["long_transcript"],
+        "week1.txt": "第一週",
+        "week2.md": "# 第二週"
+    }
+
+def test_export_filters_by_format_and_completion_time(app_env, exported_reports):
+    with TestClient(app_env.app) as client:
+        md_only = client.get("/api/reports/export", params={"formats": "md"})
+        assert sorted(_zip_contents(md_only)) == ["week1.md", "week2.md"]
+        recent = client.get("/api/reports/export", params={"completed_after": "2026-01-05T00:00:00+00:00"})
+        assert sorted(_zip_contents(recent)) == ["week2.md"]
+        assert client.get("/api/reports/export", params={"completed_after": "2027-01-01T00:00:00+00:00"}).status_code == 404
+        assert client.get("/api/reports/export", params={"formats": "pdf"}).status_code == 422
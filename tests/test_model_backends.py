@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+import pytest
+
+def test_model_backend_requires_generate(app_env):
+    class IncompleteBackend(app_env.ModelBackend):
+        name = "incomplete"
+
+    with pytest.raises(TypeError):
+        IncompleteBackend()
+
+class _FakeFileClient:
+    def __init__(self, glm):
+        self.glm = glm
+        self.created, self.deleted = [], []
+
+    def create_file(self, path, mime_type=None, display_name=None):
+        self.created.append((path, mime_type))
+        return self.glm.File(name="files/audio1", uri="https://example.invalid/files/audio1", mime_type=mime_type, state=self.glm.File.State.PROCESSING)
+
+    def get_file(self, name):
+        return self.glm.File(name=name, uri=f"https://example.invalid/{name}", mime_type="audio/mp4", state=self.glm.File.State.ACTIVE)
+
+    def delete_file(self, name):
+        self.deleted.append(name)
+
+class _FakeGenerativeClient:
+    def __init__(self, glm):
+        self.glm = glm
+        self.requests = []
+
+    def generate_content(self, request, timeout=None):
+        self.requests.append(request)
+        return self.glm.GenerateContentResponse(candidates=[self.glm.Candidate(content=self.glm.Content(parts=[self.glm.Part(text="第一行總結")]))])
+
+class _FakeKeyState:
+    label = "...fake"
+
+    def __init__(self, glm):
+        self._file_client = _FakeFileClient(glm)
+        self._generative_client = _FakeGenerativeClient(glm)
+
+    def file_client(self):
+        return self._file_client
+
+    def generative_client(self):
+        return self._generative_client
+
+class _FakeKeyPool:
+    def __init__(self, key_state):
+        self.key_state = key_state
+
+    async def run(self, call):
+        return await call(self.key_state)
+
+def test_gemini_uploads_audio_over_inline_limit(app_env, monkeypatch, tmp_path):
+    monkeypatch.setattr(app_env, "GEMINI_INLINE_AUDIO_MAX_BYTES", 100)
+    monkeypatch.setattr(app_env, "GEMINI_FILE_POLL_INTERVAL_SECONDS", 0)
+    audio_path = tmp_path / "long.m4a"
+    audio_path.write_bytes(b"\0" * 1000)
+    key_state = _FakeKeyState(app_env.glm)
+    request_data = app_env.GenerateReportRequest(source_type="upload", source_path=str(audio_path), model_id="models/gemini-1.5-flash-latest",
+                                                 output_options=["summary_transcript_tc"], model_backend="gemini")
+
+    outputs = asyncio.run(app_env.MODEL_BACKENDS["gemini"].generate(request_data, str(audio_path), _FakeKeyPool(key_state)))
+
+    assert outputs == {"summary_text": "第一行總結", "transcript_text": "第一行總結"}
+    assert len(key_state.file_client().created) == 1 # 摘要與逐字稿共用同一次上傳
+    sent_requests = key_state.generative_client().requests
+    assert len(sent_requests) == 2
+    for sent_request in sent_requests:
+        audio_part = sent_request.contents[0].parts[1]
+        assert audio_part.file_data.file_uri == "https://example.invalid/files/audio1"
+        assert not audio_part.inline_data.data
+    assert key_state.file_client().deleted == ["files/audio1"]
+
+def test_local_backend_output_ignores_latency_settings(app_env, tmp_path):
+    audio_path = tmp_path / "talk.m4a"
+    audio_path.write_bytes(b"\0" * 1000)
+
+    def _generate(model_id, backend_options):
+        request_data = app_env.GenerateReportRequest(source_type="upload", source_path=str(audio_path), model_id=model_id,
+                                                     output_options=["summary_transcript_tc"], model_backend="local", backend_options=backend_options)
+        return asyncio.run(app_env.MODEL_BACKENDS["local"].generate(request_data, str(audio_path), None))
+
+    baseline = _generate("models/gemini-1.5-flash-latest", {"latency_seconds": 0})
+    assert _generate("models/gemini-1.5-flash-latest", {"latency_seconds": 0.01}) == baseline
+    assert _generate("models/gemini-1.5-pro-latest", {"latency_seconds": 0}) != baseline
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import os
+import threading
+import time
+
+from fastapi.testclient import TestClient
+
+LOCAL_BACKEND_OPTIONS = {"latency_seconds": 0, "transcript_paragraphs": 2}
+
+def _submit_local_report(client, app_env, name="clip.m4a", output_options=("summary_transcript_tc", "md", "txt")):
+    os.makedirs(app_env.TEMP_AUDIO_STORAGE_DIR, exist_ok=True)
+    source_path = os.path.join(app_env.TEMP_AUDIO_STORAGE_DIR, name)
+    with open(source_path, "wb") as f:
+        f.write(b"\0" * 1000)
+    response = client.post("/api/generate_report", json={
+        "source_type": "upload", "source_path": source_path, "model_id": "models/gemini-1.5-flash-latest",
+        "output_options": list(output_options), "model_backend": "local", "backend_options": LOCAL_BACKEND_OPTIONS
+    })
+    assert response.status_code == 202
+    return response.json()["task_id"]
+
+def _wait_for_status(client, task_id, statuses, timeout_seconds=30):
+    deadline = time.monotonic() + timeout_seconds
+    while time.monotonic() < deadline:
+        task = client.get(f"/api/tasks/{task_id}").json()
+        if task["status"] in statuses:
+            return task
+        time.sleep(0.05)
+    raise AssertionError(f"任務 {task_id} 未在 {timeout_seconds} 秒內進入 {statuses}")
+
+def _report_files(app_env):
+    return sorted(os.listdir(app_env.GENERATED_REPORTS_DIR))
+
+def test_cancel_during_rendering_removes_written_reports(app_env, monkeypatch):
+    original_check = app_env._raise_if_task_cancelled
+    html_written = threading.Event()
+    checks = []
+
+    def _pausing_check(task_id, message):
+        # 第二次檢查發生在 HTML 已寫出、Markdown 尚未寫出時；在此等待取消請求送達
+        checks.append(task_id)
+        if len(checks) == 2:
+            html_written.set()
+            assert app_env.task_cancel_flags[task_id].wait(10)
+        original_check(task_id, message)
+
+    monkeypatch.setattr(app_env, "_raise_if_task_cancelled", _pausing_check)
+    with TestClient(app_env.app) as client:
+        task_id = _submit_local_report(client, app_env)
+        assert html_written.wait(10)
+        assert [name for name in _report_files(app_env) if name.endswith(".html")]
+        # 渲染在執行緒中進行，事件迴圈仍能處理取消請求
+        assert client.post(f"/api/tasks/{task_id}/cancel").status_code == 200
+        deadline = time.monotonic() + 10
+        while task_id in app_env.active_task_handles and time.monotonic() < deadline:
+            time.sleep(0.05)
+        task = client.get(f"/api/tasks/{task_id}").json()
+
+    assert task_id not in app_env.active_task_handles
+    assert task["status"] == "cancelled"
+    assert _report_files(app_env) == []
+    assert "rendered" not in app_env.load_task_checkpoints(task_id)
+
+def test_local_report_completes(app_env):
+    with TestClient(app_env.app) as client:
+        task_id = _submit_local_report(client, app_env)
+        task = _wait_for_status(client, task_id, {"completed", "failed"})
+
+    assert task["status"] == "completed"
+    assert sorted(task["download_links"]) == ["html", "md", "txt"]
+    assert len(_report_files(app_env)) == 3
+    assert app_env.load_task_checkpoints(task_id) == {}
+
+def test_same_source_reports_do_not_overwrite_each_other(app_env):
+    with TestClient(app_env.app) as client:
+        task_ids = [_submit_local_report(client, app_env) for _ in range(2)]
+        tasks = [_wait_for_status(client, task_id, {"completed", "failed"}) for task_id in task_ids]
+
+    assert [task["status"] for task in tasks] == ["completed", "completed"]
+    links = [link for task in tasks for link in task["download_links"].values()]
+    assert len(set(links)) == 6
+    assert len(_report_files(app_env)) == 6
+
+def test_cancel_then_retry_completes(app_env, monkeypatch):
+    local_backend = app_env.MODEL_BACKENDS["local"]
+    original_generate = local_backend.generate
+    calls = []
+
+    async def _hanging_first_call(request_data, analysis_audio_path, key_pool):
+        calls.append(request_data.source_path)
+        if len(calls) == 1:
+            await asyncio.sleep(60) # 模擬很慢的模型呼叫，等待被取消
+        return await original_generate(request_data, analysis_audio_path, key_pool)
+
+    monkeypatch.setattr(local_backend, "generate", _hanging_first_call)
+    with TestClient(app_env.app) as client:
+        task_id = _submit_local_report(client, app_env)
+        _wait_for_status(client, task_id, {"processing"})
+        cancelled = client.post(f"/api/tasks/{task_id}/cancel")
+        assert cancelled.status_code == 200
+        assert cancelled.json()["previous_status"] == "processing"
+        assert client.get(f"/api/tasks/{task_id}").json()["status"] == "cancelled"
+        # 已結束的任務不能再取消；槽位立即釋放
+        assert client.post(f"/api/tasks/{task_id}/cancel").status_code == 409
+        deadline = time.monotonic() + 10
+        while client.get("/api/scheduler").json()["free_slots"] != app_env.MAX_CONCURRENT_TASKS and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert client.get("/api/scheduler").json()["free_slots"] == app_env.MAX_CONCURRENT_TASKS
+
+        retried = client.post(f"/api/tasks/{task_id}/retry")
+        assert retried.status_code == 202
+        assert retried.json()["previous_status"] == "cancelled"
+        task = _wait_for_status(client, task_id, {"completed", "failed"})
+
+    assert task["status"] == "completed"
+    assert task["error_message"] is None
+    assert len(calls) == 2
+    assert len(_report_files(app_env)) == 3
+
+def test_retry_resumes_from_checkpoints(app_env, monkeypatch):
+    local_backend = app_env.MODEL_BACKENDS["local"]
+    original_generate = local_backend.generate
+    original_render_stage = app_env._render_report_stage_sync
+    generate_calls = []
+    render_calls = []
+
+    async def _counting_generate(request_data, analysis_audio_path, key_pool):
+        generate_calls.append(request_data.source_path)
+        return await original_generate(request_data, analysis_audio_path, key_pool)
+
+    def _failing_first_render(*args):
+        render_calls.append(args[0])
+        if len(render_calls) == 1:
+            raise OSError("磁碟已滿")
+        return original_render_stage(*args)
+
+    monkeypatch.setattr(local_backend, "generate", _counting_generate)
+    monkeypatch.setattr(app_env, "_render_report_stage_sync", _failing_first_render)
+    with TestClient(app_env.app) as client:
+        task_id = _submit_local_report(client, app_env)
+        failed = _wait_for_status(client, task_id, {"completed", "failed"})
+        assert failed["status"] == "failed"
+        assert "磁碟已滿" in failed["error_message"]
+        assert sorted(app_env.load_task_checkpoints(task_id)) == ["audio", "model_output", "structured"]
+
+        retried = client.post(f"/api/tasks/{task_id}/retry")
+        assert retried.status_code == 202
+        assert retried.json()["resumed_stages"] == ["audio", "model_output", "structured"]
+        task = _wait_for_status(client, task_id, {"completed", "failed"})
+
+    assert task["status"] == "completed"
+    assert len(generate_calls) == 1 # 模型輸出由檢查點提供，重試不再呼叫模型
+    assert len(render_calls) == 2
+    assert app_env.load_task_checkpoints(task_id) == {}
+    # 從檢查點完成的任務仍會建立搜尋索引
+    with TestClient(app_env.app) as client:
+        assert task_id in [result["task_id"] for result in client.get("/api/search", params={"q": "clip"}).json()["results"]]
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import subprocess
+import sys
+
+from fastapi.testclient import TestClient
+
+from conftest import SRC_DIR
+
+def test_profiling_is_off_by_default(app_env):
+    assert not app_env.REQUEST_PROFILING_ENABLED
+    assert all(middleware.kwargs.get("dispatch") is not app_env.request_profiling_middleware for middleware in app_env.app.user_middleware)
+    with TestClient(app_env.app) as client:
+        response = client.get("/api/health/live", headers={"X-Profile": "1"})
+        assert "x-profile-status" not in response.headers
+        assert client.get("/api/debug/profiles").status_code == 404
+        assert client.get("/api/debug/profiles/20260101000000_0123abcd").status_code == 404
+
+def test_profile_endpoints_require_token(app_env, monkeypatch):
+    monkeypatch.setattr(app_env, "REQUEST_PROFILING_ENABLED", True)
+    monkeypatch.setattr(app_env, "REQUEST_PROFILING_TOKEN", "s3cret")
+    with TestClient(app_env.app) as client:
+        assert client.get("/api/debug/profiles").status_code == 403
+        assert client.get("/api/debug/profiles", headers={"X-Profile-Token": "wrong"}).status_code == 403
+        assert client.get("/api/debug/profiles/20260101000000_0123abcd").status_code == 403
+        assert client.get("/api/debug/profiles", headers={"X-Profile-Token": "s3cret"}).status_code == 200
+        assert client.get("/api/debug/profiles/20260101000000_0123abcd", headers={"X-Profile-Token": "s3cret"}).status_code == 404
+
+CHILD_SCRIPT = r"""
+import json, sys
+sys.path.insert(0, sys.argv[1])
+import app as app_module
+from fastapi.testclient import TestClient
+with TestClient(app_module.app) as client:
+    denied = client.get("/api/health/live", headers={"X-Profile": "1"})
+    profiled = client.get("/api/health/live", headers={"X-Profile": "1", "X-Profile-Token": "s3cret"})
+    listing = client.get("/api/debug/profiles", headers={"X-Profile-Token": "s3cret"}).json()
+print(json.dumps({"denied": denied.headers.get("x-profile-status"), "profiled": profiled.headers.get("x-profile-status"),
+                  "profile_id": profiled.headers.get("x-profile-id"), "listed": [item["profile_id"] for item in listing["profiles"]]}))
+"""
+
+def test_enabled_profiling_stores_profiles(tmp_path):
+    # 中介層在模組載入時依設定決定是否註冊，因此在新的子行程中啟用
+    env = dict(os.environ, APP_REQUEST_PROFILING_ENABLED="true", APP_REQUEST_PROFILING_TOKEN="s3cret")
+    result = subprocess.run([sys.executable, "-c", CHILD_SCRIPT, SRC_DIR], cwd=tmp_path, env=env, capture_output=True, text=True, check=True)
+    outcome = json.loads(result.stdout.strip().splitlines()[-1])
+    assert outcome["denied"] == "forbidden"
+    assert outcome["profiled"] == "stored"
+    assert outcome["listed"] == [outcome["profile_id"]]
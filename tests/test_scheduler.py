@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+def test_cancelled_waiter_is_skipped_on_release(app_env):
+    async def scenario():
+        scheduler = app_env.ShortestJobFirstScheduler(slots=1, aging_factor=0)
+        await scheduler.acquire("running", 1)
+        cancelled_waiter = asyncio.create_task(scheduler.acquire("cancelled", 1))
+        next_waiter = asyncio.create_task(scheduler.acquire("next", 5))
+        await asyncio.sleep(0)
+        # 取消與釋放發生在同一輪事件迴圈：被取消的等待者仍在佇列中，但其 future 已完成
+        cancelled_waiter.cancel()
+        scheduler.release()
+        await asyncio.wait_for(next_waiter, timeout=1)
+        assert cancelled_waiter.cancelled()
+        assert scheduler.snapshot() == {"free_slots": 0, "waiting": []}
+        scheduler.release()
+        assert scheduler.snapshot()["free_slots"] == 1
+
+    asyncio.run(scenario())
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+import pytest
+from fastapi.testclient import TestClient
+
+@pytest.fixture
+def search_client(app_env, seed_report):
+    if app_env.search_index_state["tokenizer"] != "trigram":
+        pytest.skip("此 SQLite 不支援 trigram 分詞器")
+    seed_report("機器學習講座", "本講介紹機器學習的基礎概念", "今天我們討論梯度下降法")
+    seed_report("網頁安全講座", "<b>粗體</b> 與 <script>alert(1)</script> 的關鍵字範例", "說明跨站腳本攻擊")
+    with TestClient(app_env.app) as client:
+        yield client
+
+def test_trigram_substring_match(search_client):
+    response = search_client.get("/api/search", params={"q": "學習的基礎"})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["total"] == 1
+    assert body["results"][0]["source_name"] == "機器學習講座"
+    assert "<mark>學習的基礎</mark>" in body["results"][0]["snippet_html"]
+
+def test_short_terms_fall_back_to_like(search_client):
+    # 兩個字元的詞無法以 trigram 比對，改以 LIKE 逐列比對
+    body = search_client.get("/api/search", params={"q": "梯度"}).json()
+    assert body["total"] == 1
+    assert body["results"][0]["source_name"] == "機器學習講座"
+    assert search_client.get("/api/search", params={"q": "講座 梯度"}).json()["total"] == 1
+    assert search_client.get("/api/search", params={"q": "講座"}).json()["total"] == 2
+
+@pytest.mark.parametrize("query", ["關鍵字範例", "關鍵"])
+def test_snippets_are_html_escaped(search_client, query):
+    snippet_html = search_client.get("/api/search", params={"q": query}).json()["results"][0]["snippet_html"]
+    assert "<script>" not in snippet_html and "<b>" not in snippet_html
+    assert "&lt;/script&gt;" in snippet_html
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+
+def test_registry_builds_on_first_use(app_env):
+    registry = app_env.StaticAssetRegistry(app_env.static_dir_path)
+    assert not registry.built and not registry.assets_by_path
+    fingerprinted_url = registry.url_for("style.css")
+    assert registry.built
+    assert fingerprinted_url != "/static/style.css"
+    assert registry.get(fingerprinted_url[len("/static/"):])["cache_control"] == app_env.STATIC_IMMUTABLE_CACHE_CONTROL
+
+def test_standalone_report_has_no_font_awesome_icons(app_env):
+    preview_html = app_env.report_content_jinja_template.render(
+        report_title="測試報告", model_id="models/gemini-1.5-flash-latest", summary_data={"intro_paragraph": "總結", "items": []},
+        transcript_paragraphs={"paragraphs": [{"content": "逐字稿", "is_speaker_line": False}]}
+    )
+    assert "fa-lightbulb" in preview_html
+    page_html = app_env.render_standalone_report_page("測試報告", preview_html)
+    assert "<i class=" not in page_html
+    assert "<h3>重點摘要</h3>" in page_html
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+from fastapi.testclient import TestClient
+
+def _execute(app_env, sql, params=()):
+    conn = app_env.get_db_connection()
+    try:
+        conn.execute(sql, params)
+        conn.commit()
+    finally:
+        conn.close()
+
+def test_delta_listing_returns_changes_since_cursor(app_env, seed_report):
+    unchanged_id = seed_report("未變更的報告", "摘要", "逐字稿")
+    updated_id = seed_report("會更新的報告", "摘要", "逐字稿")
+    deleted_id = seed_report("會刪除的報告", "摘要", "逐字稿")
+    with TestClient(app_env.app) as client:
+        full_listing = client.get("/api/tasks")
+        assert full_listing.status_code == 200
+        assert {task["task_id"] for task in full_listing.json()} == {unchanged_id, updated_id, deleted_id}
+        cursor = int(full_listing.headers["X-Task-Cursor"])
+
+        empty_delta = client.get("/api/tasks", params={"since": cursor}).json()
+        assert empty_delta == {"cursor": cursor, "tasks": [], "deleted_task_ids": [], "has_more": False}
+
+        _execute(app_env, "UPDATE tasks SET status = ? WHERE task_id = ?", ("failed", updated_id))
+        _execute(app_env, "DELETE FROM tasks WHERE task_id = ?", (deleted_id,))
+        added_id = seed_report("新增的報告", "摘要", "逐字稿")
+
+        delta = client.get("/api/tasks", params={"since": cursor}).json()
+        assert [task["task_id"] for task in delta["tasks"]] == [updated_id, added_id] # 依變更順序排列
+        assert delta["tasks"][0]["status"] == "failed"
+        assert delta["deleted_task_ids"] == [deleted_id]
+        assert not delta["has_more"]
+        assert delta["cursor"] > cursor
+        assert client.get("/api/tasks", params={"since": delta["cursor"]}).json()["tasks"] == []
+
+def test_delta_listing_pages_and_revalidates_with_etag(app_env, seed_report):
+    cursor = 0
+    task_ids = [seed_report(f"報告 {index}", "摘要", "逐字稿") for index in range(3)]
+    with TestClient(app_env.app) as client:
+        first_page = client.get("/api/tasks", params={"since": cursor, "limit": 2})
+        assert [task["task_id"] for task in first_page.json()["tasks"]] == task_ids[:2]
+        assert first_page.json()["has_more"]
+        second_page = client.get("/api/tasks", params={"since": first_page.json()["cursor"], "limit": 2}).json()
+        assert [task["task_id"] for task in second_page["tasks"]] == task_ids[2:]
+        assert not second_page["has_more"]
+
+        # 版本未變更時以 ETag 重新驗證，回傳 304 且不含內容
+        revalidated = client.get("/api/tasks", params={"since": cursor, "limit": 2}, headers={"If-None-Match": first_page.headers["ETag"]})
+        assert revalidated.status_code == 304
+        seed_report("新的報告", "摘要", "逐字稿")
+        assert client.get("/api/tasks", params={"since": cursor, "limit": 2}, headers={"If-None-Match": first_page.headers["ETag"]}).status_code == 200
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+
+@pytest.fixture
+def idle_app_env(app_env, monkeypatch):
+    """停用啟動時的中斷任務恢復：測試直接寫入的 queued 任務沒有 request_data，否則會被標記為 failed。"""
+    async def _no_resume(key_pool):
+        return 0
+    monkeypatch.setattr(app_env, "resume_interrupted_tasks", _no_resume)
+    return app_env
+
+def _insert_queued_task(app_env):
+    task_id = str(uuid.uuid4())
+    conn = app_env.get_db_connection()
+    try:
+        conn.execute("INSERT INTO tasks (task_id, status, source_name, model_id, submit_time) VALUES (?, ?, ?, ?, ?)",
+                     (task_id, "queued", "clip.m4a", "models/gemini-1.5-flash-latest", datetime.now(timezone.utc).isoformat()))
+        conn.commit()
+    finally:
+        conn.close()
+    return task_id
+
+def _set_status_and_notify(app_env, task_id, status):
+    # 與工作執行緒中的 _update_task_status 相同：先寫入資料庫，再由非事件迴圈的執行緒通知等待者
+    conn = app_env.get_db_connection()
+    try:
+        conn.execute("UPDATE tasks SET status = ? WHERE task_id = ?", (status, task_id))
+        conn.commit()
+    finally:
+        conn.close()
+    app_env.notify_task_changed(task_id)
+
+def test_long_poll_wakes_on_task_change(idle_app_env):
+    with TestClient(idle_app_env.app) as client:
+        task_id = _insert_queued_task(idle_app_env)
+        waiter_started = threading.Event()
+        result = {}
+
+        def _long_poll():
+            waiter_started.set()
+            started_at = time.monotonic()
+            result["response"] = client.get(f"/api/tasks/{task_id}", params={"wait": 20, "last_status": "queued"})
+            result["elapsed"] = time.monotonic() - started_at
+
+        poller = threading.Thread(target=_long_poll)
+        poller.start()
+        assert waiter_started.wait(5)
+        time.sleep(0.3) # 讓請求進入等待狀態
+        assert poller.is_alive()
+        _set_status_and_notify(idle_app_env, task_id, "processing")
+        poller.join(10)
+
+    assert not poller.is_alive()
+    assert result["response"].status_code == 200
+    assert result["response"].json()["status"] == "processing"
+    assert result["elapsed"] < 10 # 由通知喚醒，不必等到 20 秒逾時
+
+def test_long_poll_returns_current_status_on_timeout(idle_app_env):
+    with TestClient(idle_app_env.app) as client:
+        task_id = _insert_queued_task(idle_app_env)
+        started_at = time.monotonic()
+        response = client.get(f"/api/tasks/{task_id}", params={"wait": 0.3})
+        elapsed = time.monotonic() - started_at
+        # 已經不同於 last_status 時立即回傳
+        immediate = client.get(f"/api/tasks/{task_id}", params={"wait": 20, "last_status": "processing"})
+
+    assert response.status_code == 200
+    assert response.json()["status"] == "queued"
+    assert 0.3 <= elapsed < 5
+    assert immediate.json()["status"] == "queued"